@@ -12,16 +12,38 @@ FIXES:
 
 import os
 import json
+import asyncio
+import contextlib
+import functools
+import argparse
 import base64
 import requests
-import pandas as pd
+import vlm_client
+import vlm_async
+import adaptive_concurrency
+import rate_limiter
+import image_preprocessing
+import response_cache as cache_store
+import results_store as store
+import batch_csv
+import csv_merge
+import parquet_store
+import checkpoint_journal
+import metrics
+import cost_accounting
+import json_salvage
+import retry_policy
+import circuit_breaker
+import backend_pool
+import hedging
+import vlm_stream
+import tracing
 from pathlib import Path
 from datetime import datetime, timedelta
 import getpass
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from threading import Lock
-import pickle
 import glob
 
 # === KONFIGURATION ===
@@ -36,9 +58,17 @@ OUTPUT_BASE = "output_batches"
 JSON_OUT_BASE = os.path.join(OUTPUT_BASE, "json")
 CSV_OUT_BASE = os.path.join(OUTPUT_BASE, "csv")
 FINAL_CSV = os.path.join(OUTPUT_BASE, "metadata_vlm_complete.csv")
+FINAL_PARQUET = os.path.join(OUTPUT_BASE, "metadata_vlm_complete.parquet")
 LOG_FILE = os.path.join(OUTPUT_BASE, "vlm_errors.log")
-CHECKPOINT_FILE = os.path.join(OUTPUT_BASE, "batch_checkpoint.pkl")
+CHECKPOINT_FILE = os.path.join(OUTPUT_BASE, "batch_checkpoint.jsonl")
+LEGACY_CHECKPOINT_FILE = os.path.join(OUTPUT_BASE, "batch_checkpoint.pkl")
 PROGRESS_FILE = os.path.join(OUTPUT_BASE, "batch_progress.json")
+CONCURRENCY_LOG = os.path.join(OUTPUT_BASE, "concurrency_log.csv")
+METRICS_FILE = os.path.join(OUTPUT_BASE, "metrics.prom")
+TRACE_FILE = os.path.join(OUTPUT_BASE, "trace.json")
+USAGE_LOG = os.path.join(OUTPUT_BASE, "token_usage.csv")
+CACHE_FILE = os.path.join(OUTPUT_BASE, "response_cache.sqlite")
+RESULTS_DB = os.path.join(OUTPUT_BASE, "results.sqlite")
 
 # API Konfiguration
 API_BASE_URL = "https://openrouter.ai/api/v1"
@@ -46,12 +76,113 @@ API_ENDPOINT = f"{API_BASE_URL}/chat/completions"  # ✅ FIXED: Vollständiger E
 
 # Wähle dein Modell:
 MODEL_NAME = "qwen/qwen3-vl-8b-instruct"  # ✅ Korrekt für OpenRouter
+TEMPERATURE = 0.1
+MAX_TOKENS = 1000
+# JSON-Schema aus FIELD_KEYS als response_format mitsenden (wird für den Lauf
+# abgeschaltet, falls der Endpoint es ablehnt); fast gültiges JSON wird
+# unabhängig davon repariert statt neu angefragt
+STRUCTURED_OUTPUT = True
+# Antworten als Stream (Server-Sent Events) lesen (auch per --stream): trennt die
+# Zeit bis zum ersten Token (Warteschlange/Prefill beim Anbieter) von der
+# Generierung. Mit STREAM_EARLY_CLOSE endet der Request, sobald das JSON-Objekt
+# vollständig ist; der usage-Block am Ende des Streams fehlt dann, solche
+# Requests werden mit der Token-Schätzung und unbekannten Kosten verbucht
+STREAM_RESPONSES = False
+STREAM_EARLY_CLOSE = True
+
+# Preise in USD pro 1 Mio. Tokens je Modell für die Kostenabrechnung
+# ("image" optional, sonst zählen Bild-Tokens als Prompt-Tokens).
+# Beispielwerte – aktuelle Preise beim Anbieter prüfen! Von der API gemeldete
+# Kosten (usage.cost, OpenRouter) haben Vorrang.
+MODEL_PRICES = {
+    "qwen/qwen3-vl-8b-instruct": {"prompt": 0.08, "completion": 0.50},
+}
 
 # Performance Einstellungen
-MAX_WORKERS = 5              # Anzahl paralleler API-Aufrufe
-MAX_RETRIES = 3              # Wiederholungen bei Fehlern
-RETRY_DELAY = 2              # Sekunden zwischen Wiederholungen
+MAX_WORKERS = 5              # Anzahl paralleler API-Aufrufe (Startwert bei adaptiver Steuerung)
+MAX_RETRIES = 3              # Versuche pro Karte (dauerhafte Fehler wie 400/401 nur einer)
+RETRY_DELAY = 2              # Basis-Wartezeit in Sekunden, verdoppelt pro Versuch (mit Jitter)
+RETRY_MAX_DELAY = 60         # Obergrenze der Wartezeit vor einer Wiederholung
 BATCH_SIZE = 500             # Erwartete Anzahl Karten pro Batch
+CHECKPOINT_FSYNC_EVERY = 20  # Checkpoint-Journal: fsync alle N Karten (spätestens alle 2s)
+CSV_FLUSH_EVERY = 20         # Batch-CSV: Flush alle N Karten (spätestens alle 5s)
+CONNECT_TIMEOUT = 10         # Sekunden für Verbindungsaufbau (TCP + TLS)
+READ_TIMEOUT = 120           # Sekunden Wartezeit auf die API-Antwort
+
+# Verarbeitungs-Engine: "threads" (ThreadPoolExecutor) oder "async" (asyncio + aiohttp)
+ENGINE = "threads"
+ASYNC_CONCURRENCY = 50       # Gleichzeitige Requests der async-Engine (50-200)
+
+# Mehrere Karten pro Request: Prompt nur einmal senden, Antwort als JSON-Array
+# (1 = eine Karte pro Request; fehlende Karten werden einzeln nachgefragt)
+CARDS_PER_REQUEST = 1
+
+# Bildvorverarbeitung vor dem Upload (benötigt Pillow; auch per --preprocess)
+PREPROCESS_IMAGES = False
+PREPROCESS_MAX_EDGE = 1600   # Längste Kante in Pixeln (None = Originalgröße)
+PREPROCESS_GRAYSCALE = True  # In Graustufen umwandeln
+PREPROCESS_CROP_BORDER = True  # Scanner-Rand abschneiden
+PREPROCESS_JPEG_QUALITY = 85  # JPEG-Qualität der hochgeladenen Bilder
+PREPROCESS_WORKERS = None    # Prozesse für die Vorverarbeitung (None = CPU-Kerne)
+
+# Antwort-Cache (SQLite): gleiche Karte + Prompt + Modell → kein erneuter API-Aufruf
+RESPONSE_CACHE = True
+CACHE_MAX_MB = 500           # Größenlimit, älteste Einträge werden verdrängt
+
+# Ergebnisspeicher: eine SQLite-Zeile pro Karte statt einer JSON-Datei pro Karte;
+# Batch-CSVs werden aus der Datenbank exportiert (JSON: python results_store.py export-json)
+RESULTS_STORE = False
+RESULTS_COMMIT_EVERY = 200   # Gruppen-Commit alle N Karten (spätestens jede Sekunde)
+
+# Gesamt-Metadaten zusätzlich als Parquet-Datensatz, partitioniert nach Batch (benötigt pyarrow)
+WRITE_PARQUET = True
+
+# Laufzeit-Metriken (OpenMetrics): Datei wird regelmäßig neu geschrieben,
+# optional zusätzlich ein HTTP-Endpoint auf localhost (z.B. 9464 → http://127.0.0.1:9464/metrics)
+METRICS_FILE_INTERVAL = 15   # Sekunden zwischen zwei Aktualisierungen der Datei (None = aus)
+METRICS_PORT = None
+
+# Stufen-Tracing pro Karte als Chrome-Trace-Events (TRACE_FILE, öffnen mit ui.perfetto.dev)
+TRACE = False
+
+# Scheduler: "global" = eine Warteschlange über alle Batch-Ordner,
+#            "per_batch" = Ordner nacheinander (Worker warten am Ende jedes Ordners)
+SCHEDULER = "global"
+
+# Adaptive Parallelität (AIMD): wächst bei Erfolg, halbiert bei 429/5xx/Latenzanstieg
+ADAPTIVE_CONCURRENCY = True
+CONCURRENCY_MIN = 2          # Untergrenze gleichzeitiger Requests
+CONCURRENCY_MAX = 32         # Obergrenze (Thread-Engine; async: ASYNC_CONCURRENCY)
+
+# Prozessweites Rate-Limit (None = unbegrenzt); Retry-After / X-RateLimit-* werden immer beachtet
+REQUESTS_PER_SECOND = 10     # Requests pro Sekunde über alle Worker
+TOKENS_PER_MINUTE = None     # Tokens pro Minute über alle Worker
+TOKENS_PER_REQUEST_ESTIMATE = 2500  # Schätzung pro Karte (Prompt + Bild + Antwort)
+
+# Schutzschalter pro Backend bei Ausfall (5xx, Timeouts, Verbindungsfehler):
+# ab dieser Fehlerquote der letzten Requests wird der Versand pausiert und nach
+# der Pause mit einem einzelnen Probe-Request geprüft (None = aus)
+BREAKER_FAILURE_RATE = 0.5
+BREAKER_WINDOW = 20          # Betrachtete letzte Requests
+BREAKER_OPEN_SECONDS = 30    # Erste Pause; verdoppelt sich bei gescheiterter Probe
+BREAKER_MAX_OPEN_SECONDS = 300
+
+# Mehrere VLM-Backends, auf die die Requests verteilt werden (leer = nur
+# API_ENDPOINT mit MODEL_NAME). Pro Eintrag: "name", "url", "model", optional
+# "api_key" bzw. "api_key_env" (Umgebungsvariable; sonst der beim Start
+# abgefragte Key), "max_concurrency", "weight", "requests_per_second",
+# "tokens_per_minute". Beispiel siehe config.example.py.
+# Gesamtparallelität (CONCURRENCY_MAX) ≈ Summe der max_concurrency wählen.
+BACKENDS = []
+
+# Doppel-Requests gegen hängende Antworten (auch per --hedge): läuft ein Request
+# länger als das laufende HEDGE_QUANTILE-Perzentil der Antwortzeiten, wird er ein
+# zweites Mal gesendet (bevorzugt an ein anderes Backend); die erste gültige
+# Antwort gewinnt, der andere Request wird abgebrochen
+HEDGE_REQUESTS = False
+HEDGE_QUANTILE = 95
+HEDGE_MAX_PERCENT = 5        # Höchstens so viel % zusätzliche Requests
+HEDGE_MIN_DELAY = 2.0        # Frühestens nach so vielen Sekunden doppelt senden
 
 # Felder die extrahiert werden sollen
 FIELD_KEYS = [
@@ -59,6 +190,10 @@ FIELD_KEYS = [
     "Verlag", "Material", "Textdichter", "Bearbeiter", "Bemerkungen"
 ]
 
+# JSON-Schemas der Antworten (siehe STRUCTURED_OUTPUT)
+CARD_RESPONSE_FORMAT = vlm_client.build_response_format(FIELD_KEYS)
+MULTI_CARD_RESPONSE_FORMAT = vlm_client.build_response_format(FIELD_KEYS, multi_card=True)
+
 # Erstelle Verzeichnisstruktur
 os.makedirs(JSON_OUT_BASE, exist_ok=True)
 os.makedirs(CSV_OUT_BASE, exist_ok=True)
@@ -67,6 +202,179 @@ os.makedirs(CSV_OUT_BASE, exist_ok=True)
 stats_lock = Lock()
 log_lock = Lock()
 
+# Steuerung der gleichzeitigen Requests (siehe configure_concurrency)
+concurrency = adaptive_concurrency.AIMDController(
+    initial=MAX_WORKERS,
+    min_limit=CONCURRENCY_MIN if ADAPTIVE_CONCURRENCY else MAX_WORKERS,
+    max_limit=CONCURRENCY_MAX if ADAPTIVE_CONCURRENCY else MAX_WORKERS,
+    log_file=CONCURRENCY_LOG
+)
+
+# Gemeinsamer Rate-Limiter für alle Worker
+api_rate_limiter = rate_limiter.RateLimiter(
+    requests_per_second=REQUESTS_PER_SECOND,
+    tokens_per_minute=TOKENS_PER_MINUTE,
+    default_throttle_pause=RETRY_DELAY
+)
+
+# Laufzeit-Metriken (Ausgabe siehe configure_metrics)
+run_metrics = metrics.PipelineMetrics()
+run_metrics.gauge("ocr_in_flight_requests", "Gerade laufende Requests",
+                  func=lambda: concurrency.in_flight)
+run_metrics.gauge("ocr_concurrency_limit", "Aktuelle Obergrenze gleichzeitiger Requests",
+                  func=lambda: concurrency.limit)
+run_metrics.gauge("ocr_rate_limit_paused_seconds", "Gemeinsame Pausen des Rate-Limiters (summiert)",
+                  func=lambda: round(rate_limit_stats()["paused_seconds"], 3))
+metrics_outputs = []
+
+def report_breaker(state, reason, backend=None):
+    """Meldet Zustandswechsel eines Schutzschalters (Konsole, Metriken, Trace)."""
+    label = f"Backend {backend}" if backend else "Endpoint"
+    if state == circuit_breaker.OPEN:
+        run_metrics.breaker_trips.inc()
+        print(f"\n  🔌 {label} gestört ({reason}) – Versand pausiert, keine Karte wird als Fehler gewertet")
+    elif state == circuit_breaker.HALF_OPEN:
+        print(f"  🔌 Prüfe {label} mit einem einzelnen Request...")
+    else:
+        print(f"  🔌 {label} antwortet wieder ({reason}) – Versand läuft weiter")
+    if tracer is not None:
+        tracer.instant("circuit_breaker", category="endpoint", state=state, reason=reason,
+                       backend=backend or "")
+
+def build_backend_pool(configs=BACKENDS):
+    """
+    Baut den Backend-Pool aus ``configs`` (siehe BACKENDS), jedes Backend mit
+    eigenem Schutzschalter und Rate-Limiter. Ohne Einträge: ein Backend aus
+    API_ENDPOINT / MODEL_NAME mit dem gemeinsamen Rate-Limiter.
+    """
+    single = not configs
+    if single:
+        configs = [{"name": "default", "url": API_ENDPOINT, "model": MODEL_NAME}]
+    backends = []
+    for config in configs:
+        name = config.get("name") or config["url"]
+        if single:
+            limiter = api_rate_limiter
+        else:
+            limiter = rate_limiter.RateLimiter(
+                requests_per_second=config.get("requests_per_second"),
+                tokens_per_minute=config.get("tokens_per_minute"),
+                default_throttle_pause=RETRY_DELAY,
+                name=name
+            )
+        breaker = circuit_breaker.CircuitBreaker(
+            failure_rate=BREAKER_FAILURE_RATE or 1.01,
+            window=BREAKER_WINDOW,
+            open_seconds=BREAKER_OPEN_SECONDS,
+            max_open_seconds=BREAKER_MAX_OPEN_SECONDS,
+            on_change=functools.partial(report_breaker, backend=None if single else name)
+        )
+        api_key = config.get("api_key")
+        if not api_key and config.get("api_key_env"):
+            api_key = os.environ.get(config["api_key_env"])
+        backends.append(backend_pool.Backend(
+            name, config["url"], config.get("model") or MODEL_NAME, api_key=api_key,
+            max_concurrency=config.get("max_concurrency"), weight=config.get("weight", 1.0),
+            breaker=breaker, limiter=limiter
+        ))
+    return backend_pool.BackendPool(backends)
+
+# VLM-Backends mit Schutzschalter gegen Ausfälle (gemeinsam für alle Worker)
+vlm_backends = build_backend_pool(BACKENDS)
+run_metrics.breaker_trips = run_metrics.counter(
+    "ocr_circuit_breaker_trips", "Wie oft ein Schutzschalter den Versand pausiert hat")
+run_metrics.gauge("ocr_circuit_breaker_open", "Backends, deren Versand wegen einer Störung pausiert ist",
+                  func=lambda: sum(backend.breaker.is_open for backend in vlm_backends))
+run_metrics.backend_requests = run_metrics.counter(
+    "ocr_backend_requests", "Requests pro Backend nach Ergebnis (ok, throttled, failed)",
+    ["backend", "outcome"])
+
+def endpoint_label():
+    """API_ENDPOINT bzw. die Backends des Pools für die Konsolenausgabe."""
+    if len(vlm_backends) == 1:
+        return vlm_backends.backends[0].url
+    return ", ".join(f"{backend.name} ({backend.model})" for backend in vlm_backends)
+
+def rate_limit_stats():
+    """Summierte Zähler der Rate-Limiter aller Backends."""
+    totals = {"throttle_events": 0, "paused_seconds": 0.0, "waited_seconds": 0.0}
+    for limiter in {id(backend.limiter): backend.limiter for backend in vlm_backends}.values():
+        for key, value in limiter.stats().items():
+            totals[key] += value
+    return totals
+
+# Chrome-Trace der Kartenstufen (siehe configure_tracing)
+tracer = None
+
+# Doppel-Requests (siehe configure_hedging); Thread-Engine: Requests laufen im Executor
+hedge_policy = None
+hedge_executor = None
+run_metrics.hedged_requests = run_metrics.counter(
+    "ocr_hedged_requests", "Doppel-Requests nach Ausgang (won = zweiter schneller, lost)",
+    ["outcome"])
+run_metrics.gauge("ocr_hedge_threshold_seconds", "Laufzeit, ab der ein Request doppelt gesendet wird",
+                  func=lambda: (hedge_policy.threshold() or 0) if hedge_policy is not None else 0)
+
+# Karten pro Request (siehe configure_cards_per_request)
+cards_per_request = CARDS_PER_REQUEST
+
+# response_format mit JSON-Schema senden (siehe configure_structured_output)
+structured_output = STRUCTURED_OUTPUT
+
+# Antworten als Stream lesen (siehe configure_streaming)
+stream_responses = STREAM_RESPONSES
+stream_stats = vlm_stream.StreamStats()
+run_metrics.first_token_seconds = run_metrics.histogram(
+    "ocr_time_to_first_token_seconds", "Zeit vom Versand bis zum ersten Token (Streaming)",
+    ["backend"])
+run_metrics.generation_seconds = run_metrics.histogram(
+    "ocr_generation_duration_seconds", "Dauer vom ersten Token bis zum Ende des Streams",
+    ["backend"])
+run_metrics.stream_early_closes = run_metrics.counter(
+    "ocr_stream_early_closes", "Streams, die nach vollständigem JSON vorzeitig geschlossen wurden")
+run_metrics.unreported_usage = run_metrics.counter(
+    "ocr_unreported_usage", "Antworten ohne usage-Block (Tokens nur geschätzt, Kosten unbekannt)")
+
+# Token-Verbrauch und Kosten des Laufs (siehe configure_usage_accounting);
+# bepreist wird jede Antwort mit dem Modell ihres Backends (record_response_usage)
+run_usage = cost_accounting.UsageTotals()
+run_open_cards = 0
+usage_log = None
+
+# Prozess-Pool für die Bildvorverarbeitung (siehe configure_preprocessing)
+image_preprocessor = None
+
+# Checkpoint-Journal: ein Eintrag pro fertiger Karte (alter .pkl wird übernommen)
+checkpoint = checkpoint_journal.CheckpointJournal(
+    CHECKPOINT_FILE,
+    fsync_every=CHECKPOINT_FSYNC_EVERY,
+    legacy_pickle=LEGACY_CHECKPOINT_FILE
+)
+
+# Antwort-Cache (siehe configure_cache)
+response_cache = None
+
+# SQLite-Ergebnisspeicher (siehe configure_results_store)
+results_store = None
+
+# Bereits angelegte JSON-Unterordner (mkdir nur einmal pro Batch)
+json_dirs = set()
+
+# Schlüssel, unter dem call_vlm_api den Roh-Antworttext an die Daten hängt
+RAW_RESPONSE_KEY = "_raw_response"
+
+# Schlüssel für das Modell des Backends, das die Karte beantwortet hat
+MODEL_KEY = "_model"
+
+# Gemeinsamer HTTP-Client (Keep-Alive, Pool so groß wie die maximale Parallelität)
+api_client = vlm_client.VLMClient(
+    API_ENDPOINT,
+    pool_size=concurrency.max_limit,
+    hosts=len(vlm_backends),
+    connect_timeout=CONNECT_TIMEOUT,
+    read_timeout=READ_TIMEOUT
+)
+
 # === PROMPT FÜR STRUKTURIERTE EXTRAKTION ===
 EXTRACTION_PROMPT = """Du bist ein Experte für die Digitalisierung historischer Archivkarteikarten. 
 
@@ -113,118 +421,789 @@ Antworte NUR mit einem validen JSON-Objekt (KEINE Markdown-Codeblöcke, KEINE Er
 }
 """
 
+# Gleiche Regeln, Ausgabe als Array mit einem Objekt pro Karte (siehe CARDS_PER_REQUEST)
+MULTI_CARD_PROMPT = EXTRACTION_PROMPT.split("**AUSGABEFORMAT:**")[0] + """**MEHRERE KARTEN:**
+Du erhältst mehrere Karteikarten. Vor jedem Bild steht sein Dateiname ("Datei: ...").
+Bearbeite jede Karte einzeln und unabhängig von den anderen.
+
+**AUSGABEFORMAT:**
+Antworte NUR mit einem validen JSON-Array (KEINE Markdown-Codeblöcke, KEINE Erklärungen),
+mit genau einem Objekt pro Karte, in derselben Reihenfolge wie die Bilder:
+
+[
+  {
+    "Datei": "<Dateiname exakt wie angegeben>",
+    "Komponist": "...",
+    "Signatur": "...",
+    "Titel": "...",
+    "Textanfang": "...",
+    "Verlag": "...",
+    "Material": "...",
+    "Textdichter": "...",
+    "Bearbeiter": "...",
+    "Bemerkungen": "..."
+  }
+]
+"""
+
 # === HILFSFUNKTIONEN ===
 
 def encode_image_to_base64(image_path):
     """Kodiert ein Bild als Base64-String."""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+    with trace("read_file"):
+        with open(image_path, "rb") as image_file:
+            raw = image_file.read()
+    with trace("base64", bytes=len(raw)):
+        return base64.b64encode(raw).decode('utf-8')
+
+def trace(name, **args):
+    """Span einer Kartenstufe im Trace (ohne aktiven Tracer ein leerer Kontext)."""
+    return tracing.span(tracer, name, **args)
+
+def trace_in_flight():
+    """Anzahl laufender Requests als Zähler-Track im Trace."""
+    if tracer is not None:
+        tracer.counter("requests_in_flight", requests=concurrency.in_flight)
+
+def configure_preprocessing(enabled=PREPROCESS_IMAGES):
+    """Aktiviert die Bildvorverarbeitung im Prozess-Pool (falls Pillow installiert ist)."""
+    global image_preprocessor
+    close_preprocessing()
+    
+    if not enabled:
+        return False
+    
+    try:
+        image_preprocessor = image_preprocessing.ImagePreprocessor(
+            workers=PREPROCESS_WORKERS,
+            max_edge=PREPROCESS_MAX_EDGE,
+            grayscale=PREPROCESS_GRAYSCALE,
+            crop_border=PREPROCESS_CROP_BORDER,
+            jpeg_quality=PREPROCESS_JPEG_QUALITY
+        )
+    except RuntimeError as e:
+        print(f"⚠️  {e} – Bilder werden unverändert gesendet")
+        image_preprocessor = None
+        return False
+    return True
+
+def close_preprocessing():
+    """Beendet die Worker-Prozesse der Bildvorverarbeitung."""
+    global image_preprocessor
+    if image_preprocessor is not None:
+        image_preprocessor.shutdown()
+        image_preprocessor = None
+
+def configure_cache(enabled=RESPONSE_CACHE):
+    """Öffnet den persistenten Antwort-Cache."""
+    global response_cache
+    response_cache = cache_store.ResponseCache(CACHE_FILE, CACHE_MAX_MB) if enabled else None
+    return response_cache is not None
+
+def configure_results_store(enabled=RESULTS_STORE):
+    """Startet den SQLite-Ergebnisspeicher mit seinem Writer-Thread."""
+    global results_store
+    close_results_store()
+    if enabled:
+        results_store = store.ResultsStore(RESULTS_DB, FIELD_KEYS,
+                                           group_size=RESULTS_COMMIT_EVERY)
+    return results_store is not None
+
+def close_results_store():
+    """Schreibt ausstehende Ergebnisse und beendet den Writer-Thread."""
+    global results_store
+    if results_store is not None:
+        results_store.close()
+        results_store = None
+
+def configure_metrics(port=METRICS_PORT, file_interval=METRICS_FILE_INTERVAL):
+    """Startet Metrik-Datei und/oder -Endpoint; liefert die Beschreibung für die Ausgabe."""
+    close_metrics()
+    targets = []
+    if file_interval:
+        metrics_outputs.append(metrics.MetricsFileWriter(run_metrics, METRICS_FILE, file_interval))
+        targets.append(METRICS_FILE)
+    if port:
+        try:
+            server = metrics.MetricsServer(run_metrics, port)
+        except OSError as e:
+            print(f"⚠️  Metrik-Endpoint auf Port {port} nicht verfügbar: {e}")
+        else:
+            metrics_outputs.append(server)
+            targets.append(server.url)
+    return targets
+
+def configure_tracing(enabled=TRACE):
+    """Startet bzw. beendet das Stufen-Tracing (TRACE_FILE)."""
+    global tracer
+    close_tracing()
+    if enabled:
+        tracer = tracing.Tracer(TRACE_FILE)
+    return tracer is not None
 
-def call_vlm_api(image_path, api_key, max_retries=MAX_RETRIES):
+def close_tracing():
+    """Schließt das JSON-Array der Trace-Datei."""
+    global tracer
+    if tracer is not None:
+        tracer.close()
+        tracer = None
+
+def configure_hedging(enabled=HEDGE_REQUESTS):
+    """Aktiviert Doppel-Requests; Executor so groß, dass jeder Slot zwei Requests plus Nachläufer hat."""
+    global hedge_policy, hedge_executor
+    close_hedging()
+    if enabled:
+        hedge_policy = hedging.HedgePolicy(quantile=HEDGE_QUANTILE,
+                                           max_ratio=HEDGE_MAX_PERCENT / 100,
+                                           min_delay=HEDGE_MIN_DELAY)
+        hedge_executor = ThreadPoolExecutor(max_workers=concurrency.max_limit * 3,
+                                            thread_name_prefix="hedge")
+    return hedge_policy is not None
+
+def close_hedging():
+    """Beendet den Executor, ohne auf verworfene Requests zu warten."""
+    global hedge_policy, hedge_executor
+    if hedge_executor is not None:
+        hedge_executor.shutdown(wait=False)
+    hedge_policy = hedge_executor = None
+
+def close_metrics():
+    """Schreibt den Endstand der Metrik-Datei und beendet den Endpoint."""
+    while metrics_outputs:
+        metrics_outputs.pop().close()
+
+def request_outcome(error):
+    """Metrik-Label für fehlgeschlagene Requests bzw. Wiederholungsgrund."""
+    if isinstance(error, vlm_client.APIError):
+        return str(error.status_code)
+    if isinstance(error, json.JSONDecodeError):
+        return "parse"
+    if isinstance(error, (requests.exceptions.Timeout, asyncio.TimeoutError)):
+        return "timeout"
+    if isinstance(error, requests.exceptions.RequestException):
+        return "connection"
+    if vlm_async.aiohttp is not None and isinstance(error, vlm_async.aiohttp.ClientError):
+        return "connection"
+    return "error"
+
+def record_failed_attempt(error, retrying):
+    """Zählt JSON-Fehler, Fehlerklassen und Wiederholungen (nach Grund) in Metriken und Trace."""
+    error_class = retry_policy.classify_error(error)
+    if isinstance(error, json.JSONDecodeError):
+        run_metrics.parse_failures.inc()
+    run_metrics.failed_attempts.inc(error_class=error_class)
+    if retrying:
+        run_metrics.retries.inc(reason=request_outcome(error))
+    if tracer is not None:
+        tracer.instant("attempt_failed", reason=request_outcome(error), error_class=error_class,
+                       retrying=retrying)
+
+def next_attempt_delay(error, attempt, max_retries):
     """
-    Ruft das VLM API auf und gibt die strukturierten Daten zurück.
-    Mit automatischer Wiederholung bei Fehlern.
+    Entscheidet nach der Fehlerklasse, wie es nach dem gescheiterten Versuch
+    ``attempt`` (ab 0) weitergeht: 0 = sofort erneut (429, die Pause regelt
+    der gemeinsame Rate-Limiter), Sekunden > 0 = später über die
+    Wiederholungs-Warteschlange, None = aufgeben.
+    """
+    error_class = retry_policy.classify_error(error)
+    retrying = error_class != retry_policy.PERMANENT and attempt < max_retries - 1
+    record_failed_attempt(error, retrying)
+    if not retrying:
+        if error_class == retry_policy.PERMANENT:
+            print(f"     ⛔ Dauerhafter Fehler, keine Wiederholung: {error}")
+        return None
+    if error_class == retry_policy.THROTTLED:
+        print(f"     ⚠️  Versuch {attempt + 1} gedrosselt (429), Wiederholung nach gemeinsamer Pause...")
+        return 0.0
+    delay = retry_policy.backoff_delay(attempt, RETRY_DELAY, RETRY_MAX_DELAY)
+    print(f"     ⚠️  Versuch {attempt + 1} fehlgeschlagen, Wiederholung in {delay:.1f}s (Warteschlange)...")
+    return delay
+
+def configure_structured_output(enabled=STRUCTURED_OUTPUT):
+    """Schaltet das JSON-Schema (response_format) für alle Requests ein oder aus."""
+    global structured_output
+    structured_output = enabled
+    return structured_output
+
+def configure_streaming(enabled=STREAM_RESPONSES):
+    """Schaltet gestreamte Antworten (SSE) ein oder aus und setzt die Zeitmessung zurück."""
+    global stream_responses, stream_stats
+    stream_responses = enabled
+    stream_stats = vlm_stream.StreamStats()
+    return stream_responses
+
+def record_stream_timing(timing, backend):
+    """Verbucht Zeit bis zum ersten Token und Generierungsdauer einer gestreamten Antwort."""
+    if timing is None or timing["first_token"] is None:
+        return
+    stream_stats.observe(timing)
+    run_metrics.first_token_seconds.observe(timing["first_token"], backend=backend.name)
+    run_metrics.generation_seconds.observe(timing["generation"], backend=backend.name)
+    if timing["early_closed"]:
+        run_metrics.stream_early_closes.inc()
+
+def response_format(multi_card=False):
+    """response_format für den nächsten Request (None = ohne Schema)."""
+    if not structured_output:
+        return None
+    return MULTI_CARD_RESPONSE_FORMAT if multi_card else CARD_RESPONSE_FORMAT
+
+def disable_rejected_schema(error):
+    """
+    Schaltet das Schema für den Rest des Laufs ab, wenn der Endpoint
+    response_format ablehnt; True = Request ohne Schema wiederholen.
+    """
+    global structured_output
+    if not vlm_client.rejects_response_format(error):
+        return False
+    with stats_lock:
+        if structured_output:
+            structured_output = False
+            print(f"     ⚠️  Endpoint unterstützt kein response_format (JSON-Schema) – weiter ohne: {error}")
+    return True
+
+def record_repairs(repairs):
+    """Zählt reparierte Antworten (= eingesparte Wiederholungen) nach Art der Reparatur."""
+    if not repairs:
+        return
+    for kind in repairs:
+        run_metrics.json_repairs.inc(kind=kind)
+    run_metrics.salvaged_responses.inc()
+    if tracer is not None:
+        tracer.instant("json_salvaged", repairs=",".join(repairs))
+
+def format_repair_stats():
+    """Zeile für die Statistik: reparierte Antworten und Reparaturen nach Art."""
+    salvaged = run_metrics.salvaged_responses.value()
+    if not salvaged:
+        return None
+    kinds = ", ".join(f"{kind} {run_metrics.json_repairs.value(kind=kind):.0f}"
+                      for kind in json_salvage.REPAIR_KINDS
+                      if run_metrics.json_repairs.value(kind=kind))
+    return f"{salvaged:.0f} Antworten ohne Wiederholung gelesen ({kinds})"
+
+def is_outage(error):
+    """True für Fehler, die auf eine Störung des Endpoints deuten (5xx, Timeout, Verbindung)."""
+    if isinstance(error, vlm_client.APIError):
+        return error.status_code >= 500
+    return request_outcome(error) in ("timeout", "connection")
+
+def reroute(error, route):
+    """
+    True, wenn der Request ohne verbrauchten Versuch erneut gesendet wird:
     
-    ✅ FIXED: Besseres Error-Handling für API-Responses
+    - Störung (5xx, Timeout, Verbindung) eines Backends mit offenem
+      Schutzschalter: über ein anderes Backend bzw. sobald es wieder antwortet
+    - sonstige Störung oder Drosselung (429): über ein anderes, in diesem
+      Aufruf noch nicht gewähltes Backend (``route``), falls eines frei ist
     """
-    for attempt in range(max_retries):
-        try:
-            base64_image = encode_image_to_base64(image_path)
+    outage = is_outage(error)
+    if not (outage and route and route[-1].breaker.is_open):
+        if not (outage or is_throttled(error)) or not vlm_backends.has_available(exclude=route):
+            return False
+    record_failed_attempt(error, True)
+    return True
+
+def format_retry_stats():
+    """Zeile für die Statistik: verzögerte Wiederholungen und dauerhafte Fehler."""
+    deferred = run_metrics.deferred_retries.value()
+    permanent = run_metrics.failed_attempts.value(error_class=retry_policy.PERMANENT)
+    if not deferred and not permanent:
+        return None
+    return (f"{deferred:.0f} verzögert über die Warteschlange, "
+            f"{permanent:.0f} dauerhafte Fehler ohne Wiederholung")
+
+def cache_key(base64_image, model, prompt=EXTRACTION_PROMPT):
+    """
+    Cache-Schlüssel einer Karte für das Modell, das sie beantwortet, und den
+    Prompt, mit dem sie angefragt wurde (Mehrkarten-Requests: MULTI_CARD_PROMPT).
+    """
+    return response_cache.make_key(base64_image, prompt, model, TEMPERATURE)
+
+def lookup_cache(base64_image, prompt=EXTRACTION_PROMPT):
+    """
+    Sucht die Antwort auf ``prompt`` unter den Modellen aller Backends im Cache.
+    Liefert die Daten (mit dem Modell unter MODEL_KEY) oder None.
+    """
+    if response_cache is None:
+        return None
+    with trace("cache_lookup"):
+        keys = {cache_key(base64_image, model, prompt): model
+                for model in [MODEL_NAME] + [backend.model for backend in vlm_backends]}
+        key, data = response_cache.get_any(keys)
+    if data is not None:
+        data[MODEL_KEY] = keys[key]
+    return data
+
+def cache_response(base64_image, data, prompt=EXTRACTION_PROMPT):
+    """Legt die Daten einer Karte unter dem Modell und Prompt ab, die sie geliefert haben."""
+    if response_cache is None:
+        return
+    with trace("cache_put"):
+        response_cache.put(cache_key(base64_image, data.get(MODEL_KEY, MODEL_NAME), prompt),
+                           {key: value for key, value in data.items()
+                            if key not in (RAW_RESPONSE_KEY, MODEL_KEY)})
+
+def prepare_image(image_path):
+    """
+    Kodiert ein Kartenbild für den Upload, mit Vorverarbeitung falls aktiviert.
+    Liefert (base64_jpeg, stats) mit Bytes/Vision-Tokens vorher und nachher.
+    """
+    if image_preprocessor is not None:
+        with trace("preprocess"):
+            return image_preprocessor.encode(image_path)
+    
+    base64_image = encode_image_to_base64(image_path)
+    size = os.path.getsize(image_path)
+    return base64_image, {
+        "original_bytes": size,
+        "processed_bytes": size,
+        "original_tokens": None,
+        "processed_tokens": None
+    }
+
+def is_throttled(error):
+    """True für 429-Antworten (Wartezeit regelt der gemeinsame Rate-Limiter)."""
+    return isinstance(error, vlm_client.APIError) and error.status_code == 429
+
+def backend_payload(payload, backend):
+    """Payload mit dem Modellnamen des Backends (flache Kopie nur bei Abweichung)."""
+    if payload.get("model") == backend.model:
+        return payload
+    return dict(payload, model=backend.model)
+
+def post_with_concurrency(payload, api_key, token_estimate=TOKENS_PER_REQUEST_ESTIMATE, route=None):
+    """
+    Sendet den Request an das beste freie Backend (siehe backend_pool),
+    innerhalb eines Slots der adaptiven Parallelität und nachdem dessen
+    Rate-Limiter ihn freigegeben hat. Solange alle Backends gestört sind
+    (Schutzschalter offen), wartet der Request vorher. ``route`` sammelt
+    die gewählten Backends (Failover, Token-Abrechnung).
+    """
+    with trace("backend_wait"):
+        backend, probe = vlm_backends.acquire(exclude=route or ())
+    if route is not None:
+        route.append(backend)
+    latency = healthy = None
+    throttled = False
+    try:
+        with trace("rate_limit_wait"):
+            backend.limiter.acquire(token_estimate)
+        with contextlib.ExitStack() as stack:
+            stack.callback(trace_in_flight)  # läuft nach der Freigabe des Slots
+            with trace("slot_wait"):
+                stack.enter_context(concurrency.slot())
+            trace_in_flight()
+            request_start = time.time()
+            try:
+                with trace("http_request", backend=backend.name, stream=stream_responses):
+                    if stream_responses:
+                        response = api_client.post_stream(backend_payload(payload, backend),
+                                                          backend.api_key or api_key, backend.url,
+                                                          STREAM_EARLY_CLOSE)
+                    else:
+                        response = api_client.post(backend_payload(payload, backend),
+                                                   backend.api_key or api_key, backend.url)
+            except requests.exceptions.RequestException as e:
+                latency, healthy = time.time() - request_start, False
+                concurrency.record(latency, adaptive_concurrency.TIMEOUT)
+                run_metrics.requests.inc(status=request_outcome(e))
+                raise
+            latency = time.time() - request_start
+            healthy = response.status_code < 500
+            throttled = response.status_code == 429
+            if hedge_policy is not None and response.status_code == 200:
+                hedge_policy.observe(latency)
+            concurrency.record(latency, adaptive_concurrency.classify_status(response.status_code))
+            run_metrics.requests.inc(status=response.status_code)
+            run_metrics.request_seconds.observe(latency)
+            record_stream_timing(getattr(response, "timing", None), backend)
+            backend.limiter.update_from_headers(response.status_code, response.headers)
+            return response
+    finally:
+        record_backend_result(backend, latency, healthy, throttled, probe)
+
+async def post_with_concurrency_async(client, payload, api_key,
+                                      token_estimate=TOKENS_PER_REQUEST_ESTIMATE, route=None):
+    """Async-Variante von post_with_concurrency."""
+    with trace("backend_wait"):
+        backend, probe = await vlm_backends.acquire_async(exclude=route or ())
+    if route is not None:
+        route.append(backend)
+    latency = healthy = None
+    throttled = False
+    try:
+        with trace("rate_limit_wait"):
+            await backend.limiter.acquire_async(token_estimate)
+        async with contextlib.AsyncExitStack() as stack:
+            stack.callback(trace_in_flight)  # läuft nach der Freigabe des Slots
+            with trace("slot_wait"):
+                await stack.enter_async_context(concurrency.async_slot())
+            trace_in_flight()
+            request_start = time.time()
+            try:
+                with trace("http_request", backend=backend.name, stream=stream_responses):
+                    if stream_responses:
+                        status_code, body, headers, timing = await client.post_stream(
+                            backend_payload(payload, backend), backend.api_key or api_key,
+                            backend.url, STREAM_EARLY_CLOSE)
+                    else:
+                        status_code, body, headers = await client.post(
+                            backend_payload(payload, backend), backend.api_key or api_key,
+                            backend.url)
+                        timing = None
+            except (vlm_async.aiohttp.ClientError, asyncio.TimeoutError) as e:
+                latency, healthy = time.time() - request_start, False
+                concurrency.record(latency, adaptive_concurrency.TIMEOUT)
+                run_metrics.requests.inc(status=request_outcome(e))
+                raise
+            latency = time.time() - request_start
+            healthy = status_code < 500
+            throttled = status_code == 429
+            if hedge_policy is not None and status_code == 200:
+                hedge_policy.observe(latency)
+            concurrency.record(latency, adaptive_concurrency.classify_status(status_code))
+            run_metrics.requests.inc(status=status_code)
+            run_metrics.request_seconds.observe(latency)
+            record_stream_timing(timing, backend)
+            backend.limiter.update_from_headers(status_code, headers)
+            return status_code, body
+    finally:
+        record_backend_result(backend, latency, healthy, throttled, probe)
+
+def merge_hedge_routes(route, base, legs, winner):
+    """Übernimmt die Backends beider Requests in ``route``, das des Gewinners zuletzt."""
+    for index, leg in enumerate(legs):
+        if index != winner:
+            route.extend(leg[base:])
+    route.extend(legs[winner][base:])
+
+def record_hedge(hedge_won, cancelled=False):
+    hedge_policy.record_outcome(hedge_won, cancelled)
+    run_metrics.hedged_requests.inc(outcome="won" if hedge_won else "lost")
+    if tracer is not None:
+        tracer.instant("hedge", won=hedge_won)
+
+def post_hedged(payload, api_key, token_estimate=TOKENS_PER_REQUEST_ESTIMATE, route=None):
+    """
+    post_with_concurrency mit Doppel-Request (siehe hedging): läuft der
+    Request länger als die Schwelle und erlaubt es das Budget, geht ein
+    zweiter raus (bevorzugt an ein anderes Backend); die erste Antwort mit
+    HTTP 200 gewinnt, sonst zählt das Ergebnis des ersten Requests.
+    
+    Ein blockierender requests-Aufruf lässt sich nicht abbrechen: der
+    Verlierer läuft im Executor zu Ende und seine Antwort wird verworfen;
+    kommt sie noch, wird die eingesparte Zeit gemessen.
+    """
+    delay = hedge_policy.delay() if hedge_policy is not None else None
+    if delay is None:
+        return post_with_concurrency(payload, api_key, token_estimate, route)
+    
+    route = route if route is not None else []
+    base = len(route)
+    legs = [list(route)]
+    futures = [hedge_executor.submit(post_with_concurrency, payload, api_key, token_estimate, legs[0])]
+    with trace("hedge_wait"):
+        done, _ = wait(futures, timeout=delay)
+        if not done and hedge_policy.try_hedge():
+            legs.append(list(legs[0]))  # bereits gewähltes Backend nur als Notlösung
+            futures.append(hedge_executor.submit(post_with_concurrency, payload, api_key,
+                                                 token_estimate, legs[1]))
+        
+        winner = None
+        pending = set(futures)
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if winner is None and future.exception() is None and future.result().status_code == 200:
+                    winner = future
+    if winner is None:
+        winner = futures[0]
+    
+    if len(futures) > 1:
+        hedge_won = winner is futures[1]
+        record_hedge(hedge_won)
+        if hedge_won and pending:
+            won_at = time.time()
             
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}"
-            }
+            def measure_saved(future):
+                if future.exception() is None and future.result().status_code == 200:
+                    hedge_policy.record_saved(time.time() - won_at)
             
-            payload = {
-                "model": MODEL_NAME,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": EXTRACTION_PROMPT
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                "temperature": 0.1,
-                "max_tokens": 1000
-            }
+            futures[0].add_done_callback(measure_saved)
+    merge_hedge_routes(route, base, legs, futures.index(winner))
+    return winner.result()
+
+async def post_hedged_async(client, payload, api_key, token_estimate=TOKENS_PER_REQUEST_ESTIMATE,
+                            route=None):
+    """Async-Variante von post_hedged; der Verlierer wird abgebrochen (Verbindung geschlossen)."""
+    delay = hedge_policy.delay() if hedge_policy is not None else None
+    if delay is None:
+        return await post_with_concurrency_async(client, payload, api_key, token_estimate, route)
+    
+    route = route if route is not None else []
+    base = len(route)
+    legs = [list(route)]
+    tasks = [asyncio.ensure_future(
+        post_with_concurrency_async(client, payload, api_key, token_estimate, legs[0]))]
+    try:
+        with trace("hedge_wait"):
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and hedge_policy.try_hedge():
+                legs.append(list(legs[0]))  # bereits gewähltes Backend nur als Notlösung
+                tasks.append(asyncio.ensure_future(
+                    post_with_concurrency_async(client, payload, api_key, token_estimate, legs[1])))
             
-            # ✅ FIXED: Richtiger Endpoint
-            response = requests.post(API_ENDPOINT, headers=headers, json=payload, timeout=120)
+            winner = None
+            pending = set(tasks)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()  # auch beim Verlierer abholen
+                    if winner is None and error is None and task.result()[0] == 200:
+                        winner = task
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+    if winner is None:
+        winner = tasks[0]
+    
+    if len(tasks) > 1:
+        record_hedge(winner is tasks[1], cancelled=bool(pending))
+    merge_hedge_routes(route, base, legs, tasks.index(winner))
+    return winner.result()
+
+def record_backend_result(backend, latency, healthy, throttled, probe):
+    """Gibt das Backend frei und verbucht das Ergebnis (Routing, Schutzschalter, Metriken)."""
+    vlm_backends.release(backend, latency, healthy, throttled, probe)
+    if healthy is not None:
+        outcome = "failed" if not healthy else "throttled" if throttled else "ok"
+        run_metrics.backend_requests.inc(backend=backend.name, outcome=outcome)
+
+def record_response_usage(result, usage, token_estimate=TOKENS_PER_REQUEST_ESTIMATE, backend=None):
+    """
+    Verbucht den usage-Block einer Antwort (Rate-Limiter, Metriken, Verbrauch
+    der Karte); bepreist mit dem Modell des Backends, das geantwortet hat.
+    """
+    limiter = backend.limiter if backend is not None else api_rate_limiter
+    reported = result.get("usage")
+    if reported is None:
+        # Ohne usage-Block (z.B. vorzeitig geschlossener Stream) bleibt die
+        # Schätzung im Token-Bucket stehen und wird als Verbrauch gezählt
+        run_metrics.unreported_usage.inc()
+    limiter.record_tokens(token_estimate, reported)
+    run_metrics.record_usage(reported)
+    if usage is not None:
+        model = backend.model if backend is not None else MODEL_NAME
+        cost_accounting.add_usage(usage, reported, MODEL_PRICES.get(model), token_estimate)
+
+def call_vlm_api(image_path, api_key, max_retries=MAX_RETRIES, base64_image=None, usage=None,
+                 attempt=0):
+    """
+    Ruft das VLM API auf und gibt die strukturierten Daten zurück.
+    
+    ``base64_image`` kann bereits (vor)verarbeitet übergeben werden;
+    sonst wird die Datei einmalig unverändert kodiert. In ``usage``
+    (siehe cost_accounting.new_usage) werden die Tokens aller Versuche summiert.
+    
+    Drosselungen (429) werden nach der gemeinsamen Pause direkt wiederholt,
+    dauerhafte Fehler (400, 401, ...) gar nicht. Bei vorübergehenden Fehlern
+    wartet der Worker nicht selbst: der Aufrufer stellt die Karte in die
+    Wiederholungs-Warteschlange. ``attempt`` = Zahl der bisherigen Versuche.
+    
+    Liefert (Daten, Fehler, Wiederholung) mit Wiederholung =
+    (nächster Versuch, Wartezeit in Sekunden) oder None.
+    """
+    cache_checked = False
+    route = []  # gewählte Backends (Failover)
+    
+    while True:
+        try:
+            if base64_image is None:
+                base64_image = encode_image_to_base64(image_path)
+            if not cache_checked:
+                # Cache vor jedem Netzwerkzugriff prüfen
+                cache_checked = True
+                cached = lookup_cache(base64_image)
+                if cached is not None:
+                    return cached, None, None
+            payload = vlm_client.build_chat_payload(MODEL_NAME, EXTRACTION_PROMPT, base64_image,
+                                                    TEMPERATURE, MAX_TOKENS, response_format())
+            run_metrics.upload_bytes.inc(len(base64_image))
+            
+            # Keep-Alive: Verbindung wird über alle Karten wiederverwendet
+            response = post_hedged(payload, api_key, route=route)
             
             # ✅ FIXED: Besseres Error-Handling
-            if response.status_code != 200:
-                error_body = response.text
-                try:
-                    error_json = response.json()
-                    error_msg = error_json.get("error", {}).get("message", error_body)
-                except:
-                    error_msg = error_body
-                
-                if response.status_code == 401:
-                    raise Exception(f"API-Authentifizierung fehlgeschlagen: {error_msg}")
-                elif response.status_code == 429:
-                    raise Exception(f"Rate limit erreicht: {error_msg}")
-                elif response.status_code == 400:
-                    raise Exception(f"Falscher Request: {error_msg}")
-                else:
-                    raise Exception(f"API-Fehler ({response.status_code}): {error_msg}")
+            vlm_client.raise_for_api_error(response.status_code, response.text)
             
-            result = response.json()
+            with trace("decode_response"):
+                result = response.json()
+            record_response_usage(result, usage, backend=route[-1])
             
-            if "choices" in result and len(result["choices"]) > 0:
-                content = result["choices"][0]["message"]["content"]
-                
-                # Parse JSON aus der Antwort (bereinige Markdown)
-                content = content.strip()
-                if content.startswith("```json"):
-                    content = content[7:]
-                if content.startswith("```"):
-                    content = content[3:]
-                if content.endswith("```"):
-                    content = content[:-3]
-                content = content.strip()
-                
-                data = json.loads(content)
-                return data, None
-            else:
-                raise Exception("Keine 'choices' in API-Antwort erhalten")
-                
-        except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
-            if attempt < max_retries - 1:
-                print(f"     ⚠️  Versuch {attempt + 1} fehlgeschlagen, Wiederholung in {RETRY_DELAY}s...")
-                time.sleep(RETRY_DELAY * (attempt + 1))
+            repairs = []
+            with trace("parse_json"):
+                data = vlm_client.parse_chat_content(result, repairs)
+            record_repairs(repairs)
+            data[MODEL_KEY] = route[-1].model
+            # Abgeschnittene (unvollständige) Antworten nicht dauerhaft cachen
+            if "truncated" not in repairs:
+                cache_response(base64_image, data)
+            data[RAW_RESPONSE_KEY] = vlm_client.chat_content(result)
+            return data, None, None
+        
+        except Exception as e:
+            if disable_rejected_schema(e) or reroute(e, route):
                 continue
-            else:
-                return None, str(e)
+            delay = next_attempt_delay(e, attempt, max_retries)
+            attempt += 1
+            if delay is None:
+                return None, str(e), None
+            if delay > 0:
+                return None, str(e), (attempt, delay)
+
+async def call_vlm_api_async(client, image_path, api_key, max_retries=MAX_RETRIES,
+                             base64_image=None, usage=None, attempt=0):
+    """
+    Asynchrone Variante von call_vlm_api für die asyncio-Engine.
+    Gleiche Fehlerbehandlung und Rückgabe, aber ohne blockierten Thread:
+    Datei- und Cache-Zugriffe (SQLite) laufen im Thread-Pool.
+    """
+    loop = asyncio.get_running_loop()
+    cache_checked = False
+    route = []  # gewählte Backends (Failover)
+    
+    while True:
+        try:
+            if base64_image is None:
+                # Datei lesen + Base64 im Thread-Pool, damit die Event-Loop frei bleibt
+                base64_image = await loop.run_in_executor(None, encode_image_to_base64, image_path)
+            if not cache_checked:
+                # Cache vor jedem Netzwerkzugriff prüfen
+                cache_checked = True
+                cached = await loop.run_in_executor(None, lookup_cache, base64_image)
+                if cached is not None:
+                    return cached, None, None
+            payload = vlm_client.build_chat_payload(MODEL_NAME, EXTRACTION_PROMPT, base64_image,
+                                                    TEMPERATURE, MAX_TOKENS, response_format())
+            run_metrics.upload_bytes.inc(len(base64_image))
+            
+            status_code, body = await post_hedged_async(client, payload, api_key, route=route)
+            vlm_client.raise_for_api_error(status_code, body)
+            
+            with trace("decode_response"):
+                result = json.loads(body)
+            record_response_usage(result, usage, backend=route[-1])
+            
+            repairs = []
+            with trace("parse_json"):
+                data = vlm_client.parse_chat_content(result, repairs)
+            record_repairs(repairs)
+            data[MODEL_KEY] = route[-1].model
+            # Abgeschnittene (unvollständige) Antworten nicht dauerhaft cachen
+            if "truncated" not in repairs:
+                await loop.run_in_executor(None, cache_response, base64_image, data)
+            data[RAW_RESPONSE_KEY] = vlm_client.chat_content(result)
+            return data, None, None
+        
         except Exception as e:
-            if attempt < max_retries - 1:
-                print(f"     ⚠️  Versuch {attempt + 1} fehlgeschlagen, Wiederholung in {RETRY_DELAY}s...")
-                time.sleep(RETRY_DELAY * (attempt + 1))
+            if disable_rejected_schema(e) or reroute(e, route):
                 continue
-            return None, str(e)
+            delay = next_attempt_delay(e, attempt, max_retries)
+            attempt += 1
+            if delay is None:
+                return None, str(e), None
+            if delay > 0:
+                return None, str(e), (attempt, delay)
+
+def build_multi_card_request(images):
+    """Payload und Token-Schätzung für mehrere Karten (Paare Dateiname, base64)."""
+    payload = vlm_client.build_multi_card_payload(MODEL_NAME, MULTI_CARD_PROMPT, images,
+                                                  TEMPERATURE, MAX_TOKENS * len(images),
+                                                  response_format(multi_card=True))
+    run_metrics.upload_bytes.inc(sum(len(base64_image) for _, base64_image in images))
+    return payload, TOKENS_PER_REQUEST_ESTIMATE * len(images)
+
+def parse_multi_card_result(result, images, usage, backend=None):
+    """{Dateiname: Daten} aus der Antwort, mit dem Roh-Objekt pro Karte."""
+    record_response_usage(result, usage, TOKENS_PER_REQUEST_ESTIMATE * len(images), backend)
+    repairs = []
+    with trace("parse_json", cards=len(images)):
+        cards = vlm_client.parse_multi_card_content(result, [name for name, _ in images], repairs)
+    record_repairs(repairs)
+    for data in cards.values():
+        data[RAW_RESPONSE_KEY] = json.dumps(data, ensure_ascii=False)
+        data[MODEL_KEY] = backend.model if backend is not None else MODEL_NAME
+    return cards
+
+def call_vlm_api_multi(images, api_key, max_retries=MAX_RETRIES, usage=None):
+    """
+    Fragt mehrere Karten mit EINEM Request ab (``images``: Paare Dateiname, base64).
+    Liefert ({Dateiname: Daten}, Fehler).
     
-    return None, "Max retries erreicht"
+    Nur Drosselungen (429) werden hier wiederholt; bei anderen Fehlern
+    werden die Karten vom Aufrufer einzeln (mit eigenen Wiederholungen) nachgefragt.
+    """
+    attempt = 0
+    route = []  # gewählte Backends (Failover)
+    while True:
+        try:
+            payload, token_estimate = build_multi_card_request(images)
+            response = post_hedged(payload, api_key, token_estimate, route)
+            vlm_client.raise_for_api_error(response.status_code, response.text)
+            with trace("decode_response"):
+                result = response.json()
+            return parse_multi_card_result(result, images, usage, route[-1]), None
+        except Exception as e:
+            if disable_rejected_schema(e) or reroute(e, route):
+                continue
+            retrying = is_throttled(e) and attempt < max_retries - 1
+            record_failed_attempt(e, retrying)
+            attempt += 1
+            if retrying:
+                continue
+            return {}, str(e)
+
+async def call_vlm_api_multi_async(client, images, api_key, max_retries=MAX_RETRIES, usage=None):
+    """Asynchrone Variante von call_vlm_api_multi."""
+    attempt = 0
+    route = []  # gewählte Backends (Failover)
+    while True:
+        try:
+            payload, token_estimate = build_multi_card_request(images)
+            status_code, body = await post_hedged_async(client, payload, api_key,
+                                                        token_estimate, route)
+            vlm_client.raise_for_api_error(status_code, body)
+            with trace("decode_response"):
+                result = json.loads(body)
+            return parse_multi_card_result(result, images, usage, route[-1]), None
+        except Exception as e:
+            if disable_rejected_schema(e) or reroute(e, route):
+                continue
+            retrying = is_throttled(e) and attempt < max_retries - 1
+            record_failed_attempt(e, retrying)
+            attempt += 1
+            if retrying:
+                continue
+            return {}, str(e)
 
 def log_error(batch_name, filename, message, details=None):
     """Schreibt Fehler in die Logdatei (thread-safe)."""
-    with log_lock:
-        with open(LOG_FILE, "a", encoding="utf-8") as log:
-            log.write(f"[{datetime.now().isoformat()}] Batch: {batch_name} | Datei: {filename}\n")
-            log.write(f"⚠️  {message}\n")
-            if details:
-                log.write(f"Details: {details}\n")
-            log.write("-" * 80 + "\n")
+    with trace("log_error"):
+        with trace("log_lock_wait"):
+            log_lock.acquire()
+        try:
+            with open(LOG_FILE, "a", encoding="utf-8") as log:
+                log.write(f"[{datetime.now().isoformat()}] Batch: {batch_name} | Datei: {filename}\n")
+                log.write(f"⚠️  {message}\n")
+                if details:
+                    log.write(f"Details: {details}\n")
+                log.write("-" * 80 + "\n")
+        finally:
+            log_lock.release()
 
 def validate_signature(signature):
     """Validiert ob eine Signatur ein gültiges Format hat."""
@@ -243,20 +1222,12 @@ def format_time(seconds):
     """Formatiert Sekunden in lesbares Format."""
     return str(timedelta(seconds=int(seconds)))
 
-def save_checkpoint(data):
-    """Speichert den aktuellen Fortschritt."""
-    with open(CHECKPOINT_FILE, 'wb') as f:
-        pickle.dump(data, f)
-
 def load_checkpoint():
-    """Lädt den gespeicherten Fortschritt."""
-    if os.path.exists(CHECKPOINT_FILE):
-        try:
-            with open(CHECKPOINT_FILE, 'rb') as f:
-                return pickle.load(f)
-        except:
-            return {}
-    return {}
+    """Lädt den gespeicherten Fortschritt (Journal in einem Durchgang)."""
+    try:
+        return checkpoint.load()
+    except OSError:
+        return {}
 
 def save_progress(progress):
     """Speichert Fortschritt in JSON."""
@@ -275,70 +1246,462 @@ def load_progress():
 
 # === WORKER FUNKTION ===
 
-def process_single_card(image_path, api_key, batch_name):
-    """Verarbeitet eine einzelne Karteikarte."""
-    start_time = time.time()
+def build_card_result(image_path, batch_name, data, error, start_time, image_stats=None,
+                      usage=None):
+    """
+    Wertet das API-Ergebnis einer Karte aus und speichert es
+    (Ergebnisspeicher oder JSON-Datei). ``usage`` = Token-Verbrauch der Karte.
+    """
     filename = image_path.name
+    raw_response = data.pop(RAW_RESPONSE_KEY, None) if data else None
+    model = data.pop(MODEL_KEY, MODEL_NAME) if data else MODEL_NAME
     
-    try:
-        data, error = call_vlm_api(str(image_path), api_key)
-        
-        if error:
-            log_error(batch_name, filename, error)
-            return {
-                "filename": filename,
-                "batch": batch_name,
-                "success": False,
-                "error": error,
-                "duration": time.time() - start_time
-            }
-        
-        # Füge Metadaten hinzu
-        data["Datei"] = filename
-        data["Batch"] = batch_name
-        
+    if error:
+        log_error(batch_name, filename, error)
+        if results_store is not None:
+            results_store.add_card(batch_name, filename, model=model,
+                                   duration=time.time() - start_time, error=error)
+        return {
+            "filename": filename,
+            "batch": batch_name,
+            "success": False,
+            "error": error,
+            "duration": time.time() - start_time,
+            "image_stats": image_stats,
+            "usage": usage
+        }
+    
+    # Füge Metadaten hinzu
+    data["Datei"] = filename
+    data["Batch"] = batch_name
+    
+    if results_store is not None:
+        # Eine Zeile in der Datenbank statt einer Datei pro Karte; der
+        # Checkpoint-Eintrag folgt erst nach dem Commit der Zeile
+        with trace("store_add"):
+            results_store.add_card(batch_name, filename, data, raw_response, model,
+                                   time.time() - start_time,
+                                   on_commit=functools.partial(checkpoint.record, batch_name,
+                                                               filename))
+    else:
         # Speichere JSON (in batch-spezifischem Unterordner)
         batch_json_dir = Path(JSON_OUT_BASE) / batch_name
-        batch_json_dir.mkdir(exist_ok=True)
+        if batch_name not in json_dirs:
+            batch_json_dir.mkdir(exist_ok=True)
+            json_dirs.add(batch_name)
         json_path = batch_json_dir / f"{image_path.stem}.json"
         
-        with open(json_path, "w", encoding="utf-8") as f:
+        with trace("write_json"), open(json_path, "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+    
+    return {
+        "filename": filename,
+        "batch": batch_name,
+        "success": True,
+        "data": data,
+        "duration": time.time() - start_time,
+        "image_stats": image_stats,
+        "usage": usage,
+        "has_komponist": bool(data.get("Komponist", "").strip()),
+        "has_signatur": bool(data.get("Signatur", "").strip()),
+        "valid_signatur": validate_signature(data.get("Signatur", ""))
+    }
+
+def build_failed_result(image_path, batch_name, exc, start_time, usage=None):
+    """Ergebnis für unerwartete Fehler während der Verarbeitung."""
+    log_error(batch_name, image_path.name, f"Unerwarteter Fehler: {str(exc)}")
+    if results_store is not None:
+        results_store.add_card(batch_name, image_path.name, model=MODEL_NAME,
+                               duration=time.time() - start_time, error=str(exc))
+    return {
+        "filename": image_path.name,
+        "batch": batch_name,
+        "success": False,
+        "error": str(exc),
+        "duration": time.time() - start_time,
+        "usage": usage
+    }
+
+def build_deferred_result(image_path, batch_name, error, retry, start_time, usage):
+    """
+    Ergebnis einer Karte, die nach einem vorübergehenden Fehler später erneut
+    versucht wird. ``item`` ist der Auftrag für die Wiederholungs-Warteschlange
+    (Startzeit und Token-Verbrauch laufen über alle Versuche weiter).
+    """
+    attempt, delay = retry
+    return {
+        "filename": image_path.name,
+        "batch": batch_name,
+        "deferred": True,
+        "error": error,
+        "retry_in": delay,
+        "item": (image_path, batch_name, {"attempt": attempt, "start": start_time, "usage": usage})
+    }
+
+def resume_card(retry):
+    """(Startzeit, Verbrauch, bisherige Versuche) einer neuen bzw. wiederholten Karte."""
+    if retry is None:
+        return time.time(), cost_accounting.new_usage(), 0
+    run_metrics.retry_queue_depth.dec()
+    return retry["start"], retry["usage"], retry["attempt"]
+
+def defer_card(result, grouped=False):
+    """
+    Für den Scheduler: (Auftrag, Wartezeit), wenn die Karte später erneut
+    versucht wird, sonst None. Im Gruppenmodus wird sie einzeln wiederholt.
+    """
+    if not result.get("deferred"):
+        return None
+    run_metrics.retry_queue_depth.inc()
+    run_metrics.deferred_retries.inc()
+    item = result["item"]
+    return ([item] if grouped else item), result["retry_in"]
+
+def process_single_card(image_path, api_key, batch_name, retry=None):
+    """
+    Verarbeitet eine einzelne Karteikarte. ``retry`` ist der Zustand einer
+    Karte aus der Wiederholungs-Warteschlange (siehe build_deferred_result).
+    """
+    start_time, usage, attempt = resume_card(retry)
+    
+    with trace("card", file=image_path.name, batch=batch_name, attempt=attempt + 1):
+        try:
+            base64_image, image_stats = prepare_image(image_path)
+            data, error, again = call_vlm_api(str(image_path), api_key, base64_image=base64_image,
+                                              usage=usage, attempt=attempt)
+            if again is not None:
+                return build_deferred_result(image_path, batch_name, error, again, start_time, usage)
+            return build_card_result(image_path, batch_name, data, error, start_time, image_stats,
+                                     usage)
+        except Exception as e:
+            return build_failed_result(image_path, batch_name, e, start_time, usage)
+
+async def process_single_card_async(client, image_path, api_key, batch_name, retry=None):
+    """
+    Verarbeitet eine einzelne Karteikarte in der asyncio-Engine; das
+    Speichern (JSON, Ergebnisspeicher, Fehlerlog) läuft im Thread-Pool.
+    """
+    start_time, usage, attempt = resume_card(retry)
+    loop = asyncio.get_running_loop()
+    
+    # Eigener Trace-Track pro Karte (alle Karten teilen sich den Event-Loop-Thread)
+    with tracing.track(tracer), trace("card", file=image_path.name, batch=batch_name,
+                                      attempt=attempt + 1):
+        try:
+            base64_image, image_stats = await loop.run_in_executor(None, prepare_image, image_path)
+            data, error, again = await call_vlm_api_async(client, str(image_path), api_key,
+                                                          base64_image=base64_image, usage=usage,
+                                                          attempt=attempt)
+            if again is not None:
+                return build_deferred_result(image_path, batch_name, error, again, start_time, usage)
+            return await loop.run_in_executor(None, build_card_result, image_path, batch_name,
+                                              data, error, start_time, image_stats, usage)
+        except Exception as e:
+            return await loop.run_in_executor(None, build_failed_result, image_path, batch_name,
+                                              e, start_time, usage)
+
+def process_card_item(item, api_key):
+    """Auftrag (Pfad, Batch) bzw. (Pfad, Batch, Wiederholungszustand) der Thread-Engine."""
+    return process_single_card(item[0], api_key, item[1], *item[2:])
+
+async def process_card_item_async(client, item, api_key):
+    """Auftrag (Pfad, Batch) bzw. (Pfad, Batch, Wiederholungszustand) der asyncio-Engine."""
+    return await process_single_card_async(client, item[0], api_key, item[1], *item[2:])
+
+def prepare_card_group(group, start_time):
+    """
+    Kodiert die Bilder einer Kartengruppe und prüft den Cache.
+    Liefert (fertige Ergebnisse, offene Karten als (Pfad, Batch, base64, stats)).
+    """
+    results = []
+    pending = []
+    for image_path, batch_name in group:
+        try:
+            base64_image, image_stats = prepare_image(image_path)
+            cached = lookup_cache(base64_image, MULTI_CARD_PROMPT)
+        except Exception as e:
+            results.append(build_failed_result(image_path, batch_name, e, start_time))
+            continue
+        if cached is not None:
+            results.append(build_card_result(image_path, batch_name, cached, None, start_time,
+                                             image_stats))
+        else:
+            pending.append((image_path, batch_name, base64_image, image_stats))
+    return results, pending
+
+def collect_group_results(pending, cards, error, start_time, usage):
+    """
+    Übernimmt die Karten aus der Mehrkarten-Antwort (und legt sie im Cache ab).
+    Der Token-Verbrauch des Requests wird gleichmäßig auf die Karten verteilt.
+    Liefert (Ergebnisse, fehlende Karten für den Einzelmodus als (Karte, Verbrauch)).
+    """
+    results = []
+    missing = []
+    for card in pending:
+        image_path, batch_name, base64_image, image_stats = card
+        card_usage = cost_accounting.split_usage(usage, len(pending))
+        data = cards.get(image_path.name)
+        if data is None:
+            missing.append((card, card_usage))
+            continue
+        try:
+            cache_response(base64_image, data, MULTI_CARD_PROMPT)
+            results.append(build_card_result(image_path, batch_name, data, None, start_time,
+                                             image_stats, card_usage))
+        except Exception as e:
+            results.append(build_failed_result(image_path, batch_name, e, start_time, card_usage))
+    
+    if missing:
+        run_metrics.multi_card_fallbacks.inc(len(missing))
+        reason = f" ({error})" if error else ""
+        print(f"     ↩️  {len(missing)} von {len(pending)} Karten nicht in der Antwort{reason}"
+              f" – Einzelabfrage")
+    return results, missing
+
+def process_card_group(group, api_key):
+    """
+    Verarbeitet mehrere Karten desselben Batches mit EINEM Request.
+    Karten aus dem Cache werden nicht gesendet; fehlt eine Karte in der
+    Antwort oder scheitert der Request, wird sie einzeln nachgefragt.
+    """
+    if len(group) == 1:
+        # Einzelne Karte (auch jede Wiederholung aus der Warteschlange)
+        return [process_card_item(group[0], api_key)]
+    
+    start_time = time.time()
+    with trace("card_group", cards=len(group), batch=group[0][1]):
+        results, pending = prepare_card_group(group, start_time)
+        if not pending:
+            return results
         
-        return {
-            "filename": filename,
-            "batch": batch_name,
-            "success": True,
-            "data": data,
-            "duration": time.time() - start_time,
-            "has_komponist": bool(data.get("Komponist", "").strip()),
-            "has_signatur": bool(data.get("Signatur", "").strip()),
-            "valid_signatur": validate_signature(data.get("Signatur", ""))
-        }
+        images = [(card[0].name, card[2]) for card in pending]
+        usage = cost_accounting.new_usage()
+        cards, error = call_vlm_api_multi(images, api_key, usage=usage)
+        received, missing = collect_group_results(pending, cards, error, start_time, usage)
+        results.extend(received)
         
-    except Exception as e:
-        log_error(batch_name, filename, f"Unerwarteter Fehler: {str(e)}")
-        return {
-            "filename": filename,
-            "batch": batch_name,
-            "success": False,
-            "error": str(e),
-            "duration": time.time() - start_time
-        }
+        for (image_path, batch_name, base64_image, image_stats), card_usage in missing:
+            try:
+                data, error, again = call_vlm_api(str(image_path), api_key,
+                                                  base64_image=base64_image, usage=card_usage)
+                if again is not None:
+                    results.append(build_deferred_result(image_path, batch_name, error, again,
+                                                         start_time, card_usage))
+                    continue
+                results.append(build_card_result(image_path, batch_name, data, error, start_time,
+                                                 image_stats, card_usage))
+            except Exception as e:
+                results.append(build_failed_result(image_path, batch_name, e, start_time,
+                                                   card_usage))
+        return results
 
-# === BATCH-VERARBEITUNG ===
+async def process_card_group_async(client, group, api_key):
+    """Asynchrone Variante von process_card_group."""
+    if len(group) == 1:
+        return [await process_card_item_async(client, group[0], api_key)]
+    
+    start_time = time.time()
+    loop = asyncio.get_running_loop()
+    with tracing.track(tracer), trace("card_group", cards=len(group), batch=group[0][1]):
+        results, pending = await loop.run_in_executor(None, prepare_card_group, group, start_time)
+        if not pending:
+            return results
+        
+        images = [(card[0].name, card[2]) for card in pending]
+        usage = cost_accounting.new_usage()
+        cards, error = await call_vlm_api_multi_async(client, images, api_key, usage=usage)
+        received, missing = await loop.run_in_executor(None, collect_group_results, pending,
+                                                       cards, error, start_time, usage)
+        results.extend(received)
+        
+        for (image_path, batch_name, base64_image, image_stats), card_usage in missing:
+            try:
+                data, error, again = await call_vlm_api_async(client, str(image_path), api_key,
+                                                              base64_image=base64_image,
+                                                              usage=card_usage)
+                if again is not None:
+                    results.append(build_deferred_result(image_path, batch_name, error, again,
+                                                         start_time, card_usage))
+                    continue
+                results.append(await loop.run_in_executor(
+                    None, build_card_result, image_path, batch_name, data, error, start_time,
+                    image_stats, card_usage))
+            except Exception as e:
+                results.append(await loop.run_in_executor(
+                    None, build_failed_result, image_path, batch_name, e, start_time, card_usage))
+        return results
 
-def process_single_batch(batch_dir, api_key, batch_number, total_batches):
-    """Verarbeitet einen einzelnen Batch-Ordner."""
+def group_cards(items, size):
+    """
+    Fasst aufeinanderfolgende Karten DESSELBEN Batches zu Gruppen von
+    höchstens ``size`` Karten zusammen (Dateinamen sind nur pro Batch eindeutig).
+    """
+    groups = []
+    for item in items:
+        group = groups[-1] if groups else None
+        if group is None or len(group) >= size or group[0][1] != item[1]:
+            groups.append([item])
+        else:
+            group.append(item)
+    return groups
+
+def configure_usage_accounting(open_cards):
+    """Setzt die Verbrauchssummen des Laufs zurück und öffnet das Protokoll pro Karte."""
+    global run_usage, run_open_cards, usage_log
+    run_usage = cost_accounting.UsageTotals()
+    run_open_cards = open_cards
+    if usage_log is None:
+        usage_log = cost_accounting.UsageLog(USAGE_LOG)
+
+def close_usage_log():
+    global usage_log
+    if usage_log is not None:
+        usage_log.close()
+        usage_log = None
+
+def remaining_cards():
+    """Noch nicht verarbeitete Karten des Laufs (für die Kostenprognose)."""
+    return max(0, run_open_cards - run_usage.cards)
+
+def count_open_cards(batch_dirs):
+    """Anzahl der Karten in ``batch_dirs``, die laut Checkpoint noch offen sind."""
+    processed = load_checkpoint()
+    total = 0
+    for batch_dir in batch_dirs:
+        done = processed.get(batch_dir.name, set())
+        total += sum(1 for f in list(batch_dir.glob("*.jpg")) + list(batch_dir.glob("*.jpeg"))
+                     if f.name not in done)
+    return total
+
+def configure_cards_per_request(count=CARDS_PER_REQUEST):
+    """Legt fest, wie viele Karten ein Request enthält (1 = Einzelmodus)."""
+    global cards_per_request
+    cards_per_request = max(1, count or 1)
+    return cards_per_request
+
+def configure_concurrency(engine=ENGINE, max_concurrency=None, adaptive=ADAPTIVE_CONCURRENCY):
+    """
+    Legt die Obergrenze gleichzeitiger Requests für die gewählte Engine fest.
+    
+    Adaptiv startet der Controller bei MAX_WORKERS und regelt zwischen
+    CONCURRENCY_MIN und der Obergrenze; sonst bleibt die Parallelität fest.
+    """
+    if engine == "async":
+        ceiling = max_concurrency or ASYNC_CONCURRENCY
+    else:
+        ceiling = max_concurrency or (CONCURRENCY_MAX if adaptive else MAX_WORKERS)
+    
+    if adaptive:
+        concurrency.configure(min(MAX_WORKERS, ceiling), min(CONCURRENCY_MIN, ceiling), ceiling)
+    else:
+        concurrency.configure(ceiling, ceiling, ceiling)
+    
+    api_client.pool_size = ceiling
+    return ceiling
+
+def iter_card_results(items, api_key, engine=ENGINE):
+    """
+    Verarbeitet die Karten mit der gewählten Engine und liefert die
+    Ergebnisse in Fertigstellungsreihenfolge.
+    
+    ``items`` sind Paare (Bildpfad, Batch-Name) – auch über mehrere Batches.
+    
+    - "threads": ThreadPoolExecutor, ein Thread pro möglichem Slot
+    - "async":   asyncio + aiohttp, ohne OS-Thread pro Request
+    
+    Wie viele Requests tatsächlich gleichzeitig laufen, bestimmt in beiden
+    Fällen der Controller `concurrency`.
+    
+    Karten mit vorübergehenden Fehlern kommen in eine Wiederholungs-Warteschlange
+    und werden nach ihrer Wartezeit erneut eingeplant, ohne einen Worker
+    zu blockieren; geliefert wird nur das endgültige Ergebnis.
+    
+    Mit ``cards_per_request`` > 1 wird jeweils eine Kartengruppe desselben
+    Batches pro Request verarbeitet; die Ergebnisse kommen weiterhin pro Karte.
+    """
+    grouped = cards_per_request > 1
+    if grouped:
+        items = group_cards(items, cards_per_request)
+    
+    if engine == "async":
+        if grouped:
+            worker = lambda client, group: process_card_group_async(client, group, api_key)
+        else:
+            worker = lambda client, item: process_card_item_async(client, item, api_key)
+        return vlm_async.iter_completed(
+            items,
+            worker,
+            endpoint=API_ENDPOINT,
+            concurrency=concurrency.max_limit,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            batched=grouped,
+            defer=lambda result: defer_card(result, grouped)
+        )
+    return _iter_threaded_results(items, api_key, concurrency.max_limit, grouped)
+
+def _iter_threaded_results(items, api_key, max_workers, grouped=False):
+    """
+    Thread-basierte Engine (Standard); ``grouped``: Elemente sind Kartengruppen.
     
+    Es sind nur so viele Aufträge eingeplant, dass jeder Worker einen
+    nächsten hat; fällige Wiederholungen haben Vorrang vor neuen Karten.
+    Auf die Wartezeit einer Wiederholung wartet nur dieser Scheduler.
+    """
+    process = process_card_group if grouped else process_card_item
+    pending = iter(items)
+    retries = retry_policy.RetryQueue()
+    in_flight = set()
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            while True:
+                while len(in_flight) < max_workers * 2:
+                    item = retries.pop_due()
+                    if item is None:
+                        item = next(pending, None)
+                    if item is None:
+                        break
+                    in_flight.add(executor.submit(process, item, api_key))
+                
+                if not in_flight:
+                    if not len(retries):
+                        break
+                    time.sleep(retries.seconds_until_due())
+                    continue
+                
+                done, in_flight = wait(in_flight, timeout=retries.seconds_until_due(),
+                                       return_when=FIRST_COMPLETED)
+                for future in done:
+                    for result in (future.result() if grouped else [future.result()]):
+                        deferred = defer_card(result, grouped)
+                        if deferred is None:
+                            yield result
+                        else:
+                            retries.push(*deferred)
+        finally:
+            # Bei Abbruch nicht auf alle ausstehenden Karten warten
+            for future in in_flight:
+                future.cancel()
+
+def engine_connection_stats(results, engine):
+    """Verbindungszähler der jeweiligen Engine."""
+    return results.connection_stats() if engine == "async" else api_client.connection_stats()
+
+# === BATCH-VERARBEITUNG ===
+
+def prepare_batch(batch_dir, processed, batch_number, total_batches, engine=ENGINE, verbose=True):
+    """
+    Ermittelt die noch offenen Karten eines Batch-Ordners.
+    Liefert den Batch-Zustand (Zähler, offene Dateien) oder None.
+    """
     batch_name = batch_dir.name
-    print(f"\n{'=' * 80}")
-    print(f"📦 BATCH {batch_number}/{total_batches}: {batch_name}")
-    print(f"{'=' * 80}")
+    if verbose:
+        print(f"\n{'=' * 80}")
+        print(f"📦 BATCH {batch_number}/{total_batches}: {batch_name}")
+        print(f"{'=' * 80}")
     
-    # Lade Checkpoint für diesen Batch
-    checkpoint = load_checkpoint()
-    processed_files = checkpoint.get(batch_name, set())
+    processed_files = processed.get(batch_name, set())
     
     # Finde alle Bilder
     all_files = sorted(list(batch_dir.glob("*.jpg")) + list(batch_dir.glob("*.jpeg")))
@@ -347,6 +1710,13 @@ def process_single_batch(batch_dir, api_key, batch_number, total_batches):
     total = len(image_files)
     already_processed = len(all_files) - total
     
+    if not verbose:
+        if total == 0:
+            return None
+        resumed = f" ({already_processed} bereits verarbeitet)" if already_processed else ""
+        print(f"  📦 {batch_number}/{total_batches} {batch_name}: {total} neue Karten{resumed}")
+        return _new_batch_state(batch_name, all_files, image_files, processed_files)
+    
     if already_processed > 0:
         print(f"📌 {already_processed} Karten bereits verarbeitet (wird fortgesetzt)")
     
@@ -357,72 +1727,123 @@ def process_single_batch(batch_dir, api_key, batch_number, total_batches):
             print(f"⚠️  Keine Bilder gefunden")
         return None
     
-    print(f"📚 Verarbeite {total} neue Karteikarten...")
-    print(f"🔗 API Endpoint: {API_ENDPOINT}")
+    print(f"📚 Verarbeite {total} neue Karteikarten (Engine: {engine})...")
+    print(f"🔗 API Endpoint: {endpoint_label()}")
     print(f"🤖 Modell: {MODEL_NAME}")
     
-    # Statistiken
-    records = []
-    success_count = 0
-    error_count = 0
-    komponist_count = 0
-    signatur_count = 0
-    valid_signatur_count = 0
+    return _new_batch_state(batch_name, all_files, image_files, processed_files)
+
+def _new_batch_state(batch_name, all_files, image_files, processed_files):
+    return {
+        "batch_name": batch_name,
+        "all_files": all_files,
+        "image_files": image_files,
+        "total": len(image_files),
+        "processed_files": processed_files,
+        "csv_writer": batch_csv.BatchCSVWriter(os.path.join(CSV_OUT_BASE, f"{batch_name}.csv"),
+                                               FIELD_KEYS, flush_every=CSV_FLUSH_EVERY),
+        "success_count": 0,
+        "error_count": 0,
+        "komponist_count": 0,
+        "signatur_count": 0,
+        "valid_signatur_count": 0,
+        "processed_count": 0,
+        "usage": cost_accounting.UsageTotals(),
+        "image_stats": {"cards": 0, "original_bytes": 0, "processed_bytes": 0,
+                        "original_tokens": 0, "processed_tokens": 0},
+        "start": None,
+        "last_update": time.time()
+    }
+
+def record_card_result(state, result, show_progress=True):
+    """Verbucht das Ergebnis einer Karte im Batch-Zustand."""
+    with trace("record_result", file=result["filename"]):
+        _record_card_result(state, result, show_progress)
+
+def _record_card_result(state, result, show_progress):
+    batch_name = state["batch_name"]
+    state["processed_count"] += 1
+    processed_count = state["processed_count"]
     
-    batch_start = time.time()
-    last_update = time.time()
-    processed_count = 0
+    run_metrics.queue_depth.dec()
+    run_metrics.cards.inc(outcome="success" if result["success"] else "error")
+    run_metrics.card_seconds.observe(result["duration"])
     
-    # Parallele Verarbeitung
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_file = {
-            executor.submit(process_single_card, img_path, api_key, batch_name): img_path 
-            for img_path in image_files
-        }
+    # Batch-Beginn = Start der ersten fertigen Karte
+    if state["start"] is None:
+        state["start"] = time.time() - result["duration"]
+    
+    if result["success"]:
+        state["success_count"] += 1
+        state["processed_files"].add(result["filename"])
         
-        for future in as_completed(future_to_file):
-            result = future.result()
-            processed_count += 1
-            
-            if result["success"]:
-                success_count += 1
-                records.append(result["data"])
-                processed_files.add(result["filename"])
-                
-                if result.get("has_komponist"):
-                    komponist_count += 1
-                if result.get("has_signatur"):
-                    signatur_count += 1
-                if result.get("valid_signatur"):
-                    valid_signatur_count += 1
-            else:
-                error_count += 1
-            
-            # Progress Update
-            current_time = time.time()
-            if current_time - last_update >= 5 or processed_count % 10 == 0:
-                elapsed = current_time - batch_start
-                avg_time = elapsed / processed_count
-                remaining = total - processed_count
-                eta_seconds = remaining * avg_time
-                eta = format_time(eta_seconds)
-                
-                cards_per_min = (processed_count / elapsed) * 60 if elapsed > 0 else 0
-                
-                print(f"  📊 [{processed_count}/{total}] | "
-                      f"✓ {success_count} | ✗ {error_count} | "
-                      f"{cards_per_min:.1f}/min | "
-                      f"ETA: {eta}")
-                
-                last_update = current_time
-                
-                # Checkpoint alle 50 Karten
-                if processed_count % 50 == 0:
-                    checkpoint[batch_name] = processed_files
-                    save_checkpoint(checkpoint)
+        # Zeile sofort an die Batch-CSV anhängen. Checkpoint: O(1)-Eintrag im
+        # Journal pro fertiger Karte, aber erst wenn die Zeile geflusht ist –
+        # sonst fehlt die Karte nach einem Absturz in der CSV und wird beim
+        # Fortsetzen trotzdem übersprungen (Ergebnisspeicher: nach dem Commit,
+        # siehe build_card_result)
+        if results_store is None:
+            state["csv_writer"].write_row(
+                result["data"],
+                on_flush=functools.partial(checkpoint.record, batch_name, result["filename"]))
+        
+        if result.get("has_komponist"):
+            state["komponist_count"] += 1
+        if result.get("has_signatur"):
+            state["signatur_count"] += 1
+        if result.get("valid_signatur"):
+            state["valid_signatur_count"] += 1
+    else:
+        state["error_count"] += 1
+    
+    # Token-Verbrauch und Kosten
+    usage = result.get("usage")
+    cost = state["usage"].add(usage)
+    run_usage.add(usage)
+    if usage_log is not None and usage and usage["requests"]:
+        usage_log.write(batch_name, result["filename"], usage, cost)
+    
+    # Bildgrößen (Vorverarbeitung)
+    image_stats = result.get("image_stats")
+    if image_stats:
+        totals = state["image_stats"]
+        totals["cards"] += 1
+        for key in ("original_bytes", "processed_bytes", "original_tokens", "processed_tokens"):
+            totals[key] += image_stats.get(key) or 0
+    
+    # Progress Update
+    current_time = time.time()
+    if show_progress and (current_time - state["last_update"] >= 5 or processed_count % 10 == 0):
+        elapsed = current_time - state["start"]
+        avg_time = elapsed / processed_count
+        remaining = state["total"] - processed_count
+        eta_seconds = remaining * avg_time
+        eta = format_time(eta_seconds)
+        
+        cards_per_min = (processed_count / elapsed) * 60 if elapsed > 0 else 0
+        
+        print(f"  📊 [{processed_count}/{state['total']}] | "
+              f"✓ {state['success_count']} | ✗ {state['error_count']} | "
+              f"{cards_per_min:.1f}/min | "
+              f"⚡ {concurrency.limit} parallel | "
+              f"ETA: {eta}")
+        
+        state["last_update"] = current_time
+
+def finalize_batch(state, conn_stats):
+    """Gibt die Batch-Statistik aus und schreibt CSV + Checkpoint."""
+    with trace("finalize_batch", batch=state["batch_name"]):
+        return _finalize_batch(state, conn_stats)
+
+def _finalize_batch(state, conn_stats):
+    batch_name = state["batch_name"]
+    total = state["total"]
+    success_count = state["success_count"]
+    komponist_count = state["komponist_count"]
+    signatur_count = state["signatur_count"]
     
     # Batch-Statistiken
-    batch_duration = time.time() - batch_start
+    batch_duration = time.time() - state["start"]
     
     print(f"\n  ⏱️  Batch-Dauer: {format_time(batch_duration)}")
     print(f"  ⚡ Durchschnitt: {batch_duration / total:.2f}s pro Karte")
@@ -432,57 +1853,252 @@ def process_single_batch(batch_dir, api_key, batch_number, total_batches):
         print(f"  📝 Komponisten: {komponist_count} ({komponist_count/success_count*100:.1f}%)")
         print(f"  🔖 Signaturen: {signatur_count} ({signatur_count/success_count*100:.1f}%)")
     
+    print(f"  🔌 Verbindungen: {vlm_client.format_connection_stats(conn_stats)}")
+    
+    if image_preprocessor is not None:
+        print(f"  🖼️  Vorverarbeitung: "
+              f"{image_preprocessing.format_preprocessing_stats(**state['image_stats'])}")
+    
+    if concurrency.adaptive:
+        level = concurrency.summary()
+        print(f"  🎚️  Parallelität: aktuell {level['current']} "
+              f"(Min {level['min']} / Max {level['max']}, {level['decreases']} Drosselungen)")
+    
+    print(f"  ⏸️  Rate-Limit: {rate_limiter.format_rate_limit_stats(rate_limit_stats())}")
+    if len(vlm_backends) > 1:
+        for line in backend_pool.format_backend_stats(vlm_backends.stats()):
+            print(f"  🛰️  {line}")
+    
+    if response_cache is not None:
+        print(f"  🗄️  Cache: {cache_store.format_cache_stats(response_cache.stats())}")
+    
+    repaired = format_repair_stats()
+    if repaired:
+        print(f"  🩹 JSON repariert: {repaired}")
+    
+    for line in cost_accounting.format_usage(state["usage"], remaining_cards()):
+        print(f"  💰 {line}")
+    if usage_log is not None:
+        usage_log.flush()
+    
     # Speichere Batch-CSV
-    if records:
-        df = pd.DataFrame(records)
-        cols = ["Datei", "Batch", "Signatur", "Komponist"] + \
-               [k for k in FIELD_KEYS if k not in ["Signatur", "Komponist"] and k in df.columns]
-        df = df[cols]
-        
+    if success_count > 0:
         csv_filename = f"{batch_name}.csv"
         csv_path = os.path.join(CSV_OUT_BASE, csv_filename)
-        df.to_csv(csv_path, index=False, encoding="utf-8-sig")
         
-        print(f"  💾 CSV gespeichert: {csv_filename}")
+        if results_store is not None:
+            # Export aus der Datenbank (enthält auch früher verarbeitete Karten)
+            exported = results_store.export_csv(csv_path, batch_name)
+            stats = results_store.stats()
+            print(f"  🗃️  Ergebnisspeicher: {stats['rows']:,} Zeilen in {stats['commits']} Commits")
+            print(f"  💾 CSV exportiert: {csv_filename} ({exported} Karten)")
+        else:
+            # Teildatei atomar zur Batch-CSV machen
+            rows = state["csv_writer"].finalize()
+            print(f"  💾 CSV gespeichert: {csv_filename} ({rows} Karten)")
         
-        # Update Checkpoint
-        checkpoint[batch_name] = processed_files
-        save_checkpoint(checkpoint)
+        # Checkpoint-Journal sicher auf die Platte
+        checkpoint.flush()
         
         return {
             "batch_name": batch_name,
-            "total_cards": len(all_files),
+            "total_cards": len(state["all_files"]),
             "processed": total,
             "success": success_count,
-            "errors": error_count,
+            "errors": state["error_count"],
             "duration": batch_duration,
             "csv_file": csv_path,
             "komponist_found": komponist_count,
             "signatur_found": signatur_count,
-            "valid_signatur": valid_signatur_count
+            "valid_signatur": state["valid_signatur_count"]
         }
     
     return None
 
+def process_single_batch(batch_dir, api_key, batch_number, total_batches, engine=ENGINE):
+    """Verarbeitet einen einzelnen Batch-Ordner."""
+    
+    # Lade Checkpoint für diesen Batch
+    processed = load_checkpoint()
+    
+    state = prepare_batch(batch_dir, processed, batch_number, total_batches, engine)
+    if state is None:
+        return None
+    
+    # Parallele Verarbeitung
+    items = [(img_path, state["batch_name"]) for img_path in state["image_files"]]
+    run_metrics.queue_depth.inc(len(items))
+    results = iter_card_results(items, api_key, engine)
+    try:
+        for result in results:
+            record_card_result(state, result)
+        
+        return finalize_batch(state, engine_connection_stats(results, engine))
+    finally:
+        # Bei Abbruch bleibt die geflushte Teildatei für die Fortsetzung liegen
+        state["csv_writer"].close()
+
+def process_batches_global(batch_dirs, api_key, engine=ENGINE, on_batch_done=None):
+    """
+    Verarbeitet alle Karten aller Batch-Ordner über EINE gemeinsame
+    Warteschlange. Die Worker laufen über Ordnergrenzen hinweg durch,
+    statt am Ende jedes Batches auf die langsamste Karte zu warten.
+    
+    Jeder Batch wird abgeschlossen (Statistik, CSV, Checkpoint), sobald
+    seine letzte Karte fertig ist; danach wird ``on_batch_done(name, result)``
+    aufgerufen.
+    """
+    processed = load_checkpoint()
+    total_batches = len(batch_dirs)
+    
+    print(f"\n{'=' * 80}")
+    print(f"📦 GEMEINSAME WARTESCHLANGE ÜBER {total_batches} BATCHES (Engine: {engine})")
+    print(f"{'=' * 80}")
+    
+    states = {}
+    items = []
+    for idx, batch_dir in enumerate(batch_dirs, 1):
+        state = prepare_batch(batch_dir, processed, idx, total_batches, engine, verbose=False)
+        if state:
+            states[state["batch_name"]] = state
+            items.extend((img_path, state["batch_name"]) for img_path in state["image_files"])
+    
+    total = len(items)
+    if total == 0:
+        print("✅ Keine offenen Karten")
+        return
+    
+    print(f"📚 Verarbeite {total:,} Karteikarten aus {len(states)} Batches...")
+    print(f"🔗 API Endpoint: {endpoint_label()}")
+    
+    run_start = time.time()
+    last_update = run_start
+    processed_count = 0
+    success_count = 0
+    run_metrics.queue_depth.inc(total)
+    results = iter_card_results(items, api_key, engine)
+    
+    try:
+        for result in results:
+            state = states[result["batch"]]
+            record_card_result(state, result, show_progress=False)
+            processed_count += 1
+            if result["success"]:
+                success_count += 1
+            
+            # Gesamtfortschritt
+            current_time = time.time()
+            if current_time - last_update >= 5 or processed_count % 50 == 0:
+                elapsed = current_time - run_start
+                cards_per_min = (processed_count / elapsed) * 60 if elapsed > 0 else 0
+                eta = format_time((total - processed_count) * elapsed / processed_count)
+                open_batches = sum(1 for s in states.values()
+                                   if 0 < s["processed_count"] < s["total"])
+                
+                print(f"  📊 [{processed_count:,}/{total:,}] | "
+                      f"✓ {success_count} | ✗ {processed_count - success_count} | "
+                      f"{cards_per_min:.1f}/min | "
+                      f"⚡ {concurrency.limit} parallel | "
+                      f"📦 {open_batches} aktiv | "
+                      f"ETA: {eta}")
+                last_update = current_time
+            
+            # Batch fertig → sofort abschließen
+            if state["processed_count"] == state["total"]:
+                print(f"\n  ✅ Batch abgeschlossen: {state['batch_name']}")
+                try:
+                    batch_result = finalize_batch(state, engine_connection_stats(results, engine))
+                except Exception as e:
+                    print(f"\n❌ Fehler bei Batch {state['batch_name']}: {e}")
+                    log_error(state["batch_name"], "BATCH", f"Kritischer Fehler: {e}")
+                    continue
+                if on_batch_done:
+                    on_batch_done(state["batch_name"], batch_result)
+    finally:
+        # Teil-CSVs, Journal und Ergebnisspeicher sicher auf die Platte (auch bei Abbruch)
+        for state in states.values():
+            state["csv_writer"].close()
+        if results_store is not None:
+            results_store.flush()
+        checkpoint.flush()
+
+def write_parquet(csv_path, dataset_dir):
+    """Schreibt die Gesamt-CSV zusätzlich als Parquet-Datensatz (falls pyarrow installiert ist)."""
+    if not parquet_store.available():
+        print("   ⚠️  Parquet übersprungen – benötigt pyarrow: pip install pyarrow")
+        return
+    try:
+        rows = parquet_store.write_from_csv(csv_path, dataset_dir)
+        print(f"   🧱 Parquet-Datensatz: {dataset_dir}/ ({rows:,} Zeilen, nach Batch partitioniert)")
+    except Exception as e:
+        print(f"   ⚠️  Parquet konnte nicht geschrieben werden: {e}")
+
 # === HAUPTPROGRAMM ===
 
-def process_all_batches():
+def process_all_batches(engine=ENGINE, max_concurrency=None, batch_pattern=BATCH_PATTERN,
+                        adaptive=ADAPTIVE_CONCURRENCY, scheduler=SCHEDULER,
+                        preprocess=PREPROCESS_IMAGES, use_cache=RESPONSE_CACHE,
+                        use_store=RESULTS_STORE, metrics_port=METRICS_PORT, trace_cards=TRACE,
+                        cards_per_request=CARDS_PER_REQUEST, schema=STRUCTURED_OUTPUT,
+                        hedge=HEDGE_REQUESTS, stream=STREAM_RESPONSES):
     """Verarbeitet alle Batch-Ordner."""
     
+    ceiling = configure_concurrency(engine, max_concurrency, adaptive)
+    preprocessing = configure_preprocessing(preprocess)
+    group_size = configure_cards_per_request(cards_per_request)
+    schema_enabled = configure_structured_output(schema)
+    hedging_enabled = configure_hedging(hedge)
+    streaming = configure_streaming(stream)
+    caching = configure_cache(use_cache)
+    storing = configure_results_store(use_store)
+    metric_targets = configure_metrics(metrics_port)
+    tracing_enabled = configure_tracing(trace_cards)
+    
     print("🎵 Lippmann-Rau Archiv Multi-Batch OCR")
     print("=" * 80)
     print(f"🤖 Modell: {MODEL_NAME}")
-    print(f"⚡ Parallele Verarbeitung mit {MAX_WORKERS} Workern")
-    print(f"🔗 API Endpoint: {API_ENDPOINT}")
+    engine_label = "asyncio-Engine" if engine == "async" else "Thread-Engine"
+    if adaptive:
+        print(f"⚡ {engine_label}, adaptive Parallelität {concurrency.limit} "
+              f"(Bereich {concurrency.min_limit}-{ceiling})")
+        print(f"🎚️  Verlauf der Parallelität: {CONCURRENCY_LOG}")
+    else:
+        print(f"⚡ {engine_label}, feste Parallelität mit {ceiling} gleichzeitigen Requests")
+    if schema_enabled:
+        print("🧩 Antworten per JSON-Schema (response_format) aus FIELD_KEYS")
+    if hedging_enabled:
+        print(f"🔀 Doppel-Requests ab p{HEDGE_QUANTILE} der Antwortzeit "
+              f"(mind. {HEDGE_MIN_DELAY}s, max. {HEDGE_MAX_PERCENT}% zusätzliche Requests)")
+    if streaming:
+        print(f"📡 Antworten als Stream (SSE)"
+              f"{', Abbruch sobald das JSON vollständig ist' if STREAM_EARLY_CLOSE else ''}")
+    if group_size > 1:
+        print(f"🗂️  {group_size} Karten pro Request (fehlende Karten werden einzeln nachgefragt)")
+    if preprocessing:
+        print(f"🖼️  Bildvorverarbeitung: max. {PREPROCESS_MAX_EDGE}px, "
+              f"{'Graustufen, ' if PREPROCESS_GRAYSCALE else ''}"
+              f"{'Rand-Zuschnitt, ' if PREPROCESS_CROP_BORDER else ''}"
+              f"JPEG-Qualität {PREPROCESS_JPEG_QUALITY}")
+    if caching:
+        print(f"🗄️  Antwort-Cache: {CACHE_FILE}")
+    if storing:
+        print(f"🗃️  Ergebnisspeicher: {RESULTS_DB} (keine JSON-Dateien pro Karte)")
+    if metric_targets:
+        print(f"📈 Metriken: {' | '.join(metric_targets)}")
+    if tracing_enabled:
+        print(f"🔬 Trace pro Karte: {TRACE_FILE} (öffnen mit https://ui.perfetto.dev)")
+    print(f"🔗 API Endpoint: {endpoint_label()}")
     print("=" * 80)
     
-    # API-Key abfragen
-    print("\n🔑 Bitte gib deinen API-Key ein:")
-    api_key = getpass.getpass("API-Key: ")
-    
-    if not api_key:
-        print("❌ Kein API-Key angegeben. Abbruch.")
-        return
+    # API-Key abfragen (entfällt, wenn jedes Backend einen eigenen hat)
+    api_key = None
+    if not all(backend.api_key for backend in vlm_backends):
+        print("\n🔑 Bitte gib deinen API-Key ein:")
+        api_key = getpass.getpass("API-Key: ")
+        
+        if not api_key:
+            print("❌ Kein API-Key angegeben. Abbruch.")
+            return
     
     # Lösche alte Logs
     if os.path.exists(LOG_FILE):
@@ -492,7 +2108,7 @@ def process_all_batches():
     base_path = Path(BASE_INPUT_DIR)
     
     # Methode 1: Suche nach Muster (z.B. "Batch_*")
-    batch_dirs = sorted(list(base_path.glob(BATCH_PATTERN)))
+    batch_dirs = sorted(list(base_path.glob(batch_pattern)))
     
     # Methode 2: Falls ALLE Unterordner Batches sind
     if not batch_dirs:
@@ -500,7 +2116,7 @@ def process_all_batches():
     
     if not batch_dirs:
         print(f"❌ Keine Batch-Ordner gefunden in: {BASE_INPUT_DIR}")
-        print(f"   Gesucht nach Muster: {BATCH_PATTERN}")
+        print(f"   Gesucht nach Muster: {batch_pattern}")
         return
     
     total_batches = len(batch_dirs)
@@ -514,34 +2130,53 @@ def process_all_batches():
     overall_start = time.time()
     batch_results = []
     
+    def mark_batch_done(batch_name, result):
+        if result:
+            batch_results.append(result)
+            completed_batches.append(batch_name)
+            
+            # Speichere Fortschritt
+            progress["completed_batches"] = completed_batches
+            progress["last_updated"] = datetime.now().isoformat()
+            save_progress(progress)
+    
+    pending_batches = []
     for idx, batch_dir in enumerate(batch_dirs, 1):
-        batch_name = batch_dir.name
-        
         # Überspringe bereits abgeschlossene Batches
-        if batch_name in completed_batches:
-            print(f"\n✅ Batch {idx}/{total_batches}: {batch_name} (bereits abgeschlossen)")
+        if batch_dir.name in completed_batches:
+            print(f"\n✅ Batch {idx}/{total_batches}: {batch_dir.name} (bereits abgeschlossen)")
             continue
-        
+        pending_batches.append((idx, batch_dir))
+    
+    # Basis für die Kostenprognose
+    configure_usage_accounting(count_open_cards([batch_dir for _, batch_dir in pending_batches]))
+    
+    if scheduler == "global":
+        # Eine Warteschlange über alle Batches (keine Barriere am Ordnerende)
         try:
-            result = process_single_batch(batch_dir, api_key, idx, total_batches)
-            
-            if result:
-                batch_results.append(result)
-                completed_batches.append(batch_name)
-                
-                # Speichere Fortschritt
-                progress["completed_batches"] = completed_batches
-                progress["last_updated"] = datetime.now().isoformat()
-                save_progress(progress)
-                
+            process_batches_global([batch_dir for _, batch_dir in pending_batches],
+                                   api_key, engine, on_batch_done=mark_batch_done)
         except KeyboardInterrupt:
             print("\n\n⏸️  Verarbeitung durch Benutzer unterbrochen.")
             print("💾 Fortschritt wurde gespeichert.")
             return
-        except Exception as e:
-            print(f"\n❌ Fehler bei Batch {batch_name}: {e}")
-            log_error(batch_name, "BATCH", f"Kritischer Fehler: {e}")
-            continue
+    
+    else:
+        for idx, batch_dir in pending_batches:
+            batch_name = batch_dir.name
+            
+            try:
+                result = process_single_batch(batch_dir, api_key, idx, total_batches, engine)
+                mark_batch_done(batch_name, result)
+                    
+            except KeyboardInterrupt:
+                print("\n\n⏸️  Verarbeitung durch Benutzer unterbrochen.")
+                print("💾 Fortschritt wurde gespeichert.")
+                return
+            except Exception as e:
+                print(f"\n❌ Fehler bei Batch {batch_name}: {e}")
+                log_error(batch_name, "BATCH", f"Kritischer Fehler: {e}")
+                continue
     
     # === FINALE ZUSAMMENFÜHRUNG ===
     
@@ -558,22 +2193,17 @@ def process_all_batches():
     
     print(f"📝 Füge {len(csv_files)} CSV-Dateien zusammen...")
     
-    # Lade und kombiniere alle CSVs
-    all_dfs = []
-    for csv_file in csv_files:
-        try:
-            df = pd.read_csv(csv_file, encoding="utf-8-sig")
-            all_dfs.append(df)
-        except Exception as e:
-            print(f"⚠️  Fehler beim Laden von {csv_file}: {e}")
+    # Inkrementell: unveränderte Batches werden nur kopiert (Manifest neben der Gesamt-CSV)
+    merge = csv_merge.merge_batch_csvs(CSV_OUT_BASE, FINAL_CSV, field_keys=FIELD_KEYS)
+    for csv_file, error in merge["errors"]:
+        print(f"⚠️  Fehler beim Laden von {csv_file}: {error}")
     
-    if all_dfs:
-        # Kombiniere alle DataFrames
-        combined_df = pd.concat(all_dfs, ignore_index=True)
-        combined_df.to_csv(FINAL_CSV, index=False, encoding="utf-8-sig")
-        
+    if merge["batches"]:
         print(f"✅ Gesamt-CSV erstellt: {FINAL_CSV}")
-        print(f"   📊 Gesamt-Einträge: {len(combined_df):,}")
+        print(f"   📊 Gesamt-Einträge: {merge['rows']:,} ({csv_merge.format_merge_stats(merge)})")
+        
+        if WRITE_PARQUET and (not merge["unchanged"] or not os.path.isdir(FINAL_PARQUET)):
+            write_parquet(FINAL_CSV, FINAL_PARQUET)
     
     # === FINALE STATISTIKEN ===
     
@@ -595,10 +2225,38 @@ def process_all_batches():
         print(f"❌ Fehler: {total_errors:,}")
         print(f"⚡ Durchschnitt: {total_elapsed / total_cards:.2f}s pro Karte")
         print(f"🚀 Geschwindigkeit: {(total_cards / total_elapsed) * 3600:.0f} Karten/Stunde")
+        print(f"🔌 Verbindungen: {vlm_client.format_connection_stats(api_client.connection_stats())}")
+        for line in cost_accounting.format_usage(run_usage, remaining_cards() + total_errors):
+            print(f"💰 {line}")
+        if response_cache is not None:
+            print(f"🗄️  Cache: {cache_store.format_cache_stats(response_cache.stats())}")
+        repaired = format_repair_stats()
+        if repaired:
+            print(f"🩹 JSON repariert: {repaired}")
+        retried = format_retry_stats()
+        if retried:
+            print(f"🔁 Wiederholungen: {retried}")
+        if len(vlm_backends) > 1:
+            for line in backend_pool.format_backend_stats(vlm_backends.stats()):
+                print(f"🛰️  {line}")
+        if hedge_policy is not None:
+            print(f"🔀 Doppel-Requests: {hedging.format_hedge_stats(hedge_policy.stats())}")
+        if stream_stats.streams:
+            print(f"📡 Streaming: {vlm_stream.format_stream_stats(stream_stats.stats())}")
+        for backend in vlm_backends:
+            if backend.breaker.trips:
+                label = f" {backend.name}" if len(vlm_backends) > 1 else ""
+                print(f"🔌 Schutzschalter{label}: "
+                      f"{circuit_breaker.format_breaker_stats(backend.breaker.stats())}")
     
     print(f"\n📂 Ausgabeverzeichnis: {OUTPUT_BASE}/")
     print(f"   ├── csv/ ({len(csv_files)} Batch-CSVs)")
-    print(f"   ├── json/ (JSON-Dateien nach Batch)")
+    if results_store is not None:
+        print(f"   ├── {os.path.basename(RESULTS_DB)} (Ergebnisspeicher, eine Zeile pro Karte)")
+    else:
+        print(f"   ├── json/ (JSON-Dateien nach Batch)")
+    if WRITE_PARQUET and os.path.isdir(FINAL_PARQUET):
+        print(f"   ├── {os.path.basename(FINAL_PARQUET)}/ (Parquet, nach Batch partitioniert)")
     print(f"   └── {os.path.basename(FINAL_CSV)} (Gesamt-CSV)")
     
     if total_errors > 0:
@@ -608,15 +2266,63 @@ def process_all_batches():
     
     # Lösche Checkpoint nach erfolgreichem Abschluss
     if len(completed_batches) == total_batches:
-        if os.path.exists(CHECKPOINT_FILE):
-            os.remove(CHECKPOINT_FILE)
+        checkpoint.clear()
         if os.path.exists(PROGRESS_FILE):
             os.remove(PROGRESS_FILE)
         print("✅ Alle Batches erfolgreich verarbeitet!")
 
+def parse_args():
+    """Kommandozeilen-Optionen (überschreiben die Konfiguration oben)."""
+    parser = argparse.ArgumentParser(description="Lippmann-Rau Archiv Multi-Batch OCR")
+    parser.add_argument("--engine", choices=["threads", "async"], default=ENGINE,
+                        help="Verarbeitungs-Engine (Standard: %(default)s)")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="Maximal gleichzeitige Requests (Standard: CONCURRENCY_MAX bzw. "
+                             "ASYNC_CONCURRENCY; mit --fixed: MAX_WORKERS)")
+    parser.add_argument("--per-batch", action="store_true",
+                        help="Batch-Ordner nacheinander statt über eine gemeinsame Warteschlange")
+    parser.add_argument("--cards-per-request", type=int, default=CARDS_PER_REQUEST,
+                        help="Karten pro Request; Prompt wird nur einmal gesendet (Standard: %(default)s)")
+    parser.add_argument("--no-schema", action="store_true",
+                        help="Kein JSON-Schema (response_format) mitsenden")
+    parser.add_argument("--hedge", action="store_true",
+                        help=f"Hängende Requests ab p{HEDGE_QUANTILE} doppelt senden "
+                             f"(max. {HEDGE_MAX_PERCENT}%% zusätzliche Requests)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Antworten als Stream (SSE) lesen: Zeit bis zum ersten Token "
+                             "messen, Abbruch sobald das JSON vollständig ist")
+    parser.add_argument("--preprocess", action="store_true",
+                        help="Bilder vor dem Upload verkleinern (benötigt Pillow)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Antwort-Cache nicht verwenden (jede Karte erneut anfragen)")
+    parser.add_argument("--store", action="store_true",
+                        help="Ergebnisse in SQLite statt als JSON-Datei pro Karte speichern")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="OpenMetrics-Endpoint auf localhost:PORT/metrics bereitstellen")
+    parser.add_argument("--trace", action="store_true",
+                        help=f"Stufen pro Karte als Chrome-Trace nach {TRACE_FILE} schreiben")
+    parser.add_argument("--fixed", action="store_true",
+                        help="Feste Parallelität statt adaptiver AIMD-Steuerung")
+    parser.add_argument("--pattern", default=BATCH_PATTERN,
+                        help="Muster für Batch-Ordner (Standard: %(default)s)")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        process_all_batches()
+        process_all_batches(engine=args.engine, max_concurrency=args.concurrency,
+                            batch_pattern=args.pattern,
+                            adaptive=ADAPTIVE_CONCURRENCY and not args.fixed,
+                            scheduler="per_batch" if args.per_batch else SCHEDULER,
+                            preprocess=PREPROCESS_IMAGES or args.preprocess,
+                            use_cache=RESPONSE_CACHE and not args.no_cache,
+                            use_store=RESULTS_STORE or args.store,
+                            metrics_port=args.metrics_port,
+                            trace_cards=TRACE or args.trace,
+                            cards_per_request=args.cards_per_request,
+                            schema=STRUCTURED_OUTPUT and not args.no_schema,
+                            hedge=HEDGE_REQUESTS or args.hedge,
+                            stream=STREAM_RESPONSES or args.stream)
     except KeyboardInterrupt:
         print("\n\n⏸️  Verarbeitung abgebrochen durch Benutzer.")
         print("💾 Fortschritt wurde gespeichert. Beim nächsten Start wird fortgesetzt.")
@@ -624,3 +2330,11 @@ if __name__ == "__main__":
         print(f"\n❌ Kritischer Fehler: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        # Ausstehende Zeilen des Ergebnisspeichers nicht verlieren
+        close_results_store()
+        close_metrics()
+        close_tracing()
+        close_usage_log()
+        close_hedging()
+        close_preprocessing()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Adaptive Parallelität (AIMD) für die VLM-Aufrufe
+Erhöht die Anzahl gleichzeitiger Requests schrittweise (additive increase)
+und halbiert sie bei 429, 5xx, Timeouts oder steigender p95-Latenz
+(multiplicative decrease). So bleibt ein Nachtlauf nahe am tatsächlichen
+Limit des Anbieters, ohne MAX_WORKERS pro Endpoint von Hand einzustellen.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime
+from threading import Condition
+
+# Ergebnis-Klassen für record()
+OK = "ok"
+THROTTLED = "throttled"          # HTTP 429
+SERVER_ERROR = "server_error"    # HTTP 5xx
+TIMEOUT = "timeout"              # Timeout / Verbindungsfehler
+
+
+def classify_status(status_code):
+    """Ordnet einen HTTP-Statuscode einer Ergebnis-Klasse zu."""
+    if status_code == 429:
+        return THROTTLED
+    if status_code >= 500:
+        return SERVER_ERROR
+    return OK
+
+
+def percentile(values, pct):
+    """Einfaches Perzentil (nearest rank) für kleine Listen."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class AIMDController:
+    """
+    Begrenzt die Zahl gleichzeitiger Requests und passt das Limit laufend an.
+
+    - Nach ``limit`` erfolgreichen Requests in Folge: Limit + ``increase``
+    - Bei 429 / 5xx / Timeout: Limit * ``decrease_factor``
+    - Wenn die p95-Latenz über ``latency_tolerance`` x Basislinie steigt:
+      Limit * ``decrease_factor``
+
+    Ist ``min_limit == max_limit``, arbeitet der Controller mit fester
+    Parallelität (entspricht dem bisherigen MAX_WORKERS-Verhalten).
+    """
+
+    def __init__(self, initial=5, min_limit=1, max_limit=32, increase=1,
+                 decrease_factor=0.5, latency_tolerance=2.0, window=50,
+                 cooldown=5.0, log_file=None):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.window = window
+        self.cooldown = cooldown
+        self.log_file = log_file
+
+        self._cond = Condition()
+        self._limit = max(min_limit, min(initial, max_limit))
+        self._in_flight = 0
+        self._successes = 0
+        self._latencies = deque(maxlen=window)
+        self._samples_since_eval = 0
+        self._baseline_p95 = None
+        self._last_decrease = 0.0
+        self.history = [(time.time(), self._limit, "start")]
+
+    @property
+    def limit(self):
+        return self._limit
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    @property
+    def adaptive(self):
+        return self.min_limit < self.max_limit
+
+    def configure(self, initial, min_limit, max_limit):
+        """Setzt Grenzen und Startwert neu (z.B. per Kommandozeile)."""
+        with self._cond:
+            self.min_limit = min_limit
+            self.max_limit = max_limit
+            self._limit = max(min_limit, min(initial, max_limit))
+            self.history.append((time.time(), self._limit, "config"))
+            self._cond.notify_all()
+
+    # === SLOTS ===
+
+    def acquire(self):
+        """Blockiert, bis ein Slot unterhalb des aktuellen Limits frei ist."""
+        with self._cond:
+            while self._in_flight >= self._limit:
+                self._cond.wait()
+            self._in_flight += 1
+
+    def try_acquire(self):
+        with self._cond:
+            if self._in_flight < self._limit:
+                self._in_flight += 1
+                return True
+            return False
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def async_slot(self, poll_interval=0.05):
+        """Slot für die asyncio-Engine (ohne die Event-Loop zu blockieren)."""
+        while not self.try_acquire():
+            await asyncio.sleep(poll_interval)
+        try:
+            yield
+        finally:
+            self.release()
+
+    # === ANPASSUNG ===
+
+    def record(self, latency, outcome=OK):
+        """Meldet das Ergebnis eines Requests und passt das Limit an."""
+        if not self.adaptive:
+            return
+
+        with self._cond:
+            now = time.time()
+
+            if outcome != OK:
+                self._successes = 0
+                self._decrease(now, outcome)
+                return
+
+            self._latencies.append(latency)
+            self._successes += 1
+            self._samples_since_eval += 1
+
+            if self._samples_since_eval >= self.window:
+                self._samples_since_eval = 0
+                p95 = percentile(self._latencies, 95)
+                if self._baseline_p95 is None:
+                    self._baseline_p95 = p95
+                elif p95 > self.latency_tolerance * self._baseline_p95:
+                    self._decrease(now, f"p95 {p95:.1f}s")
+                    self._latencies.clear()
+                    return
+                else:
+                    # Basislinie folgt langsam nach oben, sofort nach unten
+                    self._baseline_p95 = min(p95, self._baseline_p95 * 1.05)
+
+            if self._successes >= self._limit and self._limit < self.max_limit:
+                self._successes = 0
+                self._set_limit(min(self.max_limit, self._limit + self.increase), "increase")
+
+    def _decrease(self, now, reason):
+        # Eine Drosselung pro Cooldown: ein 429-Schwall halbiert nur einmal
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        new_limit = max(self.min_limit, int(self._limit * self.decrease_factor))
+        if new_limit != self._limit:
+            self._set_limit(new_limit, reason)
+
+    def _set_limit(self, new_limit, reason):
+        old_limit = self._limit
+        self._limit = new_limit
+        self.history.append((time.time(), new_limit, reason))
+        self._cond.notify_all()
+
+        p95 = percentile(self._latencies, 95)
+        if reason != "increase":
+            print(f"     🎚️  Parallelität: {old_limit} → {new_limit} ({reason})")
+        self._write_log(new_limit, reason, p95)
+
+    def _write_log(self, limit, reason, p95):
+        """Hängt die Änderung an die Verlaufs-CSV an."""
+        if not self.log_file:
+            return
+        write_header = not os.path.exists(self.log_file)
+        with open(self.log_file, "a", encoding="utf-8") as f:
+            if write_header:
+                f.write("timestamp,limit,in_flight,p95_seconds,reason\n")
+            p95_text = f"{p95:.3f}" if p95 is not None else ""
+            f.write(f"{datetime.now().isoformat()},{limit},{self._in_flight},{p95_text},{reason}\n")
+
+    def summary(self):
+        """Kurzüberblick über den Verlauf des Limits."""
+        limits = [limit for _, limit, _ in self.history]
+        decreases = sum(1 for _, _, reason in self.history
+                        if reason not in ("start", "config", "increase"))
+        return {
+            "current": self._limit,
+            "min": min(limits),
+            "max": max(limits),
+            "decreases": decreases
+        }
@@ -5,16 +5,207 @@ Generiert Statistiken und Qualitätsberichte
 """
 
 import pandas as pd
+import hashlib
 import json
+import os
+import parquet_store
 from pathlib import Path
 from collections import Counter
-import re
 
 # Konfiguration
 CSV_FILE = "output_batches/metadata_vlm_complete.csv"
 OUTPUT_DIR = "output_batches/analysis"
 
-def analyze_ocr_results(csv_path):
+FIELDS = ["Komponist", "Signatur", "Titel", "Textanfang", 
+          "Verlag", "Material", "Textdichter", "Bearbeiter", "Bemerkungen"]
+
+def normalize_fields(df, fields=FIELDS):
+    """
+    Einmaliger Normalisierungsdurchgang über alle Felder.
+    Liefert (text, filled): bereinigte Strings und die boolesche
+    "nicht leer"-Matrix, aus der alle Statistiken abgeleitet werden.
+    """
+    text = df.reindex(columns=fields).fillna('').astype(str)
+    text = text.apply(lambda column: column.str.strip())
+    filled = text.ne('')
+    return text, filled
+
+def record_quality(filled):
+    """Anzahl gefüllter Felder pro Karte und Maske der komplett leeren Karten."""
+    field_counts = filled.sum(axis=1)
+    all_empty = field_counts == 0
+    return field_counts, all_empty
+
+def batch_statistics(df, filled):
+    """Karten und gefüllte Kernfelder pro Batch (vektorisiert)."""
+    batch_stats = filled[['Komponist', 'Signatur', 'Titel']].groupby(df['Batch']).sum()
+    batch_stats.insert(0, 'Total', df.groupby('Batch')['Datei'].count())
+    return batch_stats.rename(columns={
+        'Komponist': 'Mit_Komponist',
+        'Signatur': 'Mit_Signatur',
+        'Titel': 'Mit_Titel'
+    })
+
+# === PRO-BATCH-TEILERGEBNISSE (CACHE) ===
+
+CACHE_FILENAME = "batch_cache.json"  # liegt in OUTPUT_DIR
+CACHE_VERSION = 2
+
+SIGNATUR_PATTERNS = {
+    'Spez': r'^Spez\.\d+\.\d+',
+    'TOB': r'^TOB\s+\d+',
+    'RTSO': r'^RTSO\s+\d+',
+    'RTOB': r'^RTOB\s+\d+'
+}
+
+LENGTH_FIELDS = ['Titel', 'Textanfang', 'Bemerkungen']
+
+def batch_hashes(df, fields=FIELDS):
+    """Inhalts-Hash pro Batch (über Datei + alle Felder)."""
+    columns = df.reindex(columns=["Datei", "Batch"] + fields).fillna('').astype(str)
+    row_hashes = pd.util.hash_pandas_object(columns, index=False)
+    hashes = {}
+    for batch, positions in columns.groupby('Batch').indices.items():
+        hashes[batch] = hashlib.sha1(row_hashes.values[positions].tobytes()).hexdigest()
+    return hashes
+
+def _cell(value):
+    return "" if pd.isna(value) else str(value)
+
+def compute_batch_partials(df, fields=FIELDS):
+    """
+    Zählt alle Kennzahlen pro Batch (mergebar): Feldfüllung, Qualitätsklassen,
+    Signatur-Muster, Komponisten-Zähler, Textlängen (Anzahl/Summe/Min/Max)
+    sowie die auffälligen Karten.
+    """
+    if df.empty:
+        return {}
+    
+    text, filled = normalize_fields(df, fields)
+    field_counts, all_empty = record_quality(filled)
+    batch = df['Batch']
+    
+    filled_counts = filled.groupby(batch).sum()
+    stats = batch_statistics(df, filled)
+    quality = pd.DataFrame({
+        'empty': all_empty,
+        'sparse': (field_counts <= 2) & ~all_empty,
+        'complete': field_counts >= 6
+    }).groupby(batch).sum()
+    
+    valid_sig = text['Signatur'][filled['Signatur']]
+    sig_batch = batch[filled['Signatur']]
+    pattern_counts = pd.DataFrame(
+        {name: valid_sig.str.match(pattern) for name, pattern in SIGNATUR_PATTERNS.items()}
+    ).groupby(sig_batch).sum()
+    
+    valid_komp = text['Komponist'][filled['Komponist']]
+    komp_counts = valid_komp.groupby(batch[filled['Komponist']]).value_counts()
+    
+    # Textlängen wie bisher über die ungekürzten Werte (inkl. Leerzeichen)
+    raw = df.reindex(columns=LENGTH_FIELDS).fillna('').astype(str)
+    lengths = {}
+    for field in LENGTH_FIELDS:
+        field_lengths = raw[field].str.len()
+        non_zero = field_lengths[field_lengths > 0]
+        lengths[field] = non_zero.groupby(batch[field_lengths > 0]).agg(['count', 'sum', 'min', 'max'])
+    
+    problematic_mask = field_counts <= 2
+    missing_mask = ~filled['Signatur']
+    missing_cols = df.reindex(columns=['Datei', 'Batch', 'Komponist', 'Titel'])
+    
+    partials = {}
+    for name in stats.index:
+        partial = {
+            'rows': int(stats.loc[name, 'Total']),
+            'filled': {field: int(filled_counts.loc[name, field]) for field in fields},
+            'batch_stats': {column: int(stats.loc[name, column]) for column in stats.columns},
+            'quality': {key: int(quality.loc[name, key]) for key in quality.columns},
+            'signatur_valid': 0,
+            'signatur_patterns': {key: 0 for key in SIGNATUR_PATTERNS},
+            'komponisten': {},
+            'lengths': {},
+            'problematic': [],
+            'missing_signatures': []
+        }
+        if name in pattern_counts.index:
+            partial['signatur_valid'] = int((sig_batch == name).sum())
+            partial['signatur_patterns'] = {key: int(pattern_counts.loc[name, key])
+                                            for key in SIGNATUR_PATTERNS}
+        if name in komp_counts.index.get_level_values(0):
+            partial['komponisten'] = {k: int(v) for k, v in komp_counts.loc[name].items()}
+        for field, agg in lengths.items():
+            if name in agg.index:
+                row = agg.loc[name]
+                partial['lengths'][field] = {key: int(row[key]) for key in ('count', 'sum', 'min', 'max')}
+        partials[name] = partial
+    
+    for mask, key, columns in ((problematic_mask, 'problematic', ['Datei', 'Batch']),
+                               (missing_mask, 'missing_signatures', ['Datei', 'Batch', 'Komponist', 'Titel'])):
+        for row in missing_cols.loc[mask, columns].itertuples(index=False):
+            partials[row.Batch][key].append([_cell(value) for value in row])
+    
+    return partials
+
+def merge_partials(partials, fields=FIELDS):
+    """Fasst die Teilergebnisse aller Batches zum Gesamtergebnis zusammen."""
+    totals = {
+        'rows': 0,
+        'batch_rows': {},
+        'filled': {field: 0 for field in fields},
+        'batch_stats': {},
+        'quality': {'empty': 0, 'sparse': 0, 'complete': 0},
+        'signatur_valid': 0,
+        'signatur_patterns': {key: 0 for key in SIGNATUR_PATTERNS},
+        'komponisten': Counter(),
+        'lengths': {},
+        'problematic': [],
+        'missing_signatures': []
+    }
+    for name in sorted(partials):
+        partial = partials[name]
+        totals['rows'] += partial['rows']
+        totals['batch_rows'][name] = partial['rows']
+        totals['batch_stats'][name] = partial['batch_stats']
+        for field in fields:
+            totals['filled'][field] += partial['filled'].get(field, 0)
+        for key in totals['quality']:
+            totals['quality'][key] += partial['quality'][key]
+        totals['signatur_valid'] += partial['signatur_valid']
+        for key in SIGNATUR_PATTERNS:
+            totals['signatur_patterns'][key] += partial['signatur_patterns'][key]
+        totals['komponisten'].update(partial['komponisten'])
+        for field, agg in partial['lengths'].items():
+            merged = totals['lengths'].get(field)
+            if merged is None:
+                totals['lengths'][field] = dict(agg)
+            else:
+                merged['count'] += agg['count']
+                merged['sum'] += agg['sum']
+                merged['min'] = min(merged['min'], agg['min'])
+                merged['max'] = max(merged['max'], agg['max'])
+        totals['problematic'].extend(partial['problematic'])
+        totals['missing_signatures'].extend(partial['missing_signatures'])
+    return totals
+
+def load_partials_cache(path, fields=FIELDS):
+    """Lädt die gespeicherten Teilergebnisse ({batch: {"hash", "partial"}})."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get('version') != CACHE_VERSION or cache.get('fields') != fields:
+        return {}
+    return cache.get('batches', {})
+
+def save_partials_cache(batches, path, fields=FIELDS):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': CACHE_VERSION, 'fields': fields, 'batches': batches}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def analyze_ocr_results(csv_path, use_cache=True):
     """Analysiert die OCR-Ergebnisse und erstellt einen Bericht."""
     
     Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
@@ -22,16 +213,36 @@ def analyze_ocr_results(csv_path):
     print("📊 ANALYSE DER OCR-ERGEBNISSE")
     print("=" * 80)
     
-    # Lade Daten
-    df = pd.read_csv(csv_path, encoding="utf-8-sig")
-    total_cards = len(df)
+    fields = FIELDS
+    
+    # Lade Daten (Parquet-Datensatz neben der CSV bevorzugt, nur benötigte Spalten)
+    df = parquet_store.load_metadata(csv_path, columns=["Datei", "Batch"] + fields)
+    # Karten ohne Batch als eigener (leerer) Batch, sonst fehlen sie in den Summen
+    df['Batch'] = df['Batch'].fillna('')
+
+    # Nur Batches mit geändertem Inhalt neu auswerten, Rest aus dem Cache
+    cache_path = f"{OUTPUT_DIR}/{CACHE_FILENAME}"
+    hashes = batch_hashes(df, fields)
+    cached = load_partials_cache(cache_path, fields) if use_cache else {}
+    changed = [name for name, digest in hashes.items()
+               if cached.get(name, {}).get('hash') != digest]
+    
+    partials = {name: cached[name]['partial'] for name in hashes if name not in changed}
+    partials.update(compute_batch_partials(df[df['Batch'].isin(changed)], fields))
+    
+    save_partials_cache({name: {'hash': hashes[name], 'partial': partials[name]}
+                         for name in hashes}, cache_path, fields)
+    print(f"♻️  {len(hashes) - len(changed)} Batches aus dem Cache, {len(changed)} neu ausgewertet")
+    
+    totals = merge_partials(partials, fields)
+    total_cards = totals['rows']
     
     print(f"\n📚 Gesamt-Karteikarten: {total_cards:,}\n")
     
     # === BATCH-VERTEILUNG ===
     print("📦 BATCH-VERTEILUNG")
     print("-" * 80)
-    batch_counts = df['Batch'].value_counts().sort_index()
+    batch_counts = pd.Series(totals['batch_rows'], dtype=int)
     print(f"Anzahl Batches: {len(batch_counts)}")
     print(f"Durchschnitt pro Batch: {batch_counts.mean():.1f}")
     print(f"Min/Max: {batch_counts.min()} / {batch_counts.max()}\n")
@@ -40,14 +251,10 @@ def analyze_ocr_results(csv_path):
     print("✓ VOLLSTÄNDIGKEIT DER FELDER")
     print("-" * 80)
     
-    fields = ["Komponist", "Signatur", "Titel", "Textanfang", 
-              "Verlag", "Material", "Textdichter", "Bearbeiter", "Bemerkungen"]
-    
     completeness = {}
     for field in fields:
         if field in df.columns:
-            filled = df[field].notna().sum()
-            non_empty = (df[field].fillna('').str.strip() != '').sum()
+            non_empty = totals['filled'][field]
             percentage = (non_empty / total_cards) * 100
             completeness[field] = {
                 'count': non_empty,
@@ -60,39 +267,22 @@ def analyze_ocr_results(csv_path):
     print("-" * 80)
     
     if 'Signatur' in df.columns:
-        signaturen = df['Signatur'].fillna('').str.strip()
-        valid_signaturen = signaturen[signaturen != '']
-        
-        # Analysiere Signatur-Muster
-        patterns = {
-            'Spez': r'^Spez\.\d+\.\d+',
-            'TOB': r'^TOB\s+\d+',
-            'RTSO': r'^RTSO\s+\d+',
-            'RTOB': r'^RTOB\s+\d+',
-            'Andere': r'.'
-        }
-        
-        pattern_counts = {}
-        for name, pattern in patterns.items():
-            if name == 'Andere':
-                count = len(valid_signaturen) - sum(pattern_counts.values())
-            else:
-                count = valid_signaturen.str.match(pattern).sum()
-            pattern_counts[name] = count
-            print(f"{name:10s}: {count:6,} ({count/len(valid_signaturen)*100:5.1f}%)")
+        valid_count = totals['signatur_valid']
+        pattern_counts = dict(totals['signatur_patterns'])
+        pattern_counts['Andere'] = valid_count - sum(pattern_counts.values())
+        for name, count in pattern_counts.items():
+            share = count / valid_count * 100 if valid_count else 0.0
+            print(f"{name:10s}: {count:6,} ({share:5.1f}%)")
     
     # === KOMPONISTEN-ANALYSE ===
     print(f"\n👤 KOMPONISTEN-ANALYSE")
     print("-" * 80)
     
+    komponisten = totals['komponisten']
     if 'Komponist' in df.columns:
-        komponisten = df['Komponist'].fillna('').str.strip()
-        valid_komponisten = komponisten[komponisten != '']
-        
-        print(f"Einzigartige Komponisten: {valid_komponisten.nunique():,}")
+        print(f"Einzigartige Komponisten: {len(komponisten):,}")
         print(f"\nTop 10 häufigste Komponisten:")
-        top_komponisten = valid_komponisten.value_counts().head(10)
-        for i, (name, count) in enumerate(top_komponisten.items(), 1):
+        for i, (name, count) in enumerate(komponisten.most_common(10), 1):
             print(f"  {i:2d}. {name:40s} {count:4d} Karten")
     
     # === QUALITÄTSPRÜFUNG ===
@@ -100,29 +290,25 @@ def analyze_ocr_results(csv_path):
     print("-" * 80)
     
     # Leere Datensätze (alle Felder leer)
-    all_empty = df[fields].fillna('').apply(lambda row: all(str(val).strip() == '' for val in row), axis=1)
-    empty_count = all_empty.sum()
+    empty_count = totals['quality']['empty']
     print(f"Komplett leere Datensätze: {empty_count:,} ({empty_count/total_cards*100:.1f}%)")
     
     # Datensätze mit nur 1-2 Feldern
-    field_counts = df[fields].fillna('').apply(lambda row: sum(str(val).strip() != '' for val in row), axis=1)
-    sparse_count = (field_counts <= 2).sum() - empty_count
+    sparse_count = totals['quality']['sparse']
     print(f"Spärliche Datensätze (1-2 Felder): {sparse_count:,} ({sparse_count/total_cards*100:.1f}%)")
     
     # Vollständige Datensätze (>=6 Felder)
-    complete_count = (field_counts >= 6).sum()
+    complete_count = totals['quality']['complete']
     print(f"Vollständige Datensätze (≥6 Felder): {complete_count:,} ({complete_count/total_cards*100:.1f}%)")
     
     # === TEXTLÄNGEN ===
     print(f"\n📏 TEXTLÄNGEN-STATISTIK")
     print("-" * 80)
     
-    for field in ['Titel', 'Textanfang', 'Bemerkungen']:
-        if field in df.columns:
-            lengths = df[field].fillna('').str.len()
-            non_zero = lengths[lengths > 0]
-            if len(non_zero) > 0:
-                print(f"{field:15s}: Ø {non_zero.mean():5.1f} Zeichen (Min: {non_zero.min()}, Max: {non_zero.max()})")
+    for field in LENGTH_FIELDS:
+        agg = totals['lengths'].get(field)
+        if field in df.columns and agg and agg['count'] > 0:
+            print(f"{field:15s}: Ø {agg['sum'] / agg['count']:5.1f} Zeichen (Min: {agg['min']}, Max: {agg['max']})")
     
     # === SPEICHERE DETAILLIERTE BERICHTE ===
     
@@ -131,23 +317,14 @@ def analyze_ocr_results(csv_path):
     completeness_df.to_csv(f"{OUTPUT_DIR}/field_completeness.csv", encoding="utf-8-sig")
     
     # 2. Batch-Statistiken
-    batch_stats = df.groupby('Batch').agg({
-        'Datei': 'count',
-        'Komponist': lambda x: (x.fillna('').str.strip() != '').sum(),
-        'Signatur': lambda x: (x.fillna('').str.strip() != '').sum(),
-        'Titel': lambda x: (x.fillna('').str.strip() != '').sum()
-    }).rename(columns={
-        'Datei': 'Total',
-        'Komponist': 'Mit_Komponist',
-        'Signatur': 'Mit_Signatur',
-        'Titel': 'Mit_Titel'
-    })
+    batch_stats = pd.DataFrame.from_dict(totals['batch_stats'], orient='index')
+    batch_stats.index.name = 'Batch'
     batch_stats.to_csv(f"{OUTPUT_DIR}/batch_statistics.csv", encoding="utf-8-sig")
     
     # 3. Problematische Datensätze
-    problematic = df[all_empty | (field_counts <= 2)]
+    problematic = pd.DataFrame(totals['problematic'], columns=['Datei', 'Batch'])
     if len(problematic) > 0:
-        problematic[['Datei', 'Batch']].to_csv(
+        problematic.to_csv(
             f"{OUTPUT_DIR}/problematic_cards.csv", 
             index=False, 
             encoding="utf-8-sig"
@@ -156,7 +333,8 @@ def analyze_ocr_results(csv_path):
     
     # 4. Komponisten-Liste
     if 'Komponist' in df.columns:
-        komponisten_freq = valid_komponisten.value_counts()
+        komponisten_freq = pd.Series(dict(komponisten.most_common()), name='Anzahl', dtype=int)
+        komponisten_freq.index.name = 'Komponist'
         komponisten_freq.to_csv(
             f"{OUTPUT_DIR}/komponisten_frequency.csv",
             header=['Anzahl'],
@@ -164,7 +342,8 @@ def analyze_ocr_results(csv_path):
         )
     
     # 5. Fehlende Signaturen
-    missing_sig = df[df['Signatur'].fillna('').str.strip() == ''][['Datei', 'Batch', 'Komponist', 'Titel']]
+    missing_sig = pd.DataFrame(totals['missing_signatures'],
+                               columns=['Datei', 'Batch', 'Komponist', 'Titel'])
     if len(missing_sig) > 0:
         missing_sig.to_csv(
             f"{OUTPUT_DIR}/missing_signatures.csv",
@@ -186,10 +365,13 @@ def analyze_ocr_results(csv_path):
 if __name__ == "__main__":
     import sys
     
-    csv_file = sys.argv[1] if len(sys.argv) > 1 else CSV_FILE
+    # --rebuild: Teilergebnis-Cache ignorieren und alle Batches neu auswerten
+    rebuild = "--rebuild" in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != "--rebuild"]
+    csv_file = args[0] if args else CSV_FILE
     
     try:
-        analyze_ocr_results(csv_file)
+        analyze_ocr_results(csv_file, use_cache=not rebuild)
     except FileNotFoundError:
         print(f"❌ CSV-Datei nicht gefunden: {csv_file}")
         print(f"   Bitte erst die OCR-Verarbeitung ausführen.")
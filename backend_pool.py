@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Mehrere VLM-Backends (OpenRouter, OpenWebUI, lokales Ollama, ...) als Pool
+Jedes Backend hat eigene URL, Modellnamen, API-Key, Obergrenze gleichzeitiger
+Requests, Gewicht, Schutzschalter und Rate-Limiter. Jeder Request geht an
+das Backend mit der besten Aussicht, schnell zu antworten:
+
+    Bewertung = Latenz (EWMA) × (laufende Requests + 1) / (Obergrenze × Gewicht)
+                / (1 - Fehlerquote (EWMA))
+
+Ausgelastete Backends (Obergrenze erreicht) und gestörte (Schutzschalter
+offen) werden übersprungen, pausierte (429 / Retry-After) nur gewählt,
+wenn kein anderes frei ist. Backends ohne Messwert gelten als so schnell
+wie das schnellste gemessene, damit neue Backends ausprobiert werden.
+"""
+
+import asyncio
+from threading import Condition
+
+# Gewichtung neuer Messwerte in den gleitenden Mittelwerten
+EWMA_ALPHA = 0.2
+# Abfrageintervall, solange kein Backend frei ist (Sekunden)
+POLL_INTERVAL = 0.1
+
+
+class Backend:
+    """Ein Endpoint mit eigenem Modell, Key, Limits und Laufzeitstatistik."""
+
+    def __init__(self, name, url, model, api_key=None, max_concurrency=None, weight=1.0,
+                 breaker=None, limiter=None):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.weight = weight
+        self.breaker = breaker
+        self.limiter = limiter
+
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0            # 5xx, Timeout, Verbindung
+        self.throttled = 0           # 429
+        self.latency = None          # EWMA der Antwortzeit (Sekunden)
+        self.error_rate = 0.0        # EWMA der Fehlschläge (inkl. 429)
+        self.busy_seconds = 0.0
+
+    @property
+    def saturated(self):
+        return self.max_concurrency is not None and self.in_flight >= self.max_concurrency
+
+    @property
+    def paused(self):
+        return self.limiter is not None and self.limiter.pause_remaining() > 0
+
+    def score(self, default_latency):
+        """Erwartete Wartezeit relativ zu den anderen Backends (kleiner = besser)."""
+        latency = self.latency if self.latency is not None else default_latency
+        capacity = (self.max_concurrency or 1) * self.weight
+        return latency * (self.in_flight + 1) / capacity / max(0.05, 1.0 - self.error_rate)
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "model": self.model,
+            "requests": self.requests,
+            "failures": self.failures,
+            "throttled": self.throttled,
+            "latency": self.latency,
+            "error_rate": self.error_rate,
+            "busy_seconds": self.busy_seconds,
+            "breaker": self.breaker.state if self.breaker is not None else None
+        }
+
+
+class BackendPool:
+    """Thread-sichere Auswahl des Backends für jeden Request."""
+
+    def __init__(self, backends):
+        if not backends:
+            raise ValueError("Der Backend-Pool braucht mindestens ein Backend")
+        self.backends = list(backends)
+        self._cond = Condition()
+
+    def __len__(self):
+        return len(self.backends)
+
+    def __iter__(self):
+        return iter(self.backends)
+
+    @property
+    def all_open(self):
+        """True, wenn bei allen Backends der Schutzschalter offen ist."""
+        return all(backend.breaker is not None and backend.breaker.is_open
+                   for backend in self.backends)
+
+    def _ranked(self, exclude):
+        """
+        Nicht ausgelastete Backends, beste zuerst; bereits versuchte
+        (``exclude``) und pausierte nur als Notlösung.
+        """
+        free = [backend for backend in self.backends if not backend.saturated]
+        measured = [backend.latency for backend in self.backends if backend.latency is not None]
+        default_latency = min(measured) if measured else 1.0
+        free.sort(key=lambda backend: (backend in exclude, backend.paused,
+                                       backend.score(default_latency)))
+        return free
+
+    def _try_acquire_locked(self, exclude):
+        for backend in self._ranked(exclude):
+            probe = False
+            if backend.breaker is not None:
+                allowed, probe = backend.breaker.try_acquire()
+                if not allowed:
+                    continue
+            backend.in_flight += 1
+            return backend, probe
+        return None
+
+    def has_available(self, exclude=()):
+        """
+        True, wenn ein Backend außerhalb von ``exclude`` nicht ausgelastet und
+        nicht gestört ist (eine Rate-Limit-Pause verzögert nur).
+        """
+        with self._cond:
+            return any(backend not in exclude
+                       and not (backend.breaker is not None and backend.breaker.is_open)
+                       for backend in self._ranked(exclude))
+
+    def try_acquire(self, exclude=()):
+        """Reserviert das beste freie Backend; liefert (Backend, Probe) oder None."""
+        with self._cond:
+            return self._try_acquire_locked(exclude)
+
+    def acquire(self, exclude=()):
+        """Blockiert, bis ein Backend frei ist; liefert (Backend, Probe)."""
+        with self._cond:
+            while True:
+                chosen = self._try_acquire_locked(exclude)
+                if chosen is not None:
+                    return chosen
+                self._cond.wait(POLL_INTERVAL)
+
+    async def acquire_async(self, exclude=(), poll_interval=POLL_INTERVAL):
+        """Wie acquire(), ohne die Event-Loop zu blockieren."""
+        while True:
+            chosen = self.try_acquire(exclude)
+            if chosen is not None:
+                return chosen
+            await asyncio.sleep(poll_interval)
+
+    def release(self, backend, latency=None, healthy=None, throttled=False, probe=False):
+        """
+        Gibt das Backend frei und verbucht das Ergebnis: ``healthy`` wie bei
+        CircuitBreaker.record (None = ohne Aussage, z.B. Abbruch vor dem Versand).
+        """
+        with self._cond:
+            backend.in_flight -= 1
+            if healthy is not None:
+                backend.requests += 1
+                failed = healthy is False or throttled
+                backend.failures += healthy is False
+                backend.throttled += throttled
+                backend.error_rate += EWMA_ALPHA * (failed - backend.error_rate)
+                if latency is not None:
+                    backend.busy_seconds += latency
+                    if healthy and not throttled:
+                        backend.latency = (latency if backend.latency is None else
+                                           backend.latency + EWMA_ALPHA * (latency - backend.latency))
+            self._cond.notify_all()
+        if backend.breaker is not None:
+            backend.breaker.record(healthy, probe)
+
+    def stats(self):
+        with self._cond:
+            return [backend.stats() for backend in self.backends]
+
+
+def format_backend_stats(stats):
+    """Eine Zeile pro Backend für die Konsolenausgabe."""
+    total = sum(entry["requests"] for entry in stats) or 1
+    lines = []
+    for entry in stats:
+        latency = f"Ø {entry['latency']:.2f}s" if entry["latency"] is not None else "Ø –"
+        lines.append(f"{entry['name']} ({entry['model']}): {entry['requests']} Requests "
+                     f"({entry['requests'] / total:.0%}) | {latency} | "
+                     f"{entry['failures']} Ausfälle | {entry['throttled']} × 429")
+    return lines
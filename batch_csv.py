@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Streamender CSV-Writer für die Batch-CSVs
+Jede fertige Karte wird sofort an eine Teildatei (``<batch>.csv.part``)
+angehängt und regelmäßig geflusht, statt alle Datensätze bis zum Ende des
+Ordners im Speicher zu halten. Nach dem letzten Bild wird die Batch-CSV
+atomar ersetzt (temporäre Datei + rename).
+"""
+
+import csv
+import os
+import time
+
+
+def csv_columns(field_keys):
+    """Feste Spaltenreihenfolge der Batch-CSVs (aus FIELD_KEYS)."""
+    return ["Datei", "Batch", "Signatur", "Komponist"] + \
+           [k for k in field_keys if k not in ["Signatur", "Komponist"]]
+
+
+def _as_cell(value):
+    return "" if value is None else value
+
+
+class BatchCSVWriter:
+    """
+    Hängt Zeilen an die Teildatei eines Batches an.
+
+    Eine bei einem Abbruch liegengebliebene Teildatei wird beim nächsten Lauf
+    fortgesetzt; existiert nur eine fertige Batch-CSV (z.B. Batch mit
+    Fehlern, die jetzt nachverarbeitet werden), werden deren Zeilen
+    übernommen. Doppelte Dateien werden beim Abschluss entfernt (die
+    zuletzt geschriebene Zeile gewinnt).
+    """
+
+    def __init__(self, path, field_keys, flush_every=20, flush_interval=5.0):
+        self.path = path
+        self.part_path = path + ".part"
+        self.columns = csv_columns(field_keys)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+
+        self._file = None
+        self._writer = None
+        self._unflushed = 0
+        self._last_flush = time.time()
+        self._on_flush = []
+        self.rows_written = 0
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if os.path.exists(self.part_path):
+            # Abgeschnittene letzte Zeile nach einem Absturz entfernen
+            _truncate_to_last_newline(self.part_path)
+        if os.path.exists(self.part_path) and os.path.getsize(self.part_path) > 0:
+            self._file = open(self.part_path, "a", encoding="utf-8", newline="")
+            self._writer = csv.DictWriter(self._file, self.columns, extrasaction="ignore")
+            return
+
+        self._file = open(self.part_path, "w", encoding="utf-8-sig", newline="")
+        self._writer = csv.DictWriter(self._file, self.columns, extrasaction="ignore")
+        self._writer.writeheader()
+
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8-sig", newline="") as existing:
+                for row in csv.DictReader(existing):
+                    self._writer.writerow({column: row.get(column) or "" for column in self.columns})
+        self._file.flush()
+
+    def write_row(self, data, on_flush=None):
+        """
+        Hängt die Daten einer Karte an (Flush alle ``flush_every`` Zeilen).
+        ``on_flush`` wird aufgerufen, sobald die Zeile sicher auf der Platte
+        ist (z.B. der Checkpoint-Eintrag der Karte).
+        """
+        if self._file is None:
+            self._open()
+        self._writer.writerow({column: _as_cell(data.get(column)) for column in self.columns})
+        self.rows_written += 1
+        self._unflushed += 1
+        if on_flush is not None:
+            self._on_flush.append(on_flush)
+
+        if (self._unflushed >= self.flush_every
+                or time.time() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        if self._file is not None and self._unflushed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unflushed = 0
+            self._last_flush = time.time()
+        callbacks, self._on_flush = self._on_flush, []
+        for callback in callbacks:
+            callback()
+
+    def close(self):
+        """Schließt die Teildatei (bleibt für die Fortsetzung liegen)."""
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+            self._writer = None
+
+    def finalize(self):
+        """
+        Ersetzt die Batch-CSV atomar durch den Inhalt der Teildatei
+        (sortiert nach Datei, ohne Duplikate). Liefert die Zeilenzahl.
+        """
+        self.close()
+        if not os.path.exists(self.part_path):
+            return 0
+
+        rows = {}
+        with open(self.part_path, "r", encoding="utf-8-sig", newline="") as f:
+            for row in csv.DictReader(f):
+                if row.get("Datei"):
+                    rows[row["Datei"]] = row
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.DictWriter(f, self.columns, extrasaction="ignore")
+            writer.writeheader()
+            for filename in sorted(rows):
+                writer.writerow({column: rows[filename].get(column) or "" for column in self.columns})
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, self.path)
+        os.remove(self.part_path)
+        return len(rows)
+
+
+def _truncate_to_last_newline(path):
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            return
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) == b"\n":
+            return
+        # Rückwärts bis zum letzten Zeilenumbruch suchen
+        block = 4096
+        position = size
+        while position > 0:
+            start = max(0, position - block)
+            f.seek(start)
+            chunk = f.read(position - start)
+            index = chunk.rfind(b"\n")
+            if index != -1:
+                f.truncate(start + index + 1)
+                return
+            position = start
+        f.truncate(0)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark für die Qualitätsprüfungen in analyze_results.py
+Vergleicht die frühere zeilenweise Berechnung (DataFrame.apply pro Zeile,
+fillna/strip pro Kennzahl) mit der vektorisierten Variante auf Basis der
+"nicht leer"-Matrix – auf einem synthetischen DataFrame.
+
+Aufruf:
+    python benchmark_analyze_results.py [anzahl_zeilen]   (Standard: 100000)
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from analyze_results import FIELDS, normalize_fields, record_quality, batch_statistics
+
+
+def make_frame(rows, seed=42):
+    """Synthetische Ergebnisse: ~30% leere Felder, teils mit Leerzeichen, 500 Karten pro Batch."""
+    rng = np.random.default_rng(seed)
+    data = {
+        "Datei": [f"card_{i:06d}.jpg" for i in range(rows)],
+        "Batch": [f"batch_{i // 500 + 1:03d}" for i in range(rows)]
+    }
+    values = np.array(["Bach, Johann Sebastian", "Spez.12.433", "Ave Maria", "  ",
+                       "Breitkopf & Härtel", "Partitur", "Goethe", "", "Bemerkung"], dtype=object)
+    for field in FIELDS:
+        column = values[rng.integers(0, len(values), rows)]
+        mask = rng.random(rows) < 0.3
+        column = column.copy()
+        column[mask] = None
+        data[field] = column
+    return pd.DataFrame(data)
+
+
+def legacy_quality(df, fields=FIELDS):
+    """Frühere Berechnung aus analyze_results.py (zeilenweise)."""
+    completeness = {}
+    for field in fields:
+        completeness[field] = (df[field].fillna('').str.strip() != '').sum()
+
+    all_empty = df[fields].fillna('').apply(
+        lambda row: all(str(val).strip() == '' for val in row), axis=1)
+    field_counts = df[fields].fillna('').apply(
+        lambda row: sum(str(val).strip() != '' for val in row), axis=1)
+
+    batch_stats = df.groupby('Batch').agg({
+        'Datei': 'count',
+        'Komponist': lambda x: (x.fillna('').str.strip() != '').sum(),
+        'Signatur': lambda x: (x.fillna('').str.strip() != '').sum(),
+        'Titel': lambda x: (x.fillna('').str.strip() != '').sum()
+    })
+    missing_sig = df[df['Signatur'].fillna('').str.strip() == '']
+    return completeness, all_empty, field_counts, batch_stats, missing_sig
+
+
+def vectorized_quality(df, fields=FIELDS):
+    """Aktuelle Berechnung: ein Normalisierungsdurchgang, danach nur Spaltenoperationen."""
+    text, filled = normalize_fields(df, fields)
+    completeness = filled.sum()
+    field_counts, all_empty = record_quality(filled)
+    batch_stats = batch_statistics(df, filled)
+    missing_sig = df[~filled['Signatur']]
+    return completeness, all_empty, field_counts, batch_stats, missing_sig
+
+
+def timed(func, df, repeat=3):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark der Qualitätsprüfungen in analyze_results.py")
+    parser.add_argument("rows", type=int, nargs="?", default=100000,
+                        help="Zeilen des synthetischen DataFrames (Standard: %(default)s)")
+    rows = parser.parse_args().rows
+
+    print(f"⏱️  BENCHMARK analyze_results ({rows:,} Zeilen)")
+    print("=" * 80)
+    df = make_frame(rows)
+
+    legacy_time, legacy = timed(legacy_quality, df, repeat=1)
+    vector_time, vector = timed(vectorized_quality, df)
+
+    # Gleiche Ergebnisse?
+    same = (
+        all(int(legacy[0][field]) == int(vector[0][field]) for field in FIELDS)
+        and legacy[1].equals(vector[1])
+        and (legacy[2].values == vector[2].values).all()
+        and (legacy[3]['Komponist'].values == vector[3]['Mit_Komponist'].values).all()
+        and len(legacy[4]) == len(vector[4])
+    )
+
+    print(f"Zeilenweise (vorher):  {legacy_time:8.3f}s")
+    print(f"Vektorisiert (jetzt):  {vector_time:8.3f}s")
+    print(f"Beschleunigung:        {legacy_time / vector_time:8.1f}x")
+    print(f"Ergebnisse identisch:  {'✓' if same else '✗'}")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Offline-Benchmark der OCR-Pipeline gegen den lokalen Mock-Server
+Erzeugt synthetische Kartenordner, startet mock_vlm_server.py und lässt
+process_single_batch (→ call_vlm_api) für mehrere Worker-Zahlen laufen.
+Jeder Lauf läuft in einem eigenen Prozess, damit der Spitzen-Speicher
+(Peak RSS) pro Konfiguration gemessen wird.
+
+Beispiele:
+    python benchmark_pipeline.py --cards 300 --workers 5 10 20 40
+    python benchmark_pipeline.py --latency 3 --p429 0.05 --p5xx 0.02 --malformed 0.01
+    python benchmark_pipeline.py --engine async --workers 50 100 --csv bench.csv
+    python benchmark_pipeline.py --outage-at 50 --outage-seconds 5 --breaker-seconds 1
+    python benchmark_pipeline.py --backends 2 --workers 8 16   (ein Mock-Server pro Backend)
+    python benchmark_pipeline.py --sigma 1.0 --slow-body 0.03 --hedge   (Doppel-Requests)
+    python benchmark_pipeline.py --token-seconds 0.01 --trailing-text 0.3 --stream
+"""
+
+import argparse
+import contextlib
+import csv
+import importlib.util
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import mock_vlm_server
+from adaptive_concurrency import percentile
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+PIPELINE_SCRIPT = SCRIPT_DIR / "Lippmann-Rau_VLM_OCR_index_cards_MultiBatch.py"
+RESULT_PREFIX = "BENCH_RESULT "
+
+
+def make_cards(directory, count, image_kb):
+    """Synthetische 'Scans' (Zufallsbytes; der Mock-Server dekodiert nicht)."""
+    directory.mkdir(parents=True, exist_ok=True)
+    for i in range(count):
+        (directory / f"card_{i:05d}.jpg").write_bytes(os.urandom(image_kb * 1024))
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux: KB, macOS: Bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+# === EIN LAUF (Kindprozess) ===
+
+def load_pipeline(workdir):
+    """Importiert das Hauptskript mit workdir als Arbeitsverzeichnis (Ausgaben landen dort)."""
+    os.chdir(workdir)
+    spec = importlib.util.spec_from_file_location("ocr_pipeline", PIPELINE_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_once(options):
+    """Verarbeitet einen synthetischen Batch und liefert die Kennzahlen."""
+    pipeline = load_pipeline(options["workdir"])
+    import rate_limiter
+    import vlm_client
+
+    workers = options["workers"]
+    urls = options["urls"]
+    pipeline.API_ENDPOINT = urls[0]
+    pipeline.RETRY_DELAY = options["retry_delay"]
+    pipeline.api_client = vlm_client.VLMClient(urls[0], pool_size=workers, hosts=len(urls),
+                                               connect_timeout=pipeline.CONNECT_TIMEOUT,
+                                               read_timeout=pipeline.READ_TIMEOUT)
+    if options["rps"] is not None:
+        pipeline.api_rate_limiter = rate_limiter.RateLimiter(
+            requests_per_second=options["rps"] or None,
+            tokens_per_minute=pipeline.TOKENS_PER_MINUTE,
+            default_throttle_pause=options["retry_delay"])
+    pipeline.BREAKER_OPEN_SECONDS = options["breaker_seconds"]
+    pipeline.BREAKER_MAX_OPEN_SECONDS = options["breaker_seconds"] * 4
+    backends = []
+    if len(urls) > 1:
+        # Jedes Backend mit eigener Obergrenze; insgesamt len(urls) × workers
+        backends = [{"name": f"mock{index}", "url": url, "api_key": "benchmark",
+                     "max_concurrency": workers} for index, url in enumerate(urls, 1)]
+        workers *= len(urls)
+    pipeline.vlm_backends = pipeline.build_backend_pool(backends)
+    pipeline.configure_concurrency(options["engine"], workers, options["adaptive"])
+    if options["hedge"]:
+        pipeline.HEDGE_MIN_DELAY = 0.0
+    pipeline.configure_hedging(options["hedge"])
+    pipeline.configure_streaming(options["stream"])
+    pipeline.configure_cards_per_request(options["cards_per_request"])
+    pipeline.configure_cache(False)
+    pipeline.configure_preprocessing(False)
+
+    durations = []
+    record = pipeline.record_card_result
+
+    def record_and_measure(state, result, show_progress=True):
+        durations.append(result["duration"])
+        return record(state, result, show_progress)
+
+    pipeline.record_card_result = record_and_measure
+
+    batch_dir = Path(options["cards_dir"])
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary = pipeline.process_single_batch(batch_dir, "benchmark", 1, 1, options["engine"])
+    elapsed = time.time() - start
+
+    cards = len(durations)
+    streamed = pipeline.stream_stats.stats()
+    return {
+        "workers": options["workers"],
+        "cards": cards,
+        "success": summary["success"] if summary else 0,
+        "errors": summary["errors"] if summary else cards,
+        "seconds": elapsed,
+        "cards_per_min": cards / elapsed * 60 if elapsed else 0.0,
+        "p50": percentile(durations, 50),
+        "p95": percentile(durations, 95),
+        "p99": percentile(durations, 99),
+        "salvaged": pipeline.run_metrics.salvaged_responses.value(),
+        "breaker_trips": sum(backend.breaker.trips for backend in pipeline.vlm_backends),
+        "backend_requests": "/".join(str(backend.requests) for backend in pipeline.vlm_backends),
+        "hedges": pipeline.hedge_policy.hedges if pipeline.hedge_policy else 0,
+        "hedge_wins": pipeline.hedge_policy.hedge_wins if pipeline.hedge_policy else 0,
+        "first_token_avg": streamed["first_token_avg"],
+        "generation_avg": streamed["generation_avg"],
+        "early_closed": streamed["early_closed"],
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+# === STEUERUNG (Elternprozess) ===
+
+def run_child(options):
+    process = subprocess.run(
+        [sys.executable, str(Path(__file__).resolve()), "--child", json.dumps(options)],
+        cwd=SCRIPT_DIR, capture_output=True, text=True
+    )
+    for line in process.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise RuntimeError(f"Benchmark-Lauf fehlgeschlagen:\n{process.stderr[-2000:]}")
+
+
+def format_seconds(value):
+    return "-" if value is None else f"{value:.2f}s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline-Benchmark gegen einen Mock-VLM-Server")
+    parser.add_argument("--cards", type=int, default=200, help="Karten pro Lauf (Standard: %(default)s)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[5, 10, 20],
+                        help="Worker-Zahlen / Parallelität (Standard: %(default)s)")
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Adaptive Parallelität (AIMD) mit --workers als Obergrenze")
+    parser.add_argument("--cards-per-request", type=int, default=1,
+                        help="Karten pro Request (Standard: %(default)s)")
+    parser.add_argument("--rps", type=float, default=0,
+                        help="Rate-Limit in Requests/s (0 = unbegrenzt, -1 = REQUESTS_PER_SECOND aus dem Skript)")
+    parser.add_argument("--retry-delay", type=float, default=0.2,
+                        help="RETRY_DELAY für den Benchmark (Standard: %(default)s)")
+    parser.add_argument("--breaker-seconds", type=float, default=1.0,
+                        help="Pause des Schutzschalters nach einem Ausfall (Standard: %(default)s)")
+    parser.add_argument("--backends", type=int, default=1,
+                        help="Anzahl Mock-Server als Backend-Pool, je --workers Requests "
+                             "(Ausfall nur beim ersten; Standard: %(default)s)")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Doppel-Requests ab p95 der Antwortzeit (HEDGE_*, ohne Mindestwartezeit)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Antworten als Stream (SSE) lesen, Abbruch nach vollständigem JSON")
+    parser.add_argument("--image-kb", type=int, default=300, help="Größe der synthetischen Bilder")
+    parser.add_argument("--csv", default=None, help="Ergebnisse zusätzlich als CSV speichern")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    mock_vlm_server.add_config_arguments(parser)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_once(json.loads(args.child))
+        print(RESULT_PREFIX + json.dumps(result))
+        return
+
+    config = mock_vlm_server.config_from_args(args)
+    servers = [mock_vlm_server.MockVLMServer(**config).start()]
+    for _ in range(args.backends - 1):
+        servers.append(mock_vlm_server.MockVLMServer(**dict(config, outage_after=None)).start())
+
+    print("⏱️  OFFLINE-BENCHMARK DER OCR-PIPELINE")
+    print("=" * 80)
+    print(f"🧪 Mock-Server: {', '.join(server.url for server in servers)}")
+    print(f"   Latenz Median {args.latency}s (σ {args.sigma}) | 429: {args.p429:.0%} | "
+          f"5xx: {args.p5xx:.0%} | kaputtes JSON: {args.malformed:.0%} | "
+          f"stockend: {args.slow_body:.0%} | {args.token_seconds}s pro Token | "
+          f"Nachsatz: {args.trailing_text:.0%}")
+    print(f"📚 {args.cards} Karten à {args.image_kb} KB pro Lauf | Engine: {args.engine}"
+          f"{' (adaptiv)' if args.adaptive else ''} | {args.cards_per_request} Karte(n) pro Request")
+    print("=" * 80)
+
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="ocr_bench_") as tmp:
+        cards_dir = Path(tmp) / "input" / "batch_bench"
+        make_cards(cards_dir, args.cards, args.image_kb)
+
+        print(f"{'Worker':>6} | {'Karten/min':>10} | {'p50':>7} | {'p95':>7} | {'p99':>7} | "
+              f"{'TTFT':>7} | {'Requests':>8} | {'Retries':>7} | {'Hedges':>7} | {'Repariert':>9} | "
+              f"{'429':>4} | {'5xx':>4} | {'Fehler':>6} | {'Peak RSS':>8}")
+        print("-" * 137)
+
+        for workers in args.workers:
+            before = [server.stats() for server in servers]
+            workdir = Path(tmp) / f"run_{workers}"
+            workdir.mkdir()
+            result = run_child({
+                "workdir": str(workdir),
+                "cards_dir": str(cards_dir),
+                "urls": [server.url for server in servers],
+                "workers": workers,
+                "engine": args.engine,
+                "adaptive": args.adaptive,
+                "rps": None if args.rps < 0 else args.rps,
+                "retry_delay": args.retry_delay,
+                "breaker_seconds": args.breaker_seconds,
+                "hedge": args.hedge,
+                "stream": args.stream,
+                "cards_per_request": args.cards_per_request
+            })
+            delta = {}
+            for server, counters in zip(servers, before):
+                for key, value in server.stats().items():
+                    delta[key] = delta.get(key, 0) + value - counters[key]
+            expected_requests = -(-result["cards"] // args.cards_per_request) + delta["cards_missing"]
+            result.update({
+                "requests": delta["requests"],
+                "retries": max(0, delta["requests"] - expected_requests - result["hedges"]),
+                "http_429": delta["429"],
+                "http_5xx": delta["5xx"] + delta["outage"],
+                "malformed": delta["malformed"]
+            })
+            rows.append(result)
+
+            print(f"{workers:>6} | {result['cards_per_min']:>10.1f} | "
+                  f"{format_seconds(result['p50']):>7} | {format_seconds(result['p95']):>7} | "
+                  f"{format_seconds(result['p99']):>7} | "
+                  f"{format_seconds(result['first_token_avg']):>7} | {result['requests']:>8} | "
+                  f"{result['retries']:>7} | {result['hedge_wins']:>3}/{result['hedges']:<3} | "
+                  f"{result['salvaged']:>9.0f} | {result['http_429']:>4} | "
+                  f"{result['http_5xx']:>4} | "
+                  f"{result['errors']:>6} | {result['peak_rss_mb']:>6.0f} MB")
+
+    for server in servers:
+        server.stop()
+    print("=" * 80)
+    print("p50/p95/p99 = Dauer pro Karte inkl. Wiederholungen und Wartezeiten")
+    print("Repariert = fast gültige JSON-Antworten, die ohne Wiederholung gelesen wurden")
+    print("Hedges = schnellere / gesendete Doppel-Requests (--hedge)")
+    print("TTFT = Ø Zeit bis zum ersten Token (--stream)")
+
+    if args.csv and rows:
+        with open(args.csv, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"💾 Ergebnisse gespeichert: {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
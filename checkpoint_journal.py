@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Append-only Checkpoint-Journal (JSONL)
+Ein Datensatz pro fertig verarbeiteter Karte statt eines komplett neu
+gepickelten Dicts alle 50 Karten. Schreiben ist O(1) pro Karte, beim
+Fortsetzen wird das Journal in einem Durchgang eingelesen, und ein Absturz
+verliert keine fertigen Karten mehr.
+"""
+
+import json
+import os
+import pickle
+import time
+from threading import Lock
+
+
+class CheckpointJournal:
+    """
+    Thread-sicheres Journal der verarbeiteten Dateien pro Batch.
+
+    Jeder Eintrag wird sofort an das Betriebssystem übergeben (flush);
+    ``fsync`` erfolgt gebündelt alle ``fsync_every`` Einträge bzw. spätestens
+    nach ``fsync_interval`` Sekunden.
+    """
+
+    def __init__(self, path, fsync_every=20, fsync_interval=2.0, legacy_pickle=None):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.legacy_pickle = legacy_pickle
+
+        self._lock = Lock()
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.time()
+
+    def load(self):
+        """Liest das Journal in einem Durchgang ein: {batch_name: set(dateinamen)}."""
+        checkpoint = {}
+        self._migrate_legacy_pickle()
+
+        if not os.path.exists(self.path):
+            return checkpoint
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Abgeschnittene letzte Zeile nach einem Absturz
+                    continue
+                checkpoint.setdefault(entry["batch"], set()).add(entry["file"])
+        return checkpoint
+
+    def _migrate_legacy_pickle(self):
+        """Übernimmt einen alten batch_checkpoint.pkl einmalig ins Journal."""
+        if not self.legacy_pickle or not os.path.exists(self.legacy_pickle):
+            return
+        try:
+            with open(self.legacy_pickle, "rb") as f:
+                legacy = pickle.load(f)
+        except Exception:
+            return
+
+        for batch_name, filenames in legacy.items():
+            for filename in filenames:
+                self.record(batch_name, filename, sync=False)
+        self.flush()
+        os.remove(self.legacy_pickle)
+
+    def record(self, batch_name, filename, sync=True):
+        """Hängt eine fertige Karte an das Journal an."""
+        line = json.dumps({"batch": batch_name, "file": filename}, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+            self._unsynced += 1
+
+            if sync and (self._unsynced >= self.fsync_every
+                         or time.time() - self._last_sync >= self.fsync_interval):
+                self._sync()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.time()
+
+    def flush(self):
+        """Schreibt alle offenen Einträge sicher auf die Platte."""
+        with self._lock:
+            if self._file is not None and self._unsynced:
+                self._sync()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                if self._unsynced:
+                    self._sync()
+                self._file.close()
+                self._file = None
+
+    def clear(self):
+        """Löscht das Journal (nach vollständigem Abschluss aller Batches)."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Schutzschalter (Circuit Breaker) für Ausfälle des VLM-Endpoints
+Fällt der Endpoint aus (5xx, Timeouts, Verbindungsfehler), würde sonst jeder
+Worker für jede verbleibende Karte alle Versuche verbrauchen und hunderte
+Fehler protokollieren. Stattdessen:
+
+- geschlossen: Requests laufen normal; die Ergebnisse der letzten
+  ``window`` Requests werden beobachtet
+- offen: ab einer Fehlerquote von ``failure_rate`` wird der Versand aller
+  Worker pausiert (``open_seconds``, bei jedem weiteren Fehlschlag
+  verdoppelt bis ``max_open_seconds``)
+- halb offen: nach der Pause geht genau EIN Probe-Request raus; gelingt
+  er, schließt der Schalter und alle Worker laufen weiter, sonst öffnet
+  er erneut
+
+429 und andere 4xx-Antworten gelten als erreichbarer Endpoint.
+"""
+
+import time
+from collections import deque
+from threading import Lock
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Thread-sicherer Schutzschalter für alle Worker eines Prozesses."""
+
+    def __init__(self, failure_rate=0.5, window=20, min_requests=None, open_seconds=30.0,
+                 max_open_seconds=300.0, on_change=None):
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests or max(1, window // 2)
+        self.base_open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.on_change = on_change
+
+        self._lock = Lock()
+        self._outcomes = deque(maxlen=window)
+        self._state = CLOSED
+        self._open_seconds = open_seconds
+        self._open_until = 0.0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self.trips = 0
+        self.probes = 0
+        self._open_total = 0.0
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def is_open(self):
+        """True, solange der Versand pausiert ist (offen oder halb offen)."""
+        return self._state != CLOSED
+
+    # === ZUGANG ===
+
+    def try_acquire(self):
+        """
+        Prüft, ob ein Request raus darf; liefert (erlaubt, Probe).
+        Nach Ablauf der Pause wird genau ein Aufrufer zur Probe.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True, False
+            if (self._state != OPEN or self._probe_in_flight
+                    or time.monotonic() < self._open_until):
+                return False, False
+            self._state = HALF_OPEN
+            self._probe_in_flight = True
+            self.probes += 1
+        self._notify([(HALF_OPEN, "Probe-Request")])
+        return True, True
+
+    # === ERGEBNISSE ===
+
+    def record(self, healthy, probe=False):
+        """
+        Meldet das Ergebnis eines Requests: True = Endpoint antwortet,
+        False = Ausfall (5xx, Timeout, Verbindung), None = ohne Aussage
+        (z.B. Abbruch vor dem Versand).
+        """
+        events = []
+        with self._lock:
+            now = time.monotonic()
+            if probe:
+                self._probe_in_flight = False
+                if healthy:
+                    self._close(now, events)
+                elif healthy is False:
+                    self._open(now, "Probe fehlgeschlagen", events, escalate=True)
+                else:
+                    self._state = OPEN  # sofort neue Probe
+            elif self._state == CLOSED and healthy is not None:
+                # Späte Antworten aus der Zeit vor dem Öffnen zählen nicht
+                self._outcomes.append(bool(healthy))
+                failures = self._outcomes.count(False)
+                if (len(self._outcomes) >= self.min_requests
+                        and failures / len(self._outcomes) >= self.failure_rate):
+                    self._open(now, f"{failures} von {len(self._outcomes)} Requests gescheitert",
+                               events)
+        self._notify(events)
+
+    def _open(self, now, reason, events, escalate=False):
+        if self._state == CLOSED:
+            self.trips += 1
+            self._opened_at = now
+            self._open_seconds = self.base_open_seconds
+        elif escalate:
+            self._open_seconds = min(self.max_open_seconds, self._open_seconds * 2)
+        self._state = OPEN
+        self._open_until = now + self._open_seconds
+        events.append((OPEN, f"{reason}, Pause {self._open_seconds:.0f}s"))
+
+    def _close(self, now, events):
+        self._state = CLOSED
+        self._outcomes.clear()
+        if self._opened_at is not None:
+            self._open_total += now - self._opened_at
+            events.append((CLOSED, f"nach {now - self._opened_at:.0f}s"))
+        self._opened_at = None
+
+    def _notify(self, events):
+        if self.on_change is not None:
+            for state, reason in events:
+                self.on_change(state, reason)
+
+    def stats(self):
+        with self._lock:
+            open_seconds = self._open_total
+            if self._opened_at is not None:
+                open_seconds += time.monotonic() - self._opened_at
+            return {"state": self._state, "trips": self.trips, "probes": self.probes,
+                    "open_seconds": open_seconds}
+
+
+def format_breaker_stats(stats):
+    """Formatiert die Zähler des Schutzschalters für die Konsolenausgabe."""
+    return (f"{stats['trips']}× geöffnet, {stats['open_seconds']:.0f}s pausiert, "
+            f"{stats['probes']} Probe-Requests")
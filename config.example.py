@@ -41,21 +41,154 @@ MODEL_NAME = "qwen3-vl:8b"
 # ============================================================================
 
 # Number of parallel API calls
-# Recommendations:
+# With ADAPTIVE_CONCURRENCY this is only the starting value.
+# Recommendations for fixed concurrency (--fixed):
 #   Stable connection: 8-10
 #   Normal connection: 5-7
 #   Slow/unstable:     3-4
 MAX_WORKERS = 5
 
-# Number of retry attempts for failed API calls
+# Adaptive concurrency (AIMD): +1 request after a full window of successes,
+# halved on 429 / 5xx / timeouts or when p95 latency doubles.
+# Every change is logged to output_batches/concurrency_log.csv
+ADAPTIVE_CONCURRENCY = True
+CONCURRENCY_MIN = 2
+CONCURRENCY_MAX = 32
+
+# Processing engine: "threads" (ThreadPoolExecutor, default) or
+# "async" (asyncio + aiohttp, requires: pip install aiohttp)
+# Can also be selected per run: --engine async --concurrency 100
+ENGINE = "threads"
+
+# Concurrent in-flight requests of the async engine (50-200)
+ASYNC_CONCURRENCY = 50
+
+# Cards per request (also: --cards-per-request). With N > 1, N cards of the same
+# batch are sent in one message and the prompt is sent only once; the model
+# answers with a JSON array keyed by filename. Cards missing from the answer
+# are re-requested one by one. MAX_TOKENS is scaled by N.
+CARDS_PER_REQUEST = 1
+
+# Scheduler: "global" = one work queue over all batch folders (workers never
+# idle at folder boundaries), "per_batch" = folders one after another (--per-batch)
+SCHEDULER = "global"
+
+# Process-wide rate limit shared by all workers (None = unlimited)
+# Retry-After and X-RateLimit-* response headers always pause all workers together
+REQUESTS_PER_SECOND = 10
+TOKENS_PER_MINUTE = None
+TOKENS_PER_REQUEST_ESTIMATE = 2500   # prompt + image + answer, corrected from "usage"
+
+# Number of attempts per card. Permanent errors (400, 401, 403, ...) are not
+# retried; 429 is retried after the shared rate-limit pause
 MAX_RETRIES = 3
 
-# Seconds to wait between retries (exponential backoff applied)
+# Base delay in seconds before retrying a transient error (5xx, timeout,
+# unreadable answer); doubled per attempt with jitter, capped at RETRY_MAX_DELAY.
+# The card waits in a retry queue, so workers keep processing other cards
 RETRY_DELAY = 2
+RETRY_MAX_DELAY = 60
+
+# Circuit breaker per backend: once BREAKER_FAILURE_RATE of the last
+# BREAKER_WINDOW requests failed with 5xx/timeout/connection errors, dispatch is
+# paused and resumed after a single successful probe request. Cards hit by the
+# outage do not use up attempts (BREAKER_FAILURE_RATE = None disables it)
+BREAKER_FAILURE_RATE = 0.5
+BREAKER_WINDOW = 20
+BREAKER_OPEN_SECONDS = 30        # first pause; doubled after every failed probe
+BREAKER_MAX_OPEN_SECONDS = 300
+
+# Several VLM backends sharing the load (empty = only API_URL with MODEL_NAME).
+# Each request goes to the backend with the best latency/error rate/load score;
+# on 5xx, timeouts or 429 it fails over to another backend without using up an
+# attempt. Per backend: name, url, model, optional api_key or api_key_env
+# (environment variable; otherwise the key entered at startup), max_concurrency,
+# weight, requests_per_second, tokens_per_minute. Choose CONCURRENCY_MAX close
+# to the sum of max_concurrency so the pool can actually be filled.
+BACKENDS = []
+# BACKENDS = [
+#     {"name": "openrouter", "url": "https://openrouter.ai/api/v1/chat/completions",
+#      "model": "qwen/qwen3-vl-8b-instruct", "max_concurrency": 16,
+#      "requests_per_second": 10},
+#     {"name": "uni-jena", "url": "https://openwebui.test.uni-jena.de/api/v1/chat/completions",
+#      "model": "qwen3-vl:8b", "api_key_env": "UNI_JENA_API_KEY", "max_concurrency": 6},
+#     {"name": "ollama", "url": "http://localhost:11434/v1/chat/completions",
+#      "model": "qwen3-vl:8b", "api_key": "ollama", "max_concurrency": 2, "weight": 0.5},
+# ]
+
+# Hedged requests: a request still running after the live HEDGE_QUANTILE
+# percentile of response times (at least HEDGE_MIN_DELAY seconds) is sent a
+# second time, preferably to another backend; the first valid answer wins.
+# At most HEDGE_MAX_PERCENT % extra requests. The async engine cancels the
+# losing request; the thread engine cannot abort a blocking request, so the
+# loser keeps its slot until it finishes (use --engine async with hedging)
+HEDGE_REQUESTS = False
+HEDGE_QUANTILE = 95
+HEDGE_MAX_PERCENT = 5
+HEDGE_MIN_DELAY = 2.0
 
 # Expected number of cards per batch (for progress estimation)
 BATCH_SIZE = 500
 
+# Batch CSVs are appended card by card to <batch>.csv.part and replaced
+# atomically when the folder is done; flush every N cards (at the latest every 5s)
+CSV_FLUSH_EVERY = 20
+
+# ============================================================================
+# RESPONSE CACHE
+# ============================================================================
+
+# Persistent SQLite cache keyed by hash(image, prompt, model, temperature).
+# Re-running over already paid cards costs nothing (disable with --no-cache).
+RESPONSE_CACHE = True
+CACHE_MAX_MB = 500              # least recently used entries are evicted
+
+# ============================================================================
+# RESULTS STORE
+# ============================================================================
+
+# One SQLite row per card (fields, raw response, model, timing, error status)
+# instead of one JSON file per card (also: --store). Written by a single
+# writer thread with group commits; batch CSVs are exported from the database,
+# JSON on demand: python results_store.py export-json output_batches/json
+RESULTS_STORE = False
+RESULTS_COMMIT_EVERY = 200      # rows per commit (at the latest every second)
+
+# Also write the merged metadata as a Parquet dataset partitioned by Batch
+# (metadata_vlm_complete.parquet/, all columns as strings; requires pyarrow).
+# analyze_results.py and merge_retry_csv.py read it instead of the CSV.
+WRITE_PARQUET = True
+
+# ============================================================================
+# RUNTIME METRICS
+# ============================================================================
+
+# Counters and latency histograms (requests by status, retries by reason,
+# JSON parse failures, upload bytes, tokens, queue depth) in OpenMetrics text
+# format, rewritten every N seconds to output_batches/metrics.prom (None = off)
+METRICS_FILE_INTERVAL = 15
+
+# Also serve them on http://127.0.0.1:<port>/metrics (also: --metrics-port)
+METRICS_PORT = None  # e.g. 9464
+
+# Per-card stage tracing (file read, base64, rate-limit/slot wait, HTTP request,
+# JSON parsing, JSON write, error-log lock) as Chrome trace events in
+# output_batches/trace.json; open it in https://ui.perfetto.dev (also: --trace)
+TRACE = False
+
+# ============================================================================
+# IMAGE PREPROCESSING (requires: pip install Pillow)
+# ============================================================================
+
+# Shrink scans before upload (also: --preprocess). Runs in a process pool and
+# reports bytes and estimated vision tokens saved per card.
+PREPROCESS_IMAGES = False
+PREPROCESS_MAX_EDGE = 1600      # longest edge in pixels (None = keep size)
+PREPROCESS_GRAYSCALE = True
+PREPROCESS_CROP_BORDER = True   # crop the scanner border around the card
+PREPROCESS_JPEG_QUALITY = 85
+PREPROCESS_WORKERS = None       # processes (None = number of CPU cores)
+
 # ============================================================================
 # DATA EXTRACTION FIELDS
 # ============================================================================
@@ -84,8 +217,35 @@ TEMPERATURE = 0.1
 # Maximum tokens for API response
 MAX_TOKENS = 1000
 
-# API timeout in seconds
-API_TIMEOUT = 120
+# Send a JSON schema built from FIELD_KEYS as response_format (structured
+# output). Switched off for the rest of the run if the endpoint rejects it
+# (--no-schema to never send it). Almost-valid JSON (leading prose, trailing
+# commas, smart quotes, truncated objects) is repaired either way instead of
+# re-requesting the card.
+STRUCTURED_OUTPUT = True
+
+# Read responses as a stream (server-sent events, also --stream). Time to first
+# token (provider queueing and prefill) is measured separately from generation
+# time. With STREAM_EARLY_CLOSE the request ends as soon as the JSON object is
+# complete, so trailing model chatter is not waited for. The usage block at the
+# end of the stream is then missing: those requests are counted with the token
+# estimate and an unknown cost (set False when exact costs matter).
+STREAM_RESPONSES = False
+STREAM_EARLY_CLOSE = True
+
+# Model prices in USD per 1 million tokens, used for the cost lines in the
+# batch/run summaries and the per-card log (output_batches/token_usage.csv).
+# Optional "image" key: separate price for image tokens (otherwise they are
+# billed as prompt tokens). A cost reported by the API (usage.cost,
+# OpenRouter) takes precedence. Models without an entry: tokens only.
+MODEL_PRICES = {
+    "qwen/qwen3-vl-8b-instruct": {"prompt": 0.08, "completion": 0.50},
+}
+
+# API timeouts in seconds (connection setup vs. waiting for the response)
+# HTTP connections are kept alive and pooled (pool size = MAX_WORKERS)
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 120
 
 # Enable verbose logging
 VERBOSE = False
@@ -125,7 +285,7 @@ TEMPERATURE = 0.05
 MAX_WORKERS = 3
 MAX_RETRIES = 5
 RETRY_DELAY = 5
-API_TIMEOUT = 180
+READ_TIMEOUT = 180
 """
 
 # Large-scale processing (many batches)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Token- und Kostenabrechnung aus den ``usage``-Blöcken der API-Antworten
+Prompt-, Completion- und Bild-Tokens werden pro Karte über alle Versuche
+summiert, pro Batch und Lauf aggregiert und mit einer Preistabelle pro
+Modell in Kosten umgerechnet. Meldet die API selbst Kosten (``usage.cost``,
+OpenRouter), haben diese Vorrang.
+"""
+
+import csv
+import os
+
+# Spalten des Protokolls pro Karte
+LOG_COLUMNS = ["Batch", "Datei", "Requests", "Prompt_Tokens", "Completion_Tokens",
+               "Bild_Tokens", "Kosten_USD"]
+
+# Zähler eines Verbrauchs; "unreported" = Requests ohne usage-Block,
+# "estimated_tokens" = deren geschätzte Tokens
+COUNTERS = ("requests", "prompt_tokens", "completion_tokens", "image_tokens", "unreported",
+            "estimated_tokens")
+
+
+def new_usage():
+    """Leerer Verbrauch einer Karte (bzw. Kartengruppe)."""
+    return {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "image_tokens": 0,
+            "unreported": 0, "estimated_tokens": 0, "cost": None}
+
+
+def add_usage(target, usage, prices=None, estimate=0):
+    """
+    Addiert den ``usage``-Block einer API-Antwort zu ``target``. Ohne
+    ``usage.cost`` werden die Kosten mit ``prices`` (Preise des Modells, das
+    geantwortet hat) berechnet. Fehlt der Block (Ollama, OpenWebUI, vorzeitig
+    geschlossener Stream), zählt der Request mit der Token-Schätzung
+    ``estimate``, seine Kosten sind aber unbekannt.
+    """
+    if not usage:
+        merge_usage(target, dict(new_usage(), requests=1, unreported=1,
+                                 estimated_tokens=estimate))
+        return
+    details = usage.get("prompt_tokens_details") or {}
+    request = {
+        "requests": 1,
+        "unreported": 0,
+        "estimated_tokens": 0,
+        "prompt_tokens": usage.get("prompt_tokens") or 0,
+        "completion_tokens": usage.get("completion_tokens") or 0,
+        "image_tokens": details.get("image_tokens") or usage.get("image_tokens") or 0,
+        "cost": float(usage["cost"]) if usage.get("cost") is not None else None
+    }
+    if request["cost"] is None:
+        request["cost"] = usage_cost(request, prices)
+    merge_usage(target, request)
+
+
+def merge_usage(target, usage):
+    """Addiert einen Verbrauch (wie von ``new_usage``) zu ``target``."""
+    for key in COUNTERS:
+        target[key] += usage[key]
+    if usage["cost"] is not None:
+        target["cost"] = (target["cost"] or 0.0) + usage["cost"]
+
+
+def split_usage(usage, parts):
+    """Anteil einer Karte am Verbrauch eines Mehrkarten-Requests (gleichmäßig verteilt)."""
+    share = {key: usage[key] / parts for key in COUNTERS}
+    share["cost"] = usage["cost"] / parts if usage["cost"] is not None else None
+    return share
+
+
+def usage_cost(usage, prices):
+    """
+    Kosten in USD: von der API gemeldet oder aus ``prices`` berechnet
+    (USD pro 1 Mio. Tokens: "prompt", "completion", optional "image" für
+    Bild-Tokens, die sonst als Prompt-Tokens zählen). None = unbekannt,
+    auch wenn ein Request keinen usage-Block geliefert hat.
+    """
+    if usage["unreported"]:
+        return None
+    if usage["cost"] is not None:
+        return usage["cost"]
+    if not prices:
+        return None
+    prompt_tokens = usage["prompt_tokens"]
+    image_cost = 0.0
+    if "image" in prices:
+        prompt_tokens -= usage["image_tokens"]
+        image_cost = usage["image_tokens"] * prices["image"]
+    return (prompt_tokens * prices.get("prompt", 0.0)
+            + usage["completion_tokens"] * prices.get("completion", 0.0)
+            + image_cost) / 1_000_000
+
+
+class UsageTotals:
+    """Summen für einen Batch oder den ganzen Lauf."""
+
+    def __init__(self, prices=None):
+        self.prices = prices
+        self.cards = 0
+        self.billed_cards = 0        # Karten mit API-Verbrauch (nicht aus dem Cache)
+        self.requests = 0.0
+        self.prompt_tokens = 0.0
+        self.completion_tokens = 0.0
+        self.image_tokens = 0.0
+        self.cost = 0.0
+        self.unpriced_cards = 0      # Karten ohne bekannte Kosten
+        self.reported_cards = 0      # Karten mit Token-Angaben der API
+        self.unreported_requests = 0.0
+        self.estimated_tokens = 0.0
+
+    def add(self, usage):
+        """Verbucht den Verbrauch einer Karte; liefert ihre Kosten (oder None)."""
+        self.cards += 1
+        if not usage or not usage["requests"]:
+            return 0.0
+        self.billed_cards += 1
+        self.requests += usage["requests"]
+        self.prompt_tokens += usage["prompt_tokens"]
+        self.completion_tokens += usage["completion_tokens"]
+        self.image_tokens += usage["image_tokens"]
+        self.unreported_requests += usage["unreported"]
+        self.estimated_tokens += usage["estimated_tokens"]
+        if usage["requests"] > usage["unreported"]:
+            self.reported_cards += 1
+        cost = usage_cost(usage, self.prices)
+        if cost is None:
+            self.unpriced_cards += 1
+        else:
+            self.cost += cost
+        return cost
+
+    def tokens_per_card(self):
+        if not self.reported_cards:
+            return None
+        return (self.prompt_tokens + self.completion_tokens) / self.reported_cards
+
+    def cost_per_card(self):
+        priced = self.billed_cards - self.unpriced_cards
+        return self.cost / priced if priced else None
+
+    def projected_cost(self, remaining_cards):
+        per_card = self.cost_per_card()
+        return per_card * remaining_cards if per_card is not None else None
+
+
+def _money(value):
+    return f"${value:,.2f}" if value >= 1 else f"${value:.4f}"
+
+
+def format_usage(totals, remaining_cards=None):
+    """Zeilen für die Batch- bzw. Gesamtstatistik."""
+    billed = totals.billed_cards
+    if not billed:
+        return ["Kein API-Verbrauch (alle Karten aus dem Cache)"] if totals.cards else []
+
+    lines = []
+    per_card = totals.tokens_per_card()
+    if per_card is not None:
+        lines.append(
+            f"{totals.prompt_tokens + totals.completion_tokens:,.0f} Tokens "
+            f"({totals.prompt_tokens:,.0f} Prompt, davon {totals.image_tokens:,.0f} Bild, "
+            f"{totals.completion_tokens:,.0f} Completion) | "
+            f"{per_card:,.0f} Tokens/Karte | {totals.requests / billed:.2f} Requests/Karte")
+    if totals.unreported_requests:
+        estimate = (f"≈ {totals.estimated_tokens:,.0f} Tokens geschätzt, "
+                    if totals.estimated_tokens else "")
+        lines.append(f"Verbrauch nicht gemeldet: {totals.unreported_requests:,.0f} von "
+                     f"{totals.requests:,.0f} Requests ohne usage-Block "
+                     f"({estimate}Kosten unbekannt)")
+
+    cost_per_card = totals.cost_per_card()
+    if cost_per_card is None:
+        if totals.reported_cards:
+            lines.append("Kosten unbekannt (kein Preis für das Modell in MODEL_PRICES)")
+        return lines
+    cost_line = f"Kosten: {_money(totals.cost)} | ${cost_per_card:.6f}/Karte"
+    if totals.unpriced_cards:
+        cost_line += f" ({totals.unpriced_cards} Karten mit unbekannten Kosten)"
+    if remaining_cards:
+        cost_line += (f" | Prognose für {remaining_cards:,} offene Karten: "
+                      f"{_money(totals.projected_cost(remaining_cards))}")
+    lines.append(cost_line)
+    return lines
+
+
+class UsageLog:
+    """Protokoll pro Karte (CSV, wird angehängt; Kopfzeile nur bei neuer Datei)."""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._file)
+        if new_file:
+            self._writer.writerow(LOG_COLUMNS)
+
+    def write(self, batch_name, filename, usage, cost):
+        self._writer.writerow([
+            batch_name, filename, round(usage["requests"], 3),
+            round(usage["prompt_tokens"]), round(usage["completion_tokens"]),
+            round(usage["image_tokens"]), "" if cost is None else f"{cost:.8f}"
+        ])
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Inkrementelle Zusammenführung der Batch-CSVs
+Ein Manifest merkt sich Größe, mtime und Zeilenzahl jeder Batch-CSV.
+Unveränderte Batches werden Byte für Byte in die Gesamt-CSV kopiert, nur
+neue oder geänderte Dateien werden geparst. Es wird nie ein DataFrame des
+gesamten Archivs im Speicher gehalten.
+"""
+
+import csv
+import glob
+import io
+import json
+import os
+
+from batch_csv import csv_columns
+
+# Standardfelder (wie im Hauptskript)
+FIELD_KEYS = [
+    "Komponist", "Signatur", "Titel", "Textanfang",
+    "Verlag", "Material", "Textdichter", "Bearbeiter", "Bemerkungen"
+]
+
+MANIFEST_VERSION = 1
+BOM = b"\xef\xbb\xbf"
+
+
+def default_manifest_path(output_file):
+    return output_file + ".manifest.json"
+
+
+def _load_manifest(path, columns):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {"batches": {}}
+    # Andere Spalten → alles neu parsen
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("columns") != columns:
+        return {"batches": {}}
+    return manifest
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def _is_unchanged(entry, signature):
+    return (entry is not None and entry.get("byte_copy")
+            and entry.get("size") == signature["size"]
+            and entry.get("mtime") == signature["mtime"])
+
+
+def _copy_body(csv_file, out):
+    """Kopiert alle Zeilen nach der Kopfzeile unverändert."""
+    with open(csv_file, "rb") as f:
+        f.readline()
+        last = b"\n"
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            out.write(chunk)
+            last = chunk[-1:]
+        if last != b"\n":
+            out.write(b"\r\n")
+
+
+def _parse_batch(csv_file, columns):
+    """
+    Parst eine neue/geänderte Batch-CSV (ein Batch, nicht das ganze Archiv)
+    in die feste Spaltenreihenfolge. Liefert (csv_text, zeilen, byte_copy_fähig).
+    """
+    rows = 0
+    buffer = io.StringIO()
+    with open(csv_file, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        header_matches = reader.fieldnames == columns
+        writer = csv.DictWriter(buffer, columns, extrasaction="ignore")
+        for row in reader:
+            writer.writerow({column: row.get(column) or "" for column in columns})
+            rows += 1
+    return buffer.getvalue(), rows, header_matches
+
+
+def merge_batch_csvs(csv_dir, output_file, manifest_path=None, field_keys=FIELD_KEYS):
+    """
+    Führt alle Batch-CSVs in ``csv_dir`` zu ``output_file`` zusammen.
+
+    Liefert ein Dict mit files, rows, copied, parsed, unchanged (nichts zu tun),
+    batches ({datei: zeilen}) und errors ([(datei, meldung)]).
+    """
+    manifest_path = manifest_path or default_manifest_path(output_file)
+    columns = csv_columns(field_keys)
+    manifest = _load_manifest(manifest_path, columns)
+    old_batches = manifest.get("batches", {})
+
+    output_abs = os.path.abspath(output_file)
+    csv_files = [path for path in sorted(glob.glob(os.path.join(csv_dir, "*.csv")))
+                 if os.path.abspath(path) != output_abs]
+
+    result = {"files": len(csv_files), "rows": 0, "copied": 0, "parsed": 0,
+              "unchanged": False, "batches": {}, "errors": []}
+    if not csv_files:
+        return result
+
+    signatures = {os.path.basename(path): _file_signature(path) for path in csv_files}
+
+    # Nichts geändert und Gesamt-CSV unverändert → fertig
+    output_entry = manifest.get("output")
+    if (output_entry and os.path.exists(output_file)
+            and output_entry == _file_signature(output_file)
+            and set(signatures) == set(old_batches)
+            and all(_is_unchanged(old_batches[name], sig) for name, sig in signatures.items())):
+        result["unchanged"] = True
+        result["copied"] = len(csv_files)
+        result["batches"] = {name: entry["rows"] for name, entry in old_batches.items()}
+        result["rows"] = sum(result["batches"].values())
+        return result
+
+    new_batches = {}
+    tmp_path = output_file + ".tmp"
+    with open(tmp_path, "wb") as out:
+        header = io.StringIO()
+        csv.writer(header).writerow(columns)
+        out.write(BOM + header.getvalue().encode("utf-8"))
+
+        for csv_file in csv_files:
+            name = os.path.basename(csv_file)
+            signature = signatures[name]
+            entry = old_batches.get(name)
+            try:
+                if _is_unchanged(entry, signature):
+                    _copy_body(csv_file, out)
+                    rows, byte_copy = entry["rows"], True
+                    result["copied"] += 1
+                else:
+                    text, rows, byte_copy = _parse_batch(csv_file, columns)
+                    out.write(text.encode("utf-8"))
+                    result["parsed"] += 1
+            except (OSError, UnicodeDecodeError, csv.Error) as e:
+                result["errors"].append((name, str(e)))
+                continue
+
+            new_batches[name] = dict(signature, rows=rows, byte_copy=byte_copy)
+            result["batches"][name] = rows
+            result["rows"] += rows
+
+        out.flush()
+        os.fsync(out.fileno())
+
+    os.replace(tmp_path, output_file)
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "columns": columns,
+        "output": _file_signature(output_file),
+        "batches": new_batches
+    }
+    manifest_tmp = manifest_path + ".tmp"
+    with open(manifest_tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(manifest_tmp, manifest_path)
+    return result
+
+
+def iter_csv_rows(csv_file):
+    """Liest eine (Gesamt-)CSV zeilenweise als Dicts, ohne sie ganz zu laden."""
+    with open(csv_file, "r", encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            yield row
+
+
+def format_merge_stats(result):
+    """Formatiert das Ergebnis der Zusammenführung für die Konsolenausgabe."""
+    if result["unchanged"]:
+        return f"unverändert ({result['files']} Batch-CSVs, {result['rows']:,} Zeilen)"
+    return (f"{result['rows']:,} Zeilen aus {result['files']} Batch-CSVs "
+            f"({result['copied']} unverändert kopiert, {result['parsed']} neu eingelesen)")
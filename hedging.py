@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Gestaffelte Doppel-Requests ("hedged requests") gegen hängende Antworten
+Ein Request, der länger läuft als das laufende p95 der Antwortzeiten, wird
+ein zweites Mal gesendet (bevorzugt an ein anderes Backend). Die erste
+gültige Antwort gewinnt, der andere Request wird abgebrochen. So halten
+einzelne hängende Requests am Ende eines Batches nicht mehr alle Worker auf.
+
+Damit die Last nicht wächst, ist der Anteil der Doppel-Requests an allen
+Requests begrenzt (``max_ratio``), und vor ``min_samples`` Messwerten wird
+nichts doppelt gesendet.
+"""
+
+from collections import deque
+from threading import Lock
+
+from adaptive_concurrency import percentile
+
+
+class HedgePolicy:
+    """Schwelle (laufendes Perzentil) und Budget für Doppel-Requests, thread-sicher."""
+
+    def __init__(self, quantile=95, max_ratio=0.05, min_delay=1.0, window=200, min_samples=20):
+        self.quantile = quantile
+        self.max_ratio = max_ratio
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+
+        self._lock = Lock()
+        self._latencies = deque(maxlen=window)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0          # die zweite Antwort kam zuerst
+        self.cancelled = 0           # abgebrochene Verlierer
+        self.saved_seconds = 0.0     # gemessen, wenn der Verlierer doch noch fertig wurde
+        self.saved_samples = 0
+
+    def observe(self, latency):
+        """Antwortzeit eines erfolgreichen Requests."""
+        with self._lock:
+            self._latencies.append(latency)
+
+    def delay(self):
+        """
+        Zählt einen Request und liefert, nach wie vielen Sekunden er doppelt
+        gesendet werden darf (None = zu wenige Messwerte).
+        """
+        with self._lock:
+            self.requests += 1
+            return self._threshold_locked()
+
+    def try_hedge(self):
+        """True (und gezählt), solange das Budget einen weiteren Doppel-Request erlaubt."""
+        with self._lock:
+            if self.hedges + 1 > self.max_ratio * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def record_outcome(self, hedge_won, cancelled=False):
+        with self._lock:
+            self.hedge_wins += hedge_won
+            self.cancelled += cancelled
+
+    def record_saved(self, seconds):
+        """Zeitgewinn eines Doppel-Requests (Verlierer später fertig als der Gewinner)."""
+        with self._lock:
+            self.saved_seconds += max(0.0, seconds)
+            self.saved_samples += 1
+
+    def threshold(self):
+        """Aktuelle Schwelle in Sekunden (None = noch zu wenige Messwerte)."""
+        with self._lock:
+            return self._threshold_locked()
+
+    def _threshold_locked(self):
+        if len(self._latencies) < self.min_samples:
+            return None
+        return max(self.min_delay, percentile(self._latencies, self.quantile))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "cancelled": self.cancelled,
+                "saved_seconds": self.saved_seconds,
+                "saved_samples": self.saved_samples,
+                "max_ratio": self.max_ratio
+            }
+
+
+def format_hedge_stats(stats):
+    """Zeile für die Statistik."""
+    requests = stats["requests"] or 1
+    line = (f"{stats['hedges']} Doppel-Requests ({stats['hedges'] / requests:.1%} der Requests, "
+            f"max. {stats['max_ratio']:.0%}), {stats['hedge_wins']} davon schneller, "
+            f"{stats['cancelled']} Verlierer abgebrochen")
+    if stats["saved_samples"]:
+        line += (f" | gemessene Ersparnis {stats['saved_seconds']:.0f}s "
+                 f"(Ø {stats['saved_seconds'] / stats['saved_samples']:.1f}s bei "
+                 f"{stats['saved_samples']} Karten)")
+    return line
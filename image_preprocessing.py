@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Bildvorverarbeitung für die Karteikarten
+Verkleinert die Scanner-JPEGs vor dem Upload (längste Kante, Graustufen,
+Scanner-Rand abschneiden, JPEG-Qualität). Das spart Upload-Zeit,
+Server-Latenz und Vision-Tokens, ohne die Lesbarkeit der Schreibmaschinen-
+schrift zu beeinträchtigen.
+
+Die Verarbeitung läuft in einem Prozess-Pool, damit das Dekodieren und
+Neukodieren der Bilder nicht am GIL der Worker-Threads hängt.
+
+Benötigt Pillow (pip install Pillow).
+"""
+
+import base64
+import io
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+
+try:
+    from PIL import Image, ImageChops, ImageOps
+except ImportError:  # optional, nur für die Vorverarbeitung nötig
+    Image = None
+
+# Qwen-VL: ein Vision-Token pro 28x28-Pixel-Block (14px-Patches, 2x2 zusammengefasst)
+VISION_PATCH_SIZE = 28
+
+
+def estimate_vision_tokens(width, height):
+    """Grobe Schätzung der Vision-Tokens für ein Bild der Größe width x height."""
+    return math.ceil(width / VISION_PATCH_SIZE) * math.ceil(height / VISION_PATCH_SIZE)
+
+
+def _crop_scanner_border(image, threshold=40, margin=10):
+    """Schneidet den einfarbigen Scanner-Rand um die Karte ab."""
+    gray = image.convert("L")
+    background = gray.getpixel((0, 0))
+    diff = ImageChops.difference(gray, Image.new("L", gray.size, background))
+    mask = diff.point(lambda value: 255 if value > threshold else 0)
+    bbox = mask.getbbox()
+    if not bbox:
+        return image
+
+    left, top, right, bottom = bbox
+    left = max(0, left - margin)
+    top = max(0, top - margin)
+    right = min(image.width, right + margin)
+    bottom = min(image.height, bottom + margin)
+
+    # Nur zuschneiden, wenn wirklich ein Rand gefunden wurde (nicht ein Fleck)
+    if (right - left) * (bottom - top) < 0.3 * image.width * image.height:
+        return image
+    return image.crop((left, top, right, bottom))
+
+
+def preprocess_image(image_path, max_edge=1600, grayscale=True, crop_border=True,
+                     jpeg_quality=85):
+    """
+    Bereitet ein Kartenbild für den Upload auf.
+
+    Liefert (base64_jpeg, stats) mit Bytes und geschätzten Vision-Tokens
+    vor und nach der Verarbeitung.
+    """
+    with open(image_path, "rb") as image_file:
+        raw = image_file.read()
+
+    with Image.open(io.BytesIO(raw)) as image:
+        image = ImageOps.exif_transpose(image)
+        original_size = image.size
+
+        if crop_border:
+            image = _crop_scanner_border(image)
+
+        if grayscale:
+            image = image.convert("L")
+        elif image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        if max_edge and max(image.size) > max_edge:
+            scale = max_edge / max(image.size)
+            new_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            image = image.resize(new_size, Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=jpeg_quality, optimize=True)
+        processed_size = image.size
+
+    processed = buffer.getvalue()
+
+    # Bereits kleine Bilder nicht durch Neukodierung vergrößern
+    if len(processed) >= len(raw) and processed_size == original_size:
+        processed = raw
+
+    stats = {
+        "original_bytes": len(raw),
+        "processed_bytes": len(processed),
+        "original_tokens": estimate_vision_tokens(*original_size),
+        "processed_tokens": estimate_vision_tokens(*processed_size)
+    }
+    return base64.b64encode(processed).decode("utf-8"), stats
+
+
+class ImagePreprocessor:
+    """Prozess-Pool für preprocess_image, wird beim ersten Aufruf gestartet."""
+
+    def __init__(self, workers=None, max_edge=1600, grayscale=True, crop_border=True,
+                 jpeg_quality=85):
+        if Image is None:
+            raise RuntimeError("Die Bildvorverarbeitung benötigt Pillow: pip install Pillow")
+
+        self.workers = workers or os.cpu_count() or 2
+        self.options = {
+            "max_edge": max_edge,
+            "grayscale": grayscale,
+            "crop_border": crop_border,
+            "jpeg_quality": jpeg_quality
+        }
+        self._pool = None
+        self._lock = Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def encode(self, image_path):
+        """Verarbeitet ein Bild im Prozess-Pool; liefert (base64_jpeg, stats)."""
+        future = self._get_pool().submit(preprocess_image, str(image_path), **self.options)
+        return future.result()
+
+    def shutdown(self):
+        """Beendet die Worker-Prozesse (ein neuer Aufruf startet den Pool erneut)."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+def format_preprocessing_stats(cards, original_bytes, processed_bytes,
+                               original_tokens, processed_tokens):
+    """Formatiert die Einsparung pro Karte für die Konsolenausgabe."""
+    if not cards:
+        return "keine Daten"
+    saved_bytes = (1 - processed_bytes / original_bytes) * 100 if original_bytes else 0.0
+    text = (f"Ø {original_bytes / cards / 1024:.0f} KB → {processed_bytes / cards / 1024:.0f} KB "
+            f"pro Karte (−{saved_bytes:.0f}%)")
+    if original_tokens:
+        saved_tokens = (1 - processed_tokens / original_tokens) * 100
+        text += (f" | Ø {original_tokens / cards:.0f} → {processed_tokens / cards:.0f} "
+                 f"Vision-Tokens (−{saved_tokens:.0f}%)")
+    return text
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Tolerantes Lesen von Modell-Antworten, die fast JSON sind
+Statt eine Antwort wegen eines einzelnen Zeichens zu verwerfen und die
+Karte erneut (mit voller Latenz und allen Tokens) anzufragen, werden
+typische Fehler repariert:
+
+- prose:           Text vor/nach dem JSON (auch Markdown-Zäune mit anderem Tag)
+- smart_quotes:    typografische Anführungszeichen („ “ ” ‟) als String-Grenzen
+- trailing_comma:  Komma vor } bzw. ]
+- unescaped_quote: nicht maskierte " innerhalb eines Strings
+- truncated:       abgeschnittene Antwort (max_tokens erreicht) – offene
+                   Strings und Klammern werden geschlossen
+
+Jede angewandte Reparatur wird zurückgemeldet (für Metriken).
+"""
+
+import json
+
+# Typografische Anführungszeichen, die ein Modell statt " verwendet
+SMART_QUOTES = "“”„‟"
+# Maximal probierte Startpositionen ({ bzw. [) bei vorangestelltem Text
+MAX_START_CANDIDATES = 10
+
+REPAIR_KINDS = ("prose", "smart_quotes", "trailing_comma", "unescaped_quote", "truncated")
+
+
+def _next_significant(text, index):
+    """Nächstes Nicht-Leerzeichen ab ``index`` (oder "" am Textende)."""
+    while index < len(text) and text[index].isspace():
+        index += 1
+    return text[index] if index < len(text) else ""
+
+
+def _strip_trailing_comma(out):
+    """Entfernt ein Komma (plus Leerraum) am Ende der Ausgabe; True falls vorhanden."""
+    end = len(out)
+    while end and out[end - 1].isspace():
+        end -= 1
+    if end and out[end - 1] == ",":
+        del out[end - 1:]
+        return True
+    return False
+
+
+def _repair_from(text, start, keep_partial):
+    """
+    Repariert den JSON-Wert ab ``text[start]``; liefert (Wert, Reparaturen)
+    oder None, wenn auch die Reparatur nicht lesbar ist.
+    """
+    repairs = set()
+    out = []
+    # Offene Container: [schließende Klammer, Länge von out am letzten Elementende]
+    stack = []
+    in_string = False
+    smart_string = False
+    escaped = False
+    end = len(text)
+
+    index = start
+    while index < len(text):
+        char = text[index]
+        index += 1
+
+        if in_string:
+            if escaped:
+                escaped = False
+                out.append(char)
+            elif char == "\\":
+                escaped = True
+                out.append(char)
+            elif char == '"' or (smart_string and char in SMART_QUOTES):
+                following = _next_significant(text, index)
+                if following in ("", ",", ":", "}", "]") or smart_string:
+                    in_string = False
+                    out.append('"')
+                    if char != '"':
+                        repairs.add("smart_quotes")
+                else:
+                    # Anführungszeichen im Wert, z.B. "Lied "Heimat""
+                    out.append('\\"')
+                    repairs.add("unescaped_quote")
+            else:
+                out.append(char)
+            continue
+
+        if char == '"' or char in SMART_QUOTES:
+            in_string = True
+            smart_string = char != '"'
+            if smart_string:
+                repairs.add("smart_quotes")
+            out.append('"')
+        elif char in "{[":
+            out.append(char)
+            stack.append(["}" if char == "{" else "]", len(out)])
+        elif char in "}]":
+            if not stack:
+                end = index - 1
+                break
+            if _strip_trailing_comma(out):
+                repairs.add("trailing_comma")
+            out.append(stack.pop()[0])
+            if not stack:
+                end = index
+                break
+        elif char == ",":
+            if stack:
+                stack[-1][1] = len(out)
+            out.append(char)
+        else:
+            out.append(char)
+
+    if stack:
+        repairs.add("truncated")
+        candidates = _truncation_candidates(out, stack, in_string, escaped, keep_partial)
+    else:
+        candidates = ["".join(out)]
+        if text[end:].strip():
+            repairs.add("prose")
+
+    for candidate in candidates:
+        try:
+            return json.loads(candidate, strict=False), repairs
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def _truncation_candidates(out, stack, in_string, escaped, keep_partial):
+    """
+    Mögliche Abschlüsse einer abgeschnittenen Antwort, beste zuerst:
+    alles offene schließen, sonst auf das letzte vollständige Element
+    eines immer äußeren Containers zurückschneiden.
+    """
+    def cut(level):
+        closers = "".join(frame[0] for frame in reversed(stack[:level + 1]))
+        return "".join(out[:stack[level][1]]) + closers
+
+    cuts = [cut(level) for level in reversed(range(len(stack)))]
+
+    arrays = [level for level, frame in enumerate(stack) if frame[0] == "]"]
+    if not keep_partial and arrays and (arrays[-1] < len(stack) - 1 or in_string):
+        # Unvollständiges Element einer Liste verwerfen statt ergänzen
+        return cuts[len(stack) - 1 - arrays[-1]:]
+
+    closed = list(out)
+    if escaped:
+        closed.pop()
+    if in_string:
+        closed.append('"')
+    _strip_trailing_comma(closed)
+    closed.extend(frame[0] for frame in reversed(stack))
+    return ["".join(closed)] + cuts
+
+
+def salvage_json(text, keep_partial=True):
+    """
+    Liest ``text`` als JSON und repariert typische Modell-Fehler.
+
+    Liefert (Wert, Reparaturen) mit der sortierten Liste der angewandten
+    Reparaturen (leer, wenn der Text gültiges JSON war). Mit
+    ``keep_partial=False`` werden unvollständige Listenelemente einer
+    abgeschnittenen Antwort verworfen statt ergänzt.
+
+    Wirft json.JSONDecodeError, wenn nichts Lesbares gefunden wird.
+    """
+    try:
+        return json.loads(text), []
+    except json.JSONDecodeError as e:
+        error = e
+
+    starts = [index for index, char in enumerate(text) if char in "{["][:MAX_START_CANDIDATES]
+    for start in starts:
+        repaired = _repair_from(text, start, keep_partial)
+        if repaired is None:
+            continue
+        value, repairs = repaired
+        if text[:start].strip():
+            repairs.add("prose")
+        return value, sorted(repairs)
+
+    raise error
@@ -5,8 +5,8 @@ Kombiniert alle Batch-CSVs zu einer Gesamt-CSV
 (Falls die automatische Zusammenführung nicht funktioniert hat)
 """
 
-import pandas as pd
-import glob
+import csv_merge
+import parquet_store
 from pathlib import Path
 
 # Konfiguration
@@ -14,69 +14,68 @@ CSV_DIR = "output_batches/csv"
 OUTPUT_FILE = "output_batches/metadata_vlm_complete_MANUAL.csv"
 
 def merge_csv_files():
-    """Führt alle CSV-Dateien im Verzeichnis zusammen."""
+    """Führt alle CSV-Dateien im Verzeichnis zusammen (inkrementell über ein Manifest)."""
     
     print("🔗 CSV-ZUSAMMENFÜHRUNG")
     print("=" * 80)
     
-    # Finde alle CSV-Dateien
-    csv_pattern = str(Path(CSV_DIR) / "*.csv")
-    csv_files = sorted(glob.glob(csv_pattern))
-    
-    if not csv_files:
+    if not list(Path(CSV_DIR).glob("*.csv")):
         print(f"❌ Keine CSV-Dateien gefunden in: {CSV_DIR}")
         return
     
-    print(f"📂 Gefunden: {len(csv_files)} CSV-Dateien\n")
+    # Unveränderte Batches werden nur kopiert, neue/geänderte eingelesen
+    result = csv_merge.merge_batch_csvs(CSV_DIR, OUTPUT_FILE)
     
-    # Lade und kombiniere alle CSVs
-    all_dfs = []
-    errors = []
+    print(f"📂 Gefunden: {result['files']} CSV-Dateien\n")
     
-    for csv_file in csv_files:
-        filename = Path(csv_file).name
-        try:
-            df = pd.read_csv(csv_file, encoding="utf-8-sig")
-            all_dfs.append(df)
-            print(f"✓ {filename:30s} {len(df):6,} Zeilen")
-        except Exception as e:
-            errors.append((filename, str(e)))
-            print(f"✗ {filename:30s} FEHLER: {e}")
+    for filename, rows in result["batches"].items():
+        print(f"✓ {filename:30s} {rows:6,} Zeilen")
+    for filename, error in result["errors"]:
+        print(f"✗ {filename:30s} FEHLER: {error}")
     
-    if not all_dfs:
+    if not result["batches"]:
         print("\n❌ Keine CSV-Dateien erfolgreich geladen")
         return
     
     print(f"\n{'=' * 80}")
     
-    # Kombiniere alle DataFrames
-    combined_df = pd.concat(all_dfs, ignore_index=True)
-    
-    # Sortiere nach Batch und Dateiname
-    if 'Batch' in combined_df.columns:
-        combined_df = combined_df.sort_values(['Batch', 'Datei'])
-    
-    # Speichere
-    combined_df.to_csv(OUTPUT_FILE, index=False, encoding="utf-8-sig")
-    
     print(f"✅ Gesamt-CSV erstellt: {OUTPUT_FILE}")
-    print(f"📊 Gesamt-Einträge: {len(combined_df):,}")
-    
-    # Statistiken
-    if 'Batch' in combined_df.columns:
-        print(f"📦 Batches: {combined_df['Batch'].nunique()}")
+    print(f"📊 Gesamt-Einträge: {result['rows']:,}")
+    print(f"⚡ {csv_merge.format_merge_stats(result)}")
+    
+    # Zusätzlich als Parquet-Datensatz (nach Batch partitioniert)
+    if parquet_store.available():
+        parquet_dir = parquet_store.dataset_path_for(OUTPUT_FILE)
+        if not result["unchanged"] or not Path(parquet_dir).is_dir():
+            parquet_store.write_from_csv(OUTPUT_FILE, parquet_dir)
+        print(f"🧱 Parquet-Datensatz: {parquet_dir}/")
+    
+    # Statistiken in einem Durchgang über die Gesamt-CSV (ohne DataFrame)
+    batches = set()
+    filled = {}
+    total = 0
+    for row in csv_merge.iter_csv_rows(OUTPUT_FILE):
+        total += 1
+        batches.add(row.get("Batch"))
+        for col, value in row.items():
+            if col in ['Datei', 'Batch']:
+                continue
+            if value and value.strip():
+                filled[col] = filled.get(col, 0) + 1
+            else:
+                filled.setdefault(col, 0)
+    
+    print(f"📦 Batches: {len(batches)}")
     
     # Zeige Vollständigkeit
     print(f"\n📋 VOLLSTÄNDIGKEIT:")
-    for col in combined_df.columns:
-        if col not in ['Datei', 'Batch']:
-            filled = (combined_df[col].fillna('').str.strip() != '').sum()
-            percentage = (filled / len(combined_df)) * 100
-            print(f"  {col:15s}: {filled:6,} ({percentage:5.1f}%)")
-    
-    if errors:
-        print(f"\n⚠️  FEHLER bei {len(errors)} Datei(en):")
-        for filename, error in errors:
+    for col, count in filled.items():
+        percentage = (count / total) * 100 if total else 0.0
+        print(f"  {col:15s}: {count:6,} ({percentage:5.1f}%)")
+    
+    if result["errors"]:
+        print(f"\n⚠️  FEHLER bei {len(result['errors'])} Datei(en):")
+        for filename, error in result["errors"]:
             print(f"  - {filename}: {error}")
     
     print(f"\n{'=' * 80}")
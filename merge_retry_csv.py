@@ -7,6 +7,7 @@ und entfernt Duplikate intelligent.
 
 import pandas as pd
 import glob
+import parquet_store
 import os
 from pathlib import Path
 from datetime import datetime
@@ -58,7 +59,8 @@ def main():
     # 4. Lade Original-CSV
     print(f"\n📖 Lade Original-CSV...")
     try:
-        df_original = pd.read_csv(FINAL_CSV, encoding="utf-8-sig")
+        # Parquet-Datensatz neben der CSV bevorzugt (schneller als die CSV zu parsen)
+        df_original = parquet_store.load_metadata(FINAL_CSV)
         print(f"   ✓ {format_number(len(df_original))} Einträge geladen")
     except Exception as e:
         print(f"❌ Fehler beim Laden: {e}")
@@ -125,6 +127,10 @@ def main():
     try:
         df_deduplicated.to_csv(OUTPUT_CSV, index=False, encoding="utf-8-sig")
         print(f"   ✓ Gespeichert: {os.path.basename(OUTPUT_CSV)}")
+        if parquet_store.available():
+            parquet_dir = parquet_store.dataset_path_for(OUTPUT_CSV)
+            parquet_store.write_dataframe(df_deduplicated, parquet_dir)
+            print(f"   ✓ Parquet: {os.path.basename(parquet_dir)}/")
     except Exception as e:
         print(f"   ❌ Fehler beim Speichern: {e}")
         return
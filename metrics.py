@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Laufzeit-Metriken für lange, unbeaufsichtigte Läufe
+Zähler, Gauges und Latenz-Histogramme im OpenMetrics-Textformat – abrufbar
+über einen HTTP-Endpoint auf localhost (Prometheus/curl) und/oder als
+regelmäßig neu geschriebene Datei (z.B. für den node_exporter-Textfile-
+Collector oder einfach ``watch cat metrics.prom``).
+
+Ohne externe Abhängigkeiten; alle Metriken sind thread-sicher.
+"""
+
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Sekunden; VLM-Antworten dauern typischerweise 1-30s
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60, 120)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: Labels {sorted(labels)} statt {list(self.labelnames)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# TYPE {self.name} {self.kind}", f"# HELP {self.name} {self.documentation}"]
+
+    def samples(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monoton steigender Zähler (Ausgabe als ``<name>_total``)."""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        if not values and not self.labelnames:
+            values = {(): 0}
+        return [f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Gauge(_Metric):
+    """Momentanwert; entweder gesetzt oder beim Auslesen über ``func`` ermittelt."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), func=None):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        if self.func is not None:
+            return self.func()
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        if self.func is not None:
+            try:
+                values = {(): self.func()}
+            except Exception:
+                return []
+        else:
+            with self._lock:
+                values = dict(self._values)
+            if not values and not self.labelnames:
+                values = {(): 0}
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """Kumulatives Histogramm mit festen Bucket-Grenzen (plus +Inf, Summe, Anzahl)."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["counts"][index] += 1
+                    break
+            entry["sum"] += value
+
+    def samples(self):
+        with self._lock:
+            values = {key: {"counts": list(entry["counts"]), "sum": entry["sum"]}
+                      for key, entry in self._values.items()}
+        if not values and not self.labelnames:
+            values = {(): {"counts": [0] * len(self.buckets), "sum": 0.0}}
+
+        lines = []
+        for key, entry in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry["counts"]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{labels} {_format_value(round(entry['sum'], 6))}")
+        return lines
+
+
+class Registry:
+    """Sammlung von Metriken, gerendert im OpenMetrics-Textformat."""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), func=None):
+        return self._register(Gauge(name, documentation, labelnames, func))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+# === METRIKEN DER OCR-PIPELINE ===
+
+class PipelineMetrics(Registry):
+    """Die Metriken des Hauptskripts (Requests, Wiederholungen, Tokens, Warteschlange)."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = time.time()
+        self.gauge("ocr_run_start_time_seconds", "Startzeit des Laufs (Unix-Zeit)",
+                   func=lambda: round(self.started, 3))
+        self.requests = self.counter(
+            "ocr_requests", "HTTP-Requests an den VLM-Endpoint nach Ergebnis (Statuscode, timeout, connection)",
+            ["status"])
+        self.request_seconds = self.histogram(
+            "ocr_request_duration_seconds", "Dauer eines HTTP-Requests inkl. Antwort-Body")
+        self.retries = self.counter(
+            "ocr_retries", "Wiederholte Versuche nach Grund (Statuscode, timeout, connection, parse)",
+            ["reason"])
+        self.failed_attempts = self.counter(
+            "ocr_failed_attempts", "Gescheiterte Versuche nach Fehlerklasse (permanent, throttled, transient)",
+            ["error_class"])
+        self.deferred_retries = self.counter(
+            "ocr_deferred_retries", "Verzögerte Wiederholungen nach vorübergehenden Fehlern")
+        self.retry_queue_depth = self.gauge(
+            "ocr_retry_queue_depth", "Karten, die auf ihre verzögerte Wiederholung warten")
+        self.parse_failures = self.counter(
+            "ocr_json_parse_failures", "Antworten, deren JSON nicht gelesen werden konnte")
+        self.json_repairs = self.counter(
+            "ocr_json_repairs", "Reparaturen fast gültiger JSON-Antworten nach Art", ["kind"])
+        self.salvaged_responses = self.counter(
+            "ocr_json_salvaged_responses", "Reparierte Antworten, d.h. eingesparte Wiederholungen")
+        self.upload_bytes = self.counter(
+            "ocr_upload_bytes", "Hochgeladene Bilddaten (Base64) in Bytes")
+        self.prompt_tokens = self.counter(
+            "ocr_prompt_tokens", "Prompt-Tokens laut usage der API-Antworten")
+        self.completion_tokens = self.counter(
+            "ocr_completion_tokens", "Completion-Tokens laut usage der API-Antworten")
+        self.multi_card_fallbacks = self.counter(
+            "ocr_multi_card_fallbacks", "Karten aus Mehrkarten-Requests, die einzeln nachgefragt wurden")
+        self.cards = self.counter(
+            "ocr_cards", "Verarbeitete Karten nach Ergebnis (success, error)", ["outcome"])
+        self.card_seconds = self.histogram(
+            "ocr_card_duration_seconds", "Dauer pro Karte inkl. Wiederholungen und Wartezeiten")
+        self.queue_depth = self.gauge(
+            "ocr_queue_depth", "Eingeplante, noch nicht fertige Karten")
+
+    def record_usage(self, usage):
+        """Übernimmt prompt_tokens/completion_tokens aus dem usage-Block."""
+        if not usage:
+            return
+        self.prompt_tokens.inc(usage.get("prompt_tokens") or 0)
+        self.completion_tokens.inc(usage.get("completion_tokens") or 0)
+
+
+# === AUSGABE ===
+
+class MetricsServer:
+    """HTTP-Endpoint ``/metrics`` auf localhost (eigener Daemon-Thread)."""
+
+    def __init__(self, registry, port, host="127.0.0.1"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class MetricsFileWriter:
+    """Schreibt die Metriken alle ``interval`` Sekunden atomar in eine Datei."""
+
+    def __init__(self, registry, path, interval=15.0):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.registry.render())
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def close(self):
+        """Beendet den Thread und schreibt den Endstand."""
+        self._stop.set()
+        self._thread.join()
+        self.write()
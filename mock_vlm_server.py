@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+Lokaler Mock-Server für /chat/completions (OpenAI-kompatibel)
+Für Lasttests ohne Kosten und ohne Drosselung durch OpenRouter. Latenz,
+Fehlerquoten (429/5xx), Markdown-Zäune, kaputtes JSON und langsam
+gesendete Antworten sind konfigurierbar. Mehrkarten-Requests
+("Datei: ..." vor jedem Bild) werden mit einem JSON-Array beantwortet
+(mit response_format: {"karten": [...]}), aus dem optional einzelne
+Karten fehlen. Requests mit ``stream: true`` werden als Server-Sent Events
+beantwortet, ein Event pro Token.
+
+Eigenständig starten und das Hauptskript darauf zeigen lassen:
+    python mock_vlm_server.py --port 8099 --latency 2.0 --p429 0.05
+    → API_BASE_URL = "http://127.0.0.1:8099/v1"
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CONFIG = {
+    "latency_median": 1.0,   # Sekunden bis zur Antwort (Median)
+    "latency_sigma": 0.4,    # Streuung der Log-Normalverteilung (0 = konstant)
+    "p429": 0.0,             # Anteil 429 Too Many Requests
+    "p5xx": 0.0,             # Anteil 500/502/503
+    "retry_after": 1,        # Retry-After-Header bei 429 (Sekunden, None = ohne)
+    "p_fenced": 0.5,         # Anteil Antworten in ```json ... ```
+    "p_malformed": 0.0,      # Anteil Antworten mit ungültigem JSON (siehe MALFORMED_KINDS)
+    "p_slow_body": 0.0,      # Anteil Antworten, deren Body stockend gesendet wird
+    "slow_body_seconds": 2.0,
+    "p_missing_card": 0.0,   # Anteil fehlender Karten in Mehrkarten-Antworten
+    "reject_response_format": False,  # 400 für Requests mit response_format
+    "outage_after": None,    # Ausfall (sofort 503) ab dem n-ten Request ...
+    "outage_seconds": 10.0,  # ... für diese Dauer
+    "token_seconds": 0.0,    # Generierungszeit pro Token (≈ TOKEN_CHARS Zeichen) nach der Latenz
+    "p_trailing_text": 0.0,  # Anteil Antworten mit Nachsatz nach dem JSON
+    "seed": None
+}
+
+# Arten ungültiger Antworten (gleich verteilt); nur "refusal" ist nicht reparierbar
+MALFORMED_KINDS = ("truncated", "prose", "trailing_comma", "smart_quotes", "refusal")
+
+# Zeichen pro Token (Events einer gestreamten Antwort, Generierungszeit)
+TOKEN_CHARS = 4
+
+# Nachsatz mancher Modelle nach dem JSON (--trailing-text)
+TRAILING_TEXT = ("\n\nHinweis: Die Signatur ist handschriftlich ergänzt und nur teilweise "
+                 "lesbar; der Verlag wurde aus dem Stempel übernommen. Bitte die Angaben "
+                 "bei Bedarf am Original prüfen.")
+
+
+def _parse_request(body):
+    try:
+        request = json.loads(body)
+    except ValueError:
+        return {}
+    return request if isinstance(request, dict) else {}
+
+
+def _card_names(request):
+    """Dateinamen eines Mehrkarten-Requests ("Datei: ..."-Textteile), sonst []."""
+    try:
+        content = request["messages"][0]["content"]
+    except (KeyError, IndexError, TypeError):
+        return []
+    return [part["text"][len("Datei: "):] for part in content
+            if part.get("type") == "text" and part.get("text", "").startswith("Datei: ")]
+
+
+def malform(content, kind):
+    """Verdirbt gültiges JSON auf typische Art eines Sprachmodells."""
+    if kind == "truncated":
+        return content[:len(content) // 2]
+    if kind == "prose":
+        return f"Hier sind die extrahierten Daten:\n{content}\nIch hoffe, das hilft!"
+    if kind == "trailing_comma":
+        return content[:-1] + ",\n" + content[-1]
+    if kind == "smart_quotes":
+        return re.sub(r'"([^"]*)"', "“\\1”", content)
+    return "Die Karteikarte ist leider nicht lesbar."
+
+
+def sample_card():
+    """Plausible Extraktion einer Karteikarte."""
+    return {
+        "Komponist": "Bach, Johann Sebastian",
+        "Signatur": f"Spez.{random.randint(1, 40)}.{random.randint(100, 9999)}",
+        "Titel": "Kantate BWV 147",
+        "Textanfang": "Herz und Mund und Tat und Leben",
+        "Verlag": "Breitkopf & Härtel",
+        "Material": "Partitur",
+        "Textdichter": "",
+        "Bearbeiter": "",
+        "Bemerkungen": ""
+    }
+
+
+class MockVLMServer:
+    """Threaded HTTP/1.1-Server (Keep-Alive) mit Zählern pro Antworttyp."""
+
+    def __init__(self, host="127.0.0.1", port=0, **config):
+        self.config = dict(DEFAULT_CONFIG, **config)
+        self._random = random.Random(self.config["seed"])
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "ok": 0, "fenced": 0, "malformed": 0,
+                         "slow_body": 0, "429": 0, "5xx": 0, "bytes_received": 0,
+                         "cards_requested": 0, "cards_missing": 0, "schema_requests": 0,
+                         "schema_rejected": 0, "outage": 0, "aborted": 0, "streamed": 0,
+                         "trailing_text": 0}
+        self._outage_until = None
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def handle(self):
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # Client hat die Verbindung geschlossen (z.B. Stream vorzeitig beendet)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = _parse_request(self.rfile.read(length))
+                server._handle(self, length, _card_names(request), "response_format" in request,
+                               bool(request.get("stream")))
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+    # === ANTWORTEN ===
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.counters[key] += amount
+
+    def _roll(self, key):
+        with self._lock:
+            return self._random.random() < self.config[key]
+
+    def _latency(self):
+        median = self.config["latency_median"]
+        sigma = self.config["latency_sigma"]
+        with self._lock:
+            noise = self._random.gauss(0, 1)
+        return median * math.exp(sigma * noise) if sigma else median
+
+    def _in_outage(self):
+        """True während des simulierten Ausfalls (beginnt mit dem ``outage_after``-ten Request)."""
+        with self._lock:
+            if self._outage_until is None:
+                if (self.config["outage_after"] is None
+                        or self.counters["requests"] < self.config["outage_after"]):
+                    return False
+                self._outage_until = time.monotonic() + self.config["outage_seconds"]
+            return time.monotonic() < self._outage_until
+
+    def _handle(self, handler, length, card_names, structured=False, stream=False):
+        self._count("requests")
+        if self._in_outage():
+            self._count("outage")
+            return self._send(handler, 503, {"error": {"message": "Service unavailable"}})
+        self._count("cards_requested", max(1, len(card_names)))
+        self._count("bytes_received", length)
+        if structured:
+            self._count("schema_requests")
+            if self.config["reject_response_format"]:
+                self._count("schema_rejected")
+                return self._send(handler, 400, {"error": {
+                    "message": "response_format json_schema is not supported for this model"}})
+        time.sleep(self._latency())
+
+        if self._roll("p429"):
+            self._count("429")
+            headers = {}
+            if self.config["retry_after"] is not None:
+                headers["Retry-After"] = str(self.config["retry_after"])
+            return self._send(handler, 429, {"error": {"message": "Rate limit exceeded"}}, headers)
+
+        if self._roll("p5xx"):
+            self._count("5xx")
+            with self._lock:
+                status = self._random.choice([500, 502, 503])
+            return self._send(handler, status, {"error": {"message": "Upstream error"}})
+
+        if card_names:
+            cards = []
+            for name in card_names:
+                if self._roll("p_missing_card"):
+                    self._count("cards_missing")
+                    continue
+                cards.append(dict(sample_card(), Datei=name))
+            content = json.dumps({"karten": cards} if structured else cards, ensure_ascii=False)
+        else:
+            content = json.dumps(sample_card(), ensure_ascii=False)
+        if self._roll("p_malformed"):
+            self._count("malformed")
+            with self._lock:
+                kind = self._random.choice(MALFORMED_KINDS)
+            content = malform(content, kind)
+        elif self._roll("p_fenced"):
+            self._count("fenced")
+            content = f"```json\n{content}\n```"
+        else:
+            self._count("ok")
+        if self._roll("p_trailing_text"):
+            self._count("trailing_text")
+            content += TRAILING_TEXT
+
+        usage = {"prompt_tokens": 1200 + length // 4000, "completion_tokens": 120,
+                 "total_tokens": 1320 + length // 4000}
+        if stream:
+            return self._send_stream(handler, content, usage, slow=self._roll("p_slow_body"))
+        time.sleep(self.config["token_seconds"] * math.ceil(len(content) / TOKEN_CHARS))
+        body = {
+            "id": "mock",
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": usage
+        }
+        self._send(handler, 200, body, slow=self._roll("p_slow_body"))
+
+    def _send(self, handler, status, body, headers=None, slow=False):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            handler.send_header(key, value)
+        handler.end_headers()
+
+        try:
+            if slow:
+                # Body in Stücken mit Pausen (langsamer Upstream / schlechte Verbindung)
+                self._count("slow_body")
+                chunks = 4
+                step = max(1, len(data) // chunks)
+                for start in range(0, len(data), step):
+                    handler.wfile.write(data[start:start + step])
+                    handler.wfile.flush()
+                    time.sleep(self.config["slow_body_seconds"] / chunks)
+            else:
+                handler.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client hat aufgelegt (z.B. abgebrochener Doppel-Request)
+            self._count("aborted")
+
+
+    def _send_stream(self, handler, content, usage, slow=False):
+        """
+        Antwort als Server-Sent Events (chunked): ein Event pro Token im
+        Abstand von ``token_seconds``, danach finish_reason, usage und [DONE].
+        """
+        self._count("streamed")
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+
+        def send_event(data):
+            event = f"data: {data}\n\n".encode("utf-8")
+            handler.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+            handler.wfile.flush()
+
+        def chunk(choices, **extra):
+            return json.dumps(dict({"id": "mock", "object": "chat.completion.chunk",
+                                    "choices": choices}, **extra), ensure_ascii=False)
+
+        tokens = max(1, math.ceil(len(content) / TOKEN_CHARS))
+        pause = self.config["token_seconds"]
+        if slow:
+            # Stockender Stream (langsamer Upstream / schlechte Verbindung)
+            self._count("slow_body")
+            pause += self.config["slow_body_seconds"] / tokens
+        try:
+            for index in range(tokens):
+                delta = {"content": content[index * TOKEN_CHARS:(index + 1) * TOKEN_CHARS]}
+                if index == 0:
+                    delta["role"] = "assistant"
+                send_event(chunk([{"index": 0, "delta": delta, "finish_reason": None}]))
+                if pause:
+                    time.sleep(pause)
+            send_event(chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+            send_event(chunk([], usage=usage))
+            send_event("[DONE]")
+            handler.wfile.write(b"0\r\n\r\n")
+            handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Client hat den Stream geschlossen (z.B. sobald das JSON vollständig war)
+            self._count("aborted")
+
+
+def add_config_arguments(parser):
+    """Gemeinsame Kommandozeilen-Optionen für Server und Benchmark."""
+    parser.add_argument("--latency", type=float, default=DEFAULT_CONFIG["latency_median"],
+                        help="Median der Antwortzeit in Sekunden (Standard: %(default)s)")
+    parser.add_argument("--sigma", type=float, default=DEFAULT_CONFIG["latency_sigma"],
+                        help="Streuung der Log-Normalverteilung, 0 = konstant (Standard: %(default)s)")
+    parser.add_argument("--p429", type=float, default=0.0, help="Anteil 429-Antworten")
+    parser.add_argument("--p5xx", type=float, default=0.0, help="Anteil 5xx-Antworten")
+    parser.add_argument("--retry-after", type=int, default=DEFAULT_CONFIG["retry_after"],
+                        help="Retry-After bei 429 in Sekunden (Standard: %(default)s)")
+    parser.add_argument("--fenced", type=float, default=DEFAULT_CONFIG["p_fenced"],
+                        help="Anteil Antworten mit Markdown-Zaun (Standard: %(default)s)")
+    parser.add_argument("--malformed", type=float, default=0.0, help="Anteil ungültiges JSON")
+    parser.add_argument("--slow-body", type=float, default=0.0, help="Anteil stockend gesendeter Antworten")
+    parser.add_argument("--slow-body-seconds", type=float, default=DEFAULT_CONFIG["slow_body_seconds"],
+                        help="Dauer einer stockenden Antwort (Standard: %(default)s)")
+    parser.add_argument("--missing-card", type=float, default=0.0,
+                        help="Anteil fehlender Karten in Mehrkarten-Antworten")
+    parser.add_argument("--reject-schema", action="store_true",
+                        help="Requests mit response_format (JSON-Schema) mit 400 ablehnen")
+    parser.add_argument("--outage-at", type=int, default=None,
+                        help="Ausfall (sofort 503) ab dem n-ten Request simulieren")
+    parser.add_argument("--outage-seconds", type=float, default=DEFAULT_CONFIG["outage_seconds"],
+                        help="Dauer des Ausfalls in Sekunden (Standard: %(default)s)")
+    parser.add_argument("--token-seconds", type=float, default=DEFAULT_CONFIG["token_seconds"],
+                        help="Generierungszeit pro Token nach der Latenz (Standard: %(default)s)")
+    parser.add_argument("--trailing-text", type=float, default=0.0,
+                        help="Anteil Antworten mit Nachsatz nach dem JSON")
+    parser.add_argument("--seed", type=int, default=None, help="Zufalls-Seed")
+
+
+def config_from_args(args):
+    return {
+        "latency_median": args.latency,
+        "latency_sigma": args.sigma,
+        "p429": args.p429,
+        "p5xx": args.p5xx,
+        "retry_after": args.retry_after,
+        "p_fenced": args.fenced,
+        "p_malformed": args.malformed,
+        "p_slow_body": args.slow_body,
+        "slow_body_seconds": args.slow_body_seconds,
+        "p_missing_card": args.missing_card,
+        "reject_response_format": args.reject_schema,
+        "outage_after": args.outage_at,
+        "outage_seconds": args.outage_seconds,
+        "token_seconds": args.token_seconds,
+        "p_trailing_text": args.trailing_text,
+        "seed": args.seed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock-Server für /chat/completions")
+    parser.add_argument("--port", type=int, default=8099)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockVLMServer(port=args.port, **config_from_args(args)).start()
+    print(f"🧪 Mock-VLM-Server läuft: {server.url}")
+    print("   (Strg+C zum Beenden)")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"   {server.stats()}")
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Parquet-Ausgabe der zusammengeführten Metadaten
+Schreibt die Gesamt-CSV zusätzlich als Parquet-Datensatz, partitioniert
+nach Batch (``<name>.parquet/Batch=batch_001/...``), alle Spalten explizit
+als Strings. Analyse- und Merge-Skripte lesen daraus nur die benötigten
+Spalten, statt die UTF-8-BOM-CSV jedes Mal komplett zu parsen.
+
+Benötigt pyarrow (pip install pyarrow).
+"""
+
+import csv
+import json
+import os
+import shutil
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.dataset as pa_ds
+except ImportError:  # optional, nur für die Parquet-Ausgabe nötig
+    pa = None
+
+PARTITION_COLUMN = "Batch"
+
+
+def available():
+    return pa is not None
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Die Parquet-Ausgabe benötigt pyarrow: pip install pyarrow")
+
+
+def dataset_path_for(csv_path):
+    """metadata_vlm_complete.csv → metadata_vlm_complete.parquet (Verzeichnis)."""
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+
+def _string_schema(columns):
+    return pa.schema([(column, pa.string()) for column in columns])
+
+
+def _partitioning():
+    return pa_ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.string())]), flavor="hive")
+
+
+def _write_table(table, dataset_dir):
+    """Schreibt den Datensatz in ein temporäres Verzeichnis und tauscht es dann aus."""
+    # Spaltenreihenfolge merken (die Partitionsspalte steht sonst beim Lesen hinten)
+    table = table.replace_schema_metadata({"columns": json.dumps(table.column_names)})
+    tmp_dir = dataset_dir + ".tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+
+    pa_ds.write_dataset(table, tmp_dir, format="parquet", partitioning=_partitioning(),
+                        basename_template="part-{i}.parquet")
+
+    if os.path.exists(dataset_dir):
+        shutil.rmtree(dataset_dir)
+    os.replace(tmp_dir, dataset_dir)
+    return table.num_rows
+
+
+def write_from_csv(csv_path, dataset_dir=None):
+    """
+    Konvertiert eine (Gesamt-)CSV in einen Parquet-Datensatz.
+    Leere Zellen werden zu Null (wie beim Einlesen mit pandas).
+    Liefert die Anzahl Zeilen.
+    """
+    _require_pyarrow()
+    dataset_dir = dataset_dir or dataset_path_for(csv_path)
+
+    with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+        columns = next(csv.reader(f), [])
+    if PARTITION_COLUMN not in columns:
+        raise ValueError(f"Spalte '{PARTITION_COLUMN}' fehlt in {csv_path}")
+
+    table = pa_csv.read_csv(
+        csv_path,
+        convert_options=pa_csv.ConvertOptions(
+            column_types={column: pa.string() for column in columns},
+            strings_can_be_null=True
+        ),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True)
+    )
+    return _write_table(table, dataset_dir)
+
+
+def write_dataframe(df, dataset_dir):
+    """Schreibt einen DataFrame (alle Spalten als Strings) als Parquet-Datensatz."""
+    _require_pyarrow()
+    if PARTITION_COLUMN not in df.columns:
+        raise ValueError(f"Spalte '{PARTITION_COLUMN}' fehlt")
+
+    columns = [str(column) for column in df.columns]
+    arrays = [
+        pa.array([None if _is_missing(value) else str(value) for value in df[column]],
+                 type=pa.string())
+        for column in df.columns
+    ]
+    table = pa.Table.from_arrays(arrays, schema=_string_schema(columns))
+    return _write_table(table, dataset_dir)
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def read_dataset(dataset_dir, columns=None, batches=None):
+    """
+    Liest den Datensatz als pandas-DataFrame, nur mit den angegebenen
+    Spalten (Column Projection) und optional nur bestimmten Batches.
+    """
+    _require_pyarrow()
+    dataset = pa_ds.dataset(dataset_dir, format="parquet", partitioning=_partitioning())
+    metadata = dataset.schema.metadata or {}
+    if b"columns" in metadata:
+        order = json.loads(metadata[b"columns"])
+    else:
+        order = dataset.schema.names
+    if columns is None:
+        columns = order
+    columns = [column for column in columns if column in dataset.schema.names]
+    row_filter = pa_ds.field(PARTITION_COLUMN).isin(list(batches)) if batches else None
+    return dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+
+
+def load_metadata(csv_path, columns=None):
+    """
+    Lädt die Metadaten bevorzugt aus dem Parquet-Datensatz neben der CSV
+    (falls vorhanden, aktuell und pyarrow installiert), sonst aus der CSV.
+    Alle Spalten als Strings, leere Zellen als NaN/None.
+    """
+    dataset_dir = csv_path if os.path.isdir(csv_path) else dataset_path_for(csv_path)
+    if pa is not None and os.path.isdir(dataset_dir):
+        stale = (not os.path.isdir(csv_path) and os.path.exists(csv_path)
+                 and os.path.getmtime(csv_path) > os.path.getmtime(dataset_dir))
+        if not stale:
+            return read_dataset(dataset_dir, columns)
+
+    usecols = (lambda column: column in columns) if columns is not None else None
+    return pd.read_csv(csv_path, encoding="utf-8-sig", dtype=str, usecols=usecols)
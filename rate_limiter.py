@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Prozessweiter Rate-Limiter für die VLM-Aufrufe
+Token-Bucket für Requests pro Sekunde und Tokens pro Minute, gemeinsam
+für alle Worker. Wertet Retry-After und X-RateLimit-* Header aus und
+pausiert bei einer Drosselung ALLE Aufrufer gemeinsam, statt dass jeder
+Worker einzeln weiter gegen den Endpoint läuft.
+"""
+
+import asyncio
+import re
+import time
+from email.utils import parsedate_to_datetime
+from threading import Lock
+
+
+def _parse_duration(value):
+    """
+    Wandelt Zeitangaben aus Rate-Limit-Headern in Sekunden um.
+
+    Unterstützt: "12", "1.5", "6m0s", "20ms", "1h2m3s".
+    """
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    total = 0.0
+    matched = False
+    for number, unit in re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value):
+        matched = True
+        number = float(number)
+        total += {"ms": number / 1000, "s": number, "m": number * 60, "h": number * 3600}[unit]
+    return total if matched else None
+
+
+def _parse_reset(value, now):
+    """
+    Interpretiert X-RateLimit-Reset: Unix-Zeit in ms (OpenRouter),
+    Unix-Zeit in s oder verbleibende Sekunden/Dauer. Liefert Sekunden ab jetzt.
+    """
+    seconds = _parse_duration(value)
+    if seconds is None:
+        return None
+    if seconds > 1e12:
+        return seconds / 1000 - now
+    if seconds > 1e9:
+        return seconds - now
+    return seconds
+
+
+def _parse_retry_after(value, now):
+    """Retry-After: Sekunden oder HTTP-Datum."""
+    seconds = _parse_duration(value)
+    if seconds is not None:
+        return seconds
+    try:
+        return parsedate_to_datetime(value).timestamp() - now
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """
+    Token-Bucket-Limiter, thread-sicher und aus asyncio nutzbar.
+
+    ``reserve()`` bucht Kapazität sofort und liefert die nötige Wartezeit;
+    so entsteht auch bei vielen gleichzeitigen Wartenden keine Burst-Welle,
+    wenn eine Pause endet.
+    """
+
+    def __init__(self, requests_per_second=None, tokens_per_minute=None,
+                 default_throttle_pause=2.0, max_pause=300.0, name=None):
+        self.name = name             # Backend-Name für Meldungen (None = alle Worker)
+        self.requests_per_second = requests_per_second
+        self.tokens_per_minute = tokens_per_minute
+        self.default_throttle_pause = default_throttle_pause
+        self.max_pause = max_pause
+
+        self._lock = Lock()
+        now = time.monotonic()
+        self._request_capacity = max(1.0, requests_per_second or 0)
+        self._request_level = self._request_capacity
+        self._token_level = float(tokens_per_minute or 0)
+        self._last_refill = now
+        self._paused_until = 0.0
+
+        self.throttle_events = 0
+        self.paused_seconds = 0.0
+        self.waited_seconds = 0.0
+
+    # === BUCKET ===
+
+    def _refill(self, now):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.requests_per_second:
+            self._request_level = min(self._request_capacity,
+                                      self._request_level + elapsed * self.requests_per_second)
+        if self.tokens_per_minute:
+            self._token_level = min(float(self.tokens_per_minute),
+                                    self._token_level + elapsed * self.tokens_per_minute / 60)
+
+    def reserve(self, tokens=0):
+        """Bucht einen Request (+ geschätzte Tokens); liefert Wartezeit in Sekunden."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, self._paused_until - now)
+
+            if self.requests_per_second:
+                self._request_level -= 1
+                if self._request_level < 0:
+                    wait = max(wait, -self._request_level / self.requests_per_second)
+
+            if self.tokens_per_minute and tokens:
+                self._token_level -= tokens
+                if self._token_level < 0:
+                    wait = max(wait, -self._token_level / (self.tokens_per_minute / 60))
+
+            self.waited_seconds += wait
+            return wait
+
+    def acquire(self, tokens=0):
+        """Blockiert den aufrufenden Thread bis zur Freigabe."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens=0):
+        """Wie acquire(), ohne die Event-Loop zu blockieren."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def record_tokens(self, estimated, usage):
+        """Korrigiert den Token-Bucket um die tatsächlich verbrauchten Tokens."""
+        if not self.tokens_per_minute or not usage:
+            return
+        actual = usage.get("total_tokens") or (
+            usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0))
+        if actual:
+            with self._lock:
+                self._token_level -= actual - estimated
+
+    # === PAUSEN ===
+
+    def pause(self, seconds, reason=""):
+        """Pausiert alle Aufrufer gemeinsam für ``seconds`` Sekunden."""
+        seconds = min(max(seconds, 0.0), self.max_pause)
+        with self._lock:
+            now = time.monotonic()
+            until = now + seconds
+            if until <= self._paused_until:
+                return 0.0
+            self.paused_seconds += until - max(self._paused_until, now)
+            self._paused_until = until
+
+        if reason and self.name:
+            print(f"     ⏸️  Rate-Limit {self.name}: Backend pausiert {seconds:.1f}s ({reason})")
+        elif reason:
+            print(f"     ⏸️  Rate-Limit: alle Worker pausieren {seconds:.1f}s ({reason})")
+        return seconds
+
+    def pause_remaining(self):
+        """Sekunden bis zum Ende der laufenden Pause (0 = keine Pause)."""
+        with self._lock:
+            return max(0.0, self._paused_until - time.monotonic())
+
+    def update_from_headers(self, status_code, headers):
+        """
+        Wertet die Rate-Limit-Header einer Antwort aus.
+
+        - 429 / 503 mit Retry-After: Pause für die angegebene Dauer
+        - 429 ohne Header: Pause für ``default_throttle_pause``
+        - X-RateLimit-Remaining(-Requests/-Tokens) == 0: Pause bis Reset
+        """
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        now = time.time()
+
+        if status_code == 429:
+            self.throttle_events += 1
+
+        retry_after = headers.get("retry-after")
+        if retry_after and status_code in (429, 503):
+            seconds = _parse_retry_after(retry_after, now)
+            if seconds is not None:
+                return self.pause(seconds, f"HTTP {status_code}, Retry-After {retry_after}")
+
+        for suffix in ("", "-requests", "-tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining{suffix}")
+            reset = headers.get(f"x-ratelimit-reset{suffix}")
+            if remaining is None or reset is None:
+                continue
+            try:
+                exhausted = float(remaining) <= 0
+            except ValueError:
+                continue
+            if exhausted:
+                seconds = _parse_reset(reset, now)
+                if seconds is not None and seconds > 0:
+                    return self.pause(seconds, f"X-RateLimit-Remaining{suffix} = 0")
+
+        if status_code == 429:
+            return self.pause(self.default_throttle_pause, "HTTP 429")
+        return 0.0
+
+    def stats(self):
+        return {
+            "throttle_events": self.throttle_events,
+            "paused_seconds": self.paused_seconds,
+            "waited_seconds": self.waited_seconds
+        }
+
+
+def format_rate_limit_stats(stats):
+    """Formatiert die Limiter-Zähler für die Konsolenausgabe."""
+    return (f"{stats['throttle_events']} × HTTP 429 | "
+            f"{stats['paused_seconds']:.0f}s gemeinsame Pause | "
+            f"{stats['waited_seconds']:.0f}s Wartezeit (summiert über Worker)")
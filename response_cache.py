@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Inhaltsadressierter Antwort-Cache für die VLM-Aufrufe
+Schlüssel = Hash aus Bilddaten, Prompt, Modell und Temperatur. Wird dieselbe
+Karte erneut verarbeitet (verlorener Checkpoint, überlappende Retry-Läufe,
+kopierte Ordner), kommt das Ergebnis aus der lokalen SQLite-Datei statt
+erneut vom (kostenpflichtigen) API.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from threading import Lock
+
+
+class ResponseCache:
+    """
+    Persistenter Cache in einer SQLite-Datei mit größenbasierter Verdrängung
+    (am längsten nicht genutzte Einträge zuerst). Thread-sicher.
+    """
+
+    def __init__(self, path, max_mb=500):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024) if max_mb else None
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)")
+        self._conn.commit()
+
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(image_data, prompt, model, temperature):
+        """Hash über alles, was die Antwort bestimmt."""
+        digest = hashlib.sha256()
+        for part in (model, repr(float(temperature)), prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        digest.update(image_data.encode("ascii") if isinstance(image_data, str) else image_data)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Liefert die gespeicherten Daten oder None."""
+        return self.get_any([key])[1]
+
+    def get_any(self, keys):
+        """
+        Erster Treffer unter ``keys`` (z.B. ein Key pro Modell), zählt als
+        ein Zugriff. Liefert (Key, Daten) oder (None, None).
+        """
+        with self._lock:
+            for key in keys:
+                row = self._conn.execute(
+                    "SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    break
+            else:
+                self.misses += 1
+                return None, None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return key, json.loads(row[0])
+
+    def put(self, key, data):
+        """Speichert die extrahierten Daten einer Karte."""
+        response = json.dumps(data, ensure_ascii=False)
+        size = len(response.encode("utf-8"))
+        now = time.time()
+
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?)", (key, response, size, now, now))
+            self._total_bytes += size - (old[0] if old else 0)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Verdrängt die ältesten Einträge, bis der Cache unter 90% der Grenze liegt."""
+        if not self.max_bytes or self._total_bytes <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_used ASC").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            evicted.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups * 100) if lookups else 0.0,
+            "size_mb": self._total_bytes / (1024 * 1024)
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def format_cache_stats(stats):
+    """Formatiert die Cache-Zähler für die Konsolenausgabe."""
+    return (f"{stats['hits']} Treffer / {stats['misses']} Fehlschläge "
+            f"({stats['hit_rate']:.1f}%) | {stats['size_mb']:.1f} MB")
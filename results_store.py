@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+SQLite-Ergebnisspeicher für die OCR-Ergebnisse
+Eine Zeile pro Karte (Felder, Rohantwort, Modell, Dauer, Fehlerstatus)
+statt zehntausender kleiner JSON-Dateien. Geschrieben wird von EINEM
+Writer-Thread mit Gruppen-Commits; CSV und JSON werden daraus exportiert.
+
+Export:
+    python results_store.py export-csv metadata.csv [--batch batch_001]
+    python results_store.py export-json output_batches/json
+"""
+
+import argparse
+import csv
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from batch_csv import csv_columns
+
+# Standardfelder (wie im Hauptskript)
+FIELD_KEYS = [
+    "Komponist", "Signatur", "Titel", "Textanfang",
+    "Verlag", "Material", "Textdichter", "Bearbeiter", "Bemerkungen"
+]
+
+DEFAULT_DB = os.path.join("output_batches", "results.sqlite")
+
+_STOP = object()
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class ResultsStore:
+    """
+    Ergebnisspeicher mit eigenem Writer-Thread.
+
+    ``add_card()`` ist thread-sicher und blockiert nicht: die Zeilen werden
+    in eine Warteschlange gestellt und gebündelt (``group_size`` Zeilen bzw.
+    spätestens alle ``commit_interval`` Sekunden) in einer Transaktion
+    geschrieben.
+    """
+
+    def __init__(self, path=DEFAULT_DB, field_keys=FIELD_KEYS, group_size=200,
+                 commit_interval=1.0):
+        self.path = path
+        self.field_keys = list(field_keys)
+        self.group_size = group_size
+        self.commit_interval = commit_interval
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._queue = queue.Queue()
+        self._error = None
+        self.rows_written = 0
+        self.commits = 0
+
+        self._columns = (["Batch", "Datei"] + self.field_keys +
+                         ["raw_response", "model", "duration", "success", "error", "processed_at"])
+        placeholders = ", ".join("?" for _ in self._columns)
+        self._insert_sql = (f"INSERT OR REPLACE INTO cards "
+                            f"({', '.join(_quote(c) for c in self._columns)}) VALUES ({placeholders})")
+
+        self._create_schema()
+        self._thread = threading.Thread(target=self._writer, name="results-writer", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _create_schema(self):
+        field_columns = "".join(f"{_quote(field)} TEXT, " for field in self.field_keys)
+        with self._connect() as conn:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS cards (
+                    "Batch" TEXT NOT NULL,
+                    "Datei" TEXT NOT NULL,
+                    {field_columns}
+                    raw_response TEXT,
+                    model TEXT,
+                    duration REAL,
+                    success INTEGER NOT NULL,
+                    error TEXT,
+                    processed_at TEXT,
+                    PRIMARY KEY ("Batch", "Datei")
+                )
+            """)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_cards_batch ON cards("Batch")')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_cards_datei ON cards("Datei")')
+            if "Signatur" in self.field_keys:
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_cards_signatur ON cards("Signatur")')
+        conn.close()
+
+    # === SCHREIBEN ===
+
+    def add_card(self, batch_name, filename, data=None, raw_response=None, model=None,
+                 duration=None, error=None, on_commit=None):
+        """
+        Stellt das Ergebnis einer Karte in die Schreib-Warteschlange.
+        ``on_commit`` wird vom Writer-Thread aufgerufen, sobald die Zeile
+        committet ist (z.B. der Checkpoint-Eintrag der Karte).
+        """
+        if self._error is not None:
+            raise RuntimeError(f"Ergebnisspeicher ausgefallen: {self._error}")
+
+        data = data or {}
+        row = ([batch_name, filename] +
+               [_as_text(data.get(field)) for field in self.field_keys] +
+               [raw_response, model, duration, 0 if error else 1, error,
+                datetime.now().isoformat()])
+        self._queue.put((row, on_commit))
+
+    def _writer(self):
+        conn = self._connect()
+        pending = []
+        callbacks = []
+        last_commit = time.time()
+
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.commit_interval)
+                except queue.Empty:
+                    item = None
+
+                stop = item is _STOP
+                barrier = item if isinstance(item, threading.Event) else None
+                if item is not None and not stop and barrier is None:
+                    row, on_commit = item
+                    pending.append(row)
+                    if on_commit is not None:
+                        callbacks.append(on_commit)
+
+                due = (len(pending) >= self.group_size or
+                       time.time() - last_commit >= self.commit_interval)
+                if pending and (due or stop or barrier):
+                    with conn:
+                        conn.executemany(self._insert_sql, pending)
+                    self.rows_written += len(pending)
+                    self.commits += 1
+                    pending = []
+                    last_commit = time.time()
+                    for callback in callbacks:
+                        callback()
+                    callbacks = []
+
+                if barrier is not None:
+                    barrier.set()
+                if stop:
+                    break
+        except Exception as e:
+            self._error = e
+        finally:
+            conn.close()
+            # Wartende flush()-Aufrufe nicht hängen lassen
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def flush(self):
+        """Wartet, bis alle bisher eingestellten Zeilen committet sind."""
+        if self._thread.is_alive():
+            barrier = threading.Event()
+            self._queue.put(barrier)
+            while not barrier.wait(0.5):
+                if not self._thread.is_alive():
+                    break
+        if self._error is not None:
+            raise RuntimeError(f"Ergebnisspeicher ausgefallen: {self._error}")
+
+    def close(self):
+        """Schreibt alle ausstehenden Zeilen und beendet den Writer-Thread."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        if self._error is not None:
+            raise RuntimeError(f"Ergebnisspeicher ausgefallen: {self._error}")
+
+    def stats(self):
+        return {
+            "rows": self.rows_written,
+            "commits": self.commits,
+            "queued": self._queue.qsize()
+        }
+
+    # === LESEN / EXPORT ===
+
+    def iter_rows(self, batch_name=None, only_success=True):
+        """Liefert die Zeilen als Dicts (sortiert nach Batch und Datei)."""
+        return iter_rows(self.path, batch_name, only_success)
+
+    def export_csv(self, csv_path, batch_name=None):
+        """Schreibt alle ausstehenden Zeilen und exportiert sie als CSV."""
+        self.flush()
+        return export_csv(self.path, csv_path, batch_name, self.field_keys)
+
+
+def _as_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def iter_rows(db_path, batch_name=None, only_success=True):
+    """Liest Zeilen aus einer Ergebnisdatenbank."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        conditions = []
+        params = []
+        if batch_name:
+            conditions.append('"Batch" = ?')
+            params.append(batch_name)
+        if only_success:
+            conditions.append("success = 1")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        for row in conn.execute(f'SELECT * FROM cards {where} ORDER BY "Batch", "Datei"', params):
+            yield dict(row)
+    finally:
+        conn.close()
+
+
+def export_csv(db_path, csv_path, batch_name=None, field_keys=FIELD_KEYS):
+    """Exportiert die erfolgreichen Karten als CSV (gleiches Format wie die Batch-CSVs)."""
+    columns = csv_columns(field_keys)
+    count = 0
+    with open(csv_path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for row in iter_rows(db_path, batch_name):
+            writer.writerow([row.get(column, "") for column in columns])
+            count += 1
+    return count
+
+
+def export_json(db_path, json_dir, batch_name=None, field_keys=FIELD_KEYS):
+    """Exportiert die erfolgreichen Karten als JSON-Dateien (ein Ordner pro Batch)."""
+    count = 0
+    created_dirs = set()
+    for row in iter_rows(db_path, batch_name):
+        batch_dir = os.path.join(json_dir, row["Batch"])
+        if batch_dir not in created_dirs:
+            os.makedirs(batch_dir, exist_ok=True)
+            created_dirs.add(batch_dir)
+        data = {field: row.get(field, "") for field in field_keys}
+        data["Datei"] = row["Datei"]
+        data["Batch"] = row["Batch"]
+        stem = os.path.splitext(row["Datei"])[0]
+        with open(os.path.join(batch_dir, f"{stem}.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export aus dem SQLite-Ergebnisspeicher")
+    parser.add_argument("--db", default=DEFAULT_DB, help="Ergebnisdatenbank (Standard: %(default)s)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    csv_parser = subparsers.add_parser("export-csv", help="Als CSV exportieren")
+    csv_parser.add_argument("output")
+    csv_parser.add_argument("--batch", default=None)
+
+    json_parser = subparsers.add_parser("export-json", help="Als JSON-Dateien exportieren")
+    json_parser.add_argument("output")
+    json_parser.add_argument("--batch", default=None)
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"❌ Datenbank nicht gefunden: {args.db}")
+        return
+
+    if args.command == "export-csv":
+        count = export_csv(args.db, args.output, args.batch)
+        print(f"✅ {count:,} Karten exportiert: {args.output}")
+    else:
+        count = export_json(args.db, args.output, args.batch)
+        print(f"✅ {count:,} JSON-Dateien exportiert nach: {args.output}/")
+
+
+if __name__ == "__main__":
+    main()
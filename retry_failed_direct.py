@@ -10,8 +10,11 @@ import os
 import re
 import json
 import base64
-import requests
 import pandas as pd
+import vlm_client
+import rate_limiter
+import response_cache as cache_store
+import retry_policy
 from pathlib import Path
 from datetime import datetime
 import getpass
@@ -25,14 +28,38 @@ OUTPUT_BASE = "output_batches"
 CSV_OUT_BASE = os.path.join(OUTPUT_BASE, "csv")
 JSON_OUT_BASE = os.path.join(OUTPUT_BASE, "json")
 LOG_FILE = os.path.join(OUTPUT_BASE, "vlm_errors.log")
+CACHE_FILE = os.path.join(OUTPUT_BASE, "response_cache.sqlite")
 
 API_BASE_URL = "https://openrouter.ai/api/v1"
 API_ENDPOINT = f"{API_BASE_URL}/chat/completions"
 MODEL_NAME = "qwen/qwen3-vl-8b-instruct"
+TEMPERATURE = 0.1
 
 MAX_WORKERS = 5
 MAX_RETRIES = 3
-RETRY_DELAY = 2
+RETRY_DELAY = 2              # Basis-Wartezeit, verdoppelt pro Versuch (mit Jitter)
+RETRY_MAX_DELAY = 60
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 120
+REQUESTS_PER_SECOND = 10
+CACHE_MAX_MB = 500
+
+# Antwort-Cache (gleiche Datei wie das Hauptskript)
+response_cache = cache_store.ResponseCache(CACHE_FILE, CACHE_MAX_MB)
+
+# Gemeinsamer Rate-Limiter (pausiert bei 429 / Retry-After alle Worker)
+api_rate_limiter = rate_limiter.RateLimiter(
+    requests_per_second=REQUESTS_PER_SECOND,
+    default_throttle_pause=RETRY_DELAY
+)
+
+# Gemeinsamer HTTP-Client (Keep-Alive, Pool so groß wie die Worker-Anzahl)
+api_client = vlm_client.VLMClient(
+    API_ENDPOINT,
+    pool_size=MAX_WORKERS,
+    connect_timeout=CONNECT_TIMEOUT,
+    read_timeout=READ_TIMEOUT
+)
 
 # === EXTRACTION PROMPT ===
 EXTRACTION_PROMPT = """Du bist ein Experte für die Digitalisierung historischer Archivkarteikarten. 
@@ -93,10 +120,11 @@ def call_vlm_api(image_path, api_key, max_retries=MAX_RETRIES):
         try:
             base64_image = encode_image_to_base64(image_path)
             
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}"
-            }
+            # Bereits bezahlte Antworten aus dem Cache (vor jedem Netzwerkzugriff)
+            cache_key = response_cache.make_key(base64_image, EXTRACTION_PROMPT, MODEL_NAME, TEMPERATURE)
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return cached, None
             
             payload = {
                 "model": MODEL_NAME,
@@ -117,11 +145,13 @@ def call_vlm_api(image_path, api_key, max_retries=MAX_RETRIES):
                         ]
                     }
                 ],
-                "temperature": 0.1,
+                "temperature": TEMPERATURE,
                 "max_tokens": 1000
             }
             
-            response = requests.post(API_ENDPOINT, headers=headers, json=payload, timeout=120)
+            api_rate_limiter.acquire()
+            response = api_client.post(payload, api_key)
+            api_rate_limiter.update_from_headers(response.status_code, response.headers)
             
             if response.status_code != 200:
                 error_body = response.text
@@ -130,30 +160,23 @@ def call_vlm_api(image_path, api_key, max_retries=MAX_RETRIES):
                     error_msg = error_json.get("error", {}).get("message", error_body)
                 except:
                     error_msg = error_body
-                raise Exception(f"API-Fehler ({response.status_code}): {error_msg}")
+                raise vlm_client.APIError(f"API-Fehler ({response.status_code}): {error_msg}",
+                                          response.status_code)
             
             result = response.json()
             
-            if "choices" in result and len(result["choices"]) > 0:
-                content = result["choices"][0]["message"]["content"]
-                content = content.strip()
-                if content.startswith("```json"):
-                    content = content[7:]
-                if content.startswith("```"):
-                    content = content[3:]
-                if content.endswith("```"):
-                    content = content[:-3]
-                content = content.strip()
-                
-                data = json.loads(content)
-                return data, None
-            else:
-                raise Exception("Keine 'choices' in API-Antwort")
+            # Fast gültiges JSON (Text drumherum, abgeschnitten, ...) wird repariert
+            data = vlm_client.parse_chat_content(result)
+            response_cache.put(cache_key, data)
+            return data, None
                 
         except Exception as e:
-            if attempt < max_retries - 1:
+            error_class = retry_policy.classify_error(e)
+            if error_class != retry_policy.PERMANENT and attempt < max_retries - 1:
                 print(f"     ⚠️  Versuch {attempt + 1}/{max_retries} fehlgeschlagen, Wiederholung...")
-                time.sleep(RETRY_DELAY * (attempt + 1))
+                # Bei 429 wartet der gemeinsame Rate-Limiter, nicht jeder Worker einzeln
+                if error_class == retry_policy.TRANSIENT:
+                    time.sleep(retry_policy.backoff_delay(attempt, RETRY_DELAY, RETRY_MAX_DELAY))
                 continue
             return None, str(e)
     
@@ -362,6 +385,8 @@ def main():
         print(f"✅ Gesamt verarbeitet: {len(all_records)} Dateien")
         print(f"⏱️  Gesamtdauer: {format_time(total_elapsed)}")
         print(f"⚡ Durchschnitt: {total_elapsed / len(all_records):.2f}s pro Datei")
+        print(f"🔌 Verbindungen: {vlm_client.format_connection_stats(api_client.connection_stats())}")
+        print(f"🗄️  Cache: {cache_store.format_cache_stats(response_cache.stats())}")
         print(f"\n💾 CSV-Dateien befinden sich in: {CSV_OUT_BASE}/")
         print(f"   Benenne RETRY-CSVs zu den ursprünglichen Batch-Namen um")
         print(f"   oder führe die Zusammenführung erneut durch")
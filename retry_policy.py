@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Fehlerklassen, Backoff und verzögerte Wiederholungen
+Nicht jeder Fehler ist eine Wiederholung wert: ein 400 oder 401 wird beim
+nächsten Versuch genauso scheitern. Vorübergehende Fehler (5xx, Timeouts,
+Verbindungsabbrüche, unlesbare Antworten) werden mit exponentiellem
+Backoff plus Jitter wiederholt – aber nicht schlafend im Worker, sondern
+über eine Warteschlange, die der Scheduler leert, sobald die Wartezeit
+einer Karte abgelaufen ist. So laufen gesunde Karten in der Zwischenzeit
+weiter.
+"""
+
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from vlm_client import APIError
+
+# Fehlerklassen
+PERMANENT = "permanent"      # Wiederholung zwecklos (400, 401, 403, Datei fehlt, ...)
+THROTTLED = "throttled"      # 429: sofort erneut, die Pause regelt der Rate-Limiter
+TRANSIENT = "transient"      # 5xx, Timeout, Verbindung, unlesbare Antwort
+
+# HTTP-Status, bei denen ein erneuter Versuch nichts ändert
+PERMANENT_STATUS = {400, 401, 402, 403, 404, 405, 413, 415, 422}
+
+
+def classify_error(error):
+    """Ordnet eine Exception einer Fehlerklasse zu (unbekannte Fehler gelten als vorübergehend)."""
+    if isinstance(error, APIError):
+        if error.status_code == 429:
+            return THROTTLED
+        if error.status_code in PERMANENT_STATUS:
+            return PERMANENT
+        return TRANSIENT
+    if isinstance(error, (FileNotFoundError, PermissionError, IsADirectoryError)):
+        return PERMANENT
+    return TRANSIENT
+
+
+def backoff_delay(attempt, base=2.0, cap=60.0, rng=random):
+    """
+    Wartezeit vor Versuch ``attempt + 1`` (``attempt`` ab 0): exponentiell
+    wachsend, zur Hälfte zufällig ("equal jitter"), damit gleichzeitig
+    gescheiterte Karten nicht wieder gleichzeitig anfragen.
+    """
+    ceiling = min(cap, base * 2 ** attempt)
+    return ceiling / 2 + rng.uniform(0, ceiling / 2)
+
+
+class RetryQueue:
+    """Thread-sichere Warteschlange, deren Elemente erst nach ihrer Wartezeit fällig werden."""
+
+    def __init__(self):
+        self._heap = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+
+    def push(self, item, delay):
+        with self._lock:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._order), item))
+
+    def pop_due(self):
+        """Nächstes fälliges Element oder None."""
+        with self._lock:
+            if self._heap and self._heap[0][0] <= time.monotonic():
+                return heapq.heappop(self._heap)[2]
+        return None
+
+    def seconds_until_due(self):
+        """Sekunden bis zum nächsten fälligen Element (None = leer)."""
+        with self._lock:
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - time.monotonic())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._heap)
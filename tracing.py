@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Stufen-Tracing pro Karte im Chrome-Trace-Event-Format
+Jede Stufe einer Karte (Datei lesen, Base64, Cache, Rate-Limit-Wartezeit,
+Netzwerk, JSON-Bereinigung, JSON schreiben, Fehler-Log inkl. Lock) wird als
+Span erfasst und fortlaufend in eine JSON-Datei geschrieben, die sich in
+Perfetto (https://ui.perfetto.dev) oder chrome://tracing öffnen lässt.
+
+- Thread-Engine: ein Track pro Worker-Thread ("X"-Events)
+- asyncio-Engine: ein Track pro Karte (verschachtelte async-Events "b"/"e"),
+  da sich die Karten einen Thread teilen
+
+Ist kein Tracer aktiv, kosten die Aufrufe praktisch nichts.
+"""
+
+import contextlib
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+
+# Aktiver Karten-Track der asyncio-Engine (None = Thread-Track)
+_current_track = contextvars.ContextVar("trace_track", default=None)
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class Tracer:
+    """Schreibt Trace-Events gepuffert und thread-sicher in eine JSON-Array-Datei."""
+
+    def __init__(self, path, flush_every=2000):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.flush_every = flush_every
+        self.events = 0
+        self._file = open(path, "w", encoding="utf-8")
+        self._file.write("[\n")
+        self._buffer = []
+        self._first = True
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+        self._threads = {}
+        self._track_ids = itertools.count(1)
+        self._emit({"ph": "M", "name": "process_name", "pid": self._pid, "tid": 0,
+                    "args": {"name": "Lippmann-Rau OCR"}})
+
+    def _now(self):
+        """Mikrosekunden seit Start des Tracers."""
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def _tid(self):
+        ident = threading.get_ident()
+        tid = self._threads.get(ident)
+        if tid is None:
+            with self._lock:
+                tid = self._threads.setdefault(ident, len(self._threads) + 1)
+            self._emit({"ph": "M", "name": "thread_name", "pid": self._pid, "tid": tid,
+                        "args": {"name": threading.current_thread().name}})
+        return tid
+
+    def _emit(self, event):
+        line = json.dumps(event, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            if self._file is None:
+                return
+            self._buffer.append(line if self._first else ",\n" + line)
+            self._first = False
+            self.events += 1
+            if len(self._buffer) >= self.flush_every:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        self._file.write("".join(self._buffer))
+        self._buffer = []
+        self._file.flush()
+
+    @contextlib.contextmanager
+    def span(self, name, category="card", **args):
+        """Misst die Dauer des with-Blocks als Span auf dem aktuellen Track."""
+        track = _current_track.get()
+        tid = self._tid()
+        start = self._now()
+        try:
+            yield
+        finally:
+            end = self._now()
+            base = {"name": name, "cat": category, "pid": self._pid, "tid": tid}
+            if track is None:
+                self._emit(dict(base, ph="X", ts=round(start, 1), dur=round(end - start, 1),
+                                args=args))
+            else:
+                self._emit(dict(base, ph="b", id=track, ts=round(start, 1), args=args))
+                self._emit(dict(base, ph="e", id=track, ts=round(end, 1)))
+
+    def instant(self, name, category="card", **args):
+        """Einzelnes Ereignis ohne Dauer (z.B. HTTP 429)."""
+        self._emit({"name": name, "cat": category, "ph": "i", "s": "t", "pid": self._pid,
+                    "tid": self._tid(), "ts": round(self._now(), 1), "args": args})
+
+    def counter(self, name, **values):
+        """Zähler-Track (z.B. laufende Requests)."""
+        self._emit({"name": name, "ph": "C", "pid": self._pid, "tid": 0,
+                    "ts": round(self._now(), 1), "args": values})
+
+    @contextlib.contextmanager
+    def track(self):
+        """Eigener Track für alle Spans innerhalb des Blocks (asyncio-Task pro Karte)."""
+        token = _current_track.set(next(self._track_ids))
+        try:
+            yield
+        finally:
+            _current_track.reset(token)
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._buffer.append("\n]\n")
+            self._flush_locked()
+            self._file.close()
+            self._file = None
+
+
+def span(tracer, name, category="card", **args):
+    """``tracer.span(...)`` oder ein leerer Kontext, wenn kein Tracer aktiv ist."""
+    if tracer is None:
+        return _NULL_SPAN
+    return tracer.span(name, category, **args)
+
+
+def track(tracer):
+    if tracer is None:
+        return _NULL_SPAN
+    return tracer.track()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+asyncio-Engine für die VLM-Aufrufe
+Alternative zum ThreadPoolExecutor: viele gleichzeitige Requests (50-200)
+aus einem Prozess, ohne pro Request einen OS-Thread zu blockieren.
+
+Benötigt aiohttp (pip install aiohttp).
+"""
+
+import asyncio
+import json
+import queue
+import threading
+import time
+
+try:
+    import aiohttp
+except ImportError:  # optional, nur für --engine async nötig
+    aiohttp = None
+
+import vlm_stream
+from vlm_client import CONNECT_TIMEOUT, READ_TIMEOUT, request_headers
+
+_DONE = object()
+
+
+class AsyncVLMClient:
+    """
+    Asynchroner HTTP-Client mit Keep-Alive-Pool (aiohttp).
+
+    Muss innerhalb der laufenden Event-Loop erstellt werden.
+    """
+
+    def __init__(self, endpoint, concurrency=50, connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT):
+        if aiohttp is None:
+            raise RuntimeError("Die async-Engine benötigt aiohttp: pip install aiohttp")
+
+        self.endpoint = endpoint
+        self._request_count = 0
+        self._request_time = 0.0
+        self._new_connections = 0
+        self._reused_connections = 0
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(self._on_connection_create)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuse)
+
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=concurrency),
+            timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout),
+            trace_configs=[trace_config]
+        )
+
+    async def _on_connection_create(self, session, ctx, params):
+        self._new_connections += 1
+
+    async def _on_connection_reuse(self, session, ctx, params):
+        self._reused_connections += 1
+
+    async def post(self, payload, api_key, endpoint=None):
+        """Sendet einen Chat-Completion-Request; liefert (status_code, body, headers)."""
+        start = time.time()
+        try:
+            async with self._session.post(endpoint or self.endpoint,
+                                          headers=request_headers(api_key),
+                                          json=payload) as response:
+                return response.status, await response.text(), dict(response.headers)
+        finally:
+            self._request_count += 1
+            self._request_time += time.time() - start
+
+    async def post_stream(self, payload, api_key, endpoint=None, early_close=True):
+        """
+        Wie VLMClient.post_stream(); liefert (status_code, body, headers, timing),
+        ``timing`` = None, wenn der Endpoint nicht gestreamt hat.
+        """
+        start = time.time()
+        try:
+            async with self._session.post(endpoint or self.endpoint,
+                                          headers=request_headers(api_key),
+                                          json=vlm_stream.stream_payload(payload)) as response:
+                headers = dict(response.headers)
+                if response.status != 200 or not vlm_stream.is_event_stream(headers):
+                    return response.status, await response.text(), headers, None
+
+                accumulator = vlm_stream.StreamAccumulator(start, early_close)
+                async for chunk in response.content.iter_any():
+                    if accumulator.feed(chunk) and accumulator.early_closed:
+                        response.close()
+                        break
+                accumulator.finish()
+                body = json.dumps(accumulator.result(), ensure_ascii=False)
+                return accumulator.status_code(), body, headers, accumulator.timing()
+        finally:
+            self._request_count += 1
+            self._request_time += time.time() - start
+
+    def connection_stats(self):
+        """Verbindungszähler im gleichen Format wie VLMClient.connection_stats()."""
+        requests_sent = self._request_count
+        return {
+            "requests": requests_sent,
+            "new_connections": self._new_connections,
+            "reused_connections": self._reused_connections,
+            "avg_request_time": (self._request_time / requests_sent) if requests_sent else 0.0
+        }
+
+    async def close(self):
+        await self._session.close()
+
+
+class AsyncCardRunner:
+    """
+    Führt einen async Worker für alle Elemente mit ``concurrency`` Tasks aus.
+
+    Die Tasks ziehen die Elemente nacheinander aus einer gemeinsamen
+    Warteschlange, sodass auch zehntausende Karten nur ``concurrency``
+    Coroutinen gleichzeitig erzeugen. Die Event-Loop läuft in einem
+    Hintergrund-Thread; der Aufrufer iteriert synchron über die Ergebnisse
+    in Fertigstellungsreihenfolge, genau wie bei ``as_completed`` in der
+    Thread-Engine.
+
+    Mit ``batched=True`` liefert der Worker pro Element eine Liste von
+    Ergebnissen (z.B. mehrere Karten pro Request), die einzeln ausgegeben werden.
+
+    ``defer(result)`` kann für ein Ergebnis (Element, Wartezeit) liefern:
+    das Element wird dann nach der Wartezeit erneut bearbeitet (mit Vorrang
+    vor neuen Elementen), statt das Ergebnis auszugeben. Währenddessen
+    bearbeiten die Tasks andere Elemente.
+    """
+
+    def __init__(self, items, worker, endpoint, concurrency=50,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, batched=False,
+                 defer=None):
+        self.items = list(items)
+        self.worker = worker
+        self.batched = batched
+        self.defer = defer
+        self.endpoint = endpoint
+        self.concurrency = concurrency
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+        self._results = queue.Queue()
+        self._client = None
+
+    async def _run_all(self):
+        client = AsyncVLMClient(self.endpoint, self.concurrency,
+                                self.connect_timeout, self.read_timeout)
+        self._client = client
+        loop = asyncio.get_running_loop()
+        pending = iter(self.items)
+        workers = min(self.concurrency, len(self.items)) or 1
+        # Fällige Wiederholungen; _DONE beendet einen Task
+        ready = asyncio.Queue()
+        # Laufende Elemente + geplante Wiederholungen (0 und keine neuen = fertig)
+        state = {"outstanding": 0, "exhausted": False}
+
+        def release_if_finished():
+            if state["exhausted"] and state["outstanding"] == 0:
+                for _ in range(workers):
+                    ready.put_nowait(_DONE)
+
+        async def next_item():
+            if not ready.empty():
+                return ready.get_nowait()
+            if not state["exhausted"]:
+                item = next(pending, _DONE)
+                if item is not _DONE:
+                    state["outstanding"] += 1
+                    return item
+                state["exhausted"] = True
+                release_if_finished()
+            return await ready.get()
+
+        def publish(entry):
+            retry = self.defer(entry) if self.defer is not None else None
+            if retry is None:
+                self._results.put(entry)
+                return
+            item, delay = retry
+            state["outstanding"] += 1
+            loop.call_later(delay, ready.put_nowait, item)
+
+        async def run_worker():
+            while True:
+                item = await next_item()
+                if item is _DONE:
+                    return
+                try:
+                    result = await self.worker(client, item)
+                except Exception as e:
+                    self._results.put(e)
+                else:
+                    for entry in (result if self.batched else [result]):
+                        publish(entry)
+                state["outstanding"] -= 1
+                release_if_finished()
+
+        try:
+            await asyncio.gather(*(run_worker() for _ in range(workers)))
+        finally:
+            await client.close()
+
+    def _thread_main(self):
+        try:
+            asyncio.run(self._run_all())
+        except BaseException as e:
+            self._results.put(e)
+        finally:
+            self._results.put(_DONE)
+
+    def __iter__(self):
+        thread = threading.Thread(target=self._thread_main, daemon=True)
+        thread.start()
+
+        while True:
+            result = self._results.get()
+            if result is _DONE:
+                break
+            if isinstance(result, BaseException):
+                raise result
+            yield result
+
+        thread.join()
+
+    def connection_stats(self):
+        """Verbindungszähler des laufenden bzw. zuletzt beendeten Laufs."""
+        if self._client is not None:
+            return self._client.connection_stats()
+        return {
+            "requests": 0, "new_connections": 0,
+            "reused_connections": 0, "avg_request_time": 0.0
+        }
+
+
+def iter_completed(items, worker, endpoint, concurrency=50,
+                   connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, batched=False,
+                   defer=None):
+    """
+    Verarbeitet ``items`` mit dem Coroutine-Worker ``worker(client, item)``.
+
+    Liefert einen ``AsyncCardRunner``, über den synchron iteriert werden kann.
+    """
+    return AsyncCardRunner(items, worker, endpoint, concurrency, connect_timeout, read_timeout,
+                           batched, defer)
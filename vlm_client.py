@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Gemeinsame HTTP-Client-Schicht für die VLM-Aufrufe
+Hält Verbindungen per Keep-Alive offen, damit nicht jede Karteikarte
+einen eigenen TCP-Verbindungsaufbau und TLS-Handshake bezahlt.
+"""
+
+import json
+import time
+from threading import Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import vlm_stream
+from json_salvage import salvage_json
+
+# Standard-Timeouts (Sekunden)
+CONNECT_TIMEOUT = 10         # Verbindungsaufbau inkl. TLS-Handshake
+READ_TIMEOUT = 120           # Warten auf die Modell-Antwort
+
+
+# === REQUEST / RESPONSE ===
+
+class APIError(Exception):
+    """Fehlerhafte HTTP-Antwort des VLM-Endpoints (mit Statuscode)."""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def build_chat_payload(model, prompt, base64_image, temperature=0.1, max_tokens=1000,
+                       response_format=None):
+    """Baut den Chat-Completion-Payload für eine Karteikarte."""
+    payload = {
+        "model": model,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prompt
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{base64_image}"
+                        }
+                    }
+                ]
+            }
+        ],
+        "temperature": temperature,
+        "max_tokens": max_tokens
+    }
+    if response_format is not None:
+        payload["response_format"] = response_format
+    return payload
+
+
+def build_multi_card_payload(model, prompt, images, temperature=0.1, max_tokens=1000,
+                             response_format=None):
+    """
+    Payload für mehrere Karten in EINER Nachricht: der Prompt einmal,
+    danach pro Karte ihr Dateiname und das Bild. ``images`` sind Paare
+    (Dateiname, base64_jpeg).
+    """
+    content = [{"type": "text", "text": prompt}]
+    for filename, base64_image in images:
+        content.append({"type": "text", "text": f"Datei: {filename}"})
+        content.append({"type": "image_url",
+                        "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}})
+    payload = {
+        "model": model,
+        "messages": [{"role": "user", "content": content}],
+        "temperature": temperature,
+        "max_tokens": max_tokens
+    }
+    if response_format is not None:
+        payload["response_format"] = response_format
+    return payload
+
+
+def build_response_format(field_keys, multi_card=False):
+    """
+    ``response_format`` mit JSON-Schema (strict) aus den Feldnamen: ein
+    Objekt mit allen Feldern als Strings, bei Mehrkarten-Requests ein
+    Objekt ``{"karten": [...]}`` mit zusätzlichem Feld "Datei" pro Karte
+    (das Schema muss ein Objekt sein).
+    """
+    keys = (["Datei"] if multi_card else []) + list(field_keys)
+    card = {
+        "type": "object",
+        "properties": {key: {"type": "string"} for key in keys},
+        "required": keys,
+        "additionalProperties": False
+    }
+    schema = card
+    if multi_card:
+        schema = {
+            "type": "object",
+            "properties": {"karten": {"type": "array", "items": card}},
+            "required": ["karten"],
+            "additionalProperties": False
+        }
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "karteikarten" if multi_card else "karteikarte",
+            "strict": True,
+            "schema": schema
+        }
+    }
+
+
+def rejects_response_format(error):
+    """True, wenn der Endpoint den Request wegen ``response_format`` abgelehnt hat."""
+    if not isinstance(error, APIError) or error.status_code not in (400, 422):
+        return False
+    message = str(error).lower()
+    return any(word in message for word in ("response_format", "json_schema", "structured output"))
+
+
+def request_headers(api_key):
+    """HTTP-Header eines Chat-Completion-Requests."""
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+
+
+def raise_for_api_error(status_code, error_body):
+    """Wirft eine verständliche Exception für fehlerhafte HTTP-Antworten."""
+    if status_code == 200:
+        return
+
+    try:
+        error_msg = json.loads(error_body).get("error", {}).get("message", error_body)
+    except (ValueError, AttributeError):
+        error_msg = error_body
+
+    if status_code == 401:
+        raise APIError(f"API-Authentifizierung fehlgeschlagen: {error_msg}", status_code)
+    elif status_code == 429:
+        raise APIError(f"Rate limit erreicht: {error_msg}", status_code)
+    elif status_code == 400:
+        raise APIError(f"Falscher Request: {error_msg}", status_code)
+    else:
+        raise APIError(f"API-Fehler ({status_code}): {error_msg}", status_code)
+
+
+def chat_content(result):
+    """Roher Antworttext des Modells (oder None)."""
+    if "choices" in result and len(result["choices"]) > 0:
+        return result["choices"][0]["message"]["content"]
+    return None
+
+
+def strip_code_fence(content):
+    """Entfernt Markdown-Codeblöcke (```json ... ```) um die Antwort."""
+    content = content.strip()
+    if content.startswith("```json"):
+        content = content[7:]
+    if content.startswith("```"):
+        content = content[3:]
+    if content.endswith("```"):
+        content = content[:-3]
+    return content.strip()
+
+
+def load_content(content, repairs=None, keep_partial=True):
+    """
+    JSON aus dem Antworttext; misslingt das, repariert json_salvage typische
+    Fehler, bevor eine Wiederholung nötig wird. Angewandte Reparaturen
+    werden an ``repairs`` angehängt.
+    """
+    try:
+        return json.loads(strip_code_fence(content))
+    except json.JSONDecodeError:
+        data, applied = salvage_json(content, keep_partial)
+        if repairs is not None:
+            repairs.extend(applied)
+        return data
+
+
+def parse_chat_content(result, repairs=None):
+    """Extrahiert das JSON-Objekt aus der Modell-Antwort (bereinigt Markdown, repariert JSON)."""
+    content = chat_content(result)
+    if content is not None:
+        return load_content(content, repairs)
+
+    raise Exception("Keine 'choices' in API-Antwort erhalten")
+
+
+def parse_multi_card_content(result, filenames, repairs=None):
+    """
+    Liest die Antwort auf einen Mehrkarten-Request: ein JSON-Array mit
+    einem Objekt pro Karte (Feld "Datei") oder ein Objekt mit den
+    Dateinamen als Schlüsseln.
+
+    Liefert {Dateiname: Felder} – nur für gesendete Dateinamen, jeweils der
+    erste Eintrag. Fehlende Karten fehlen im Ergebnis; die Karte, bei der
+    eine abgeschnittene Antwort endet, ebenfalls.
+    """
+    content = chat_content(result)
+    if content is None:
+        raise Exception("Keine 'choices' in API-Antwort erhalten")
+
+    parsed = load_content(content, repairs, keep_partial=False)
+    expected = set(filenames)
+    if isinstance(parsed, dict):
+        if expected & set(parsed):
+            entries = [dict(fields, Datei=name) for name, fields in parsed.items()
+                       if isinstance(fields, dict)]
+        else:
+            # z.B. {"karten": [...]}
+            entries = next((value for value in parsed.values() if isinstance(value, list)), [])
+    else:
+        entries = parsed
+
+    cards = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        name = str(entry.get("Datei", "")).strip()
+        if name in expected and name not in cards:
+            cards[name] = {key: value for key, value in entry.items() if key != "Datei"}
+    return cards
+
+
+# === CLIENT ===
+
+class VLMClient:
+    """
+    Thread-sicherer HTTP-Client mit Connection-Pool für einen VLM-Endpoint.
+
+    Alle Worker teilen sich eine ``requests.Session``; der Pool wird auf die
+    Anzahl paralleler Worker dimensioniert, sodass jeder Worker seine
+    Verbindung wiederverwenden kann. Mit ``hosts`` > 1 hält die Session
+    einen solchen Pool pro Host (mehrere Backends, siehe ``post(endpoint=...)``).
+    """
+
+    def __init__(self, endpoint, pool_size=5, connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT, hosts=1):
+        self.endpoint = endpoint
+        self.pool_size = pool_size
+        self.hosts = hosts
+        self.timeout = (connect_timeout, read_timeout)
+
+        self._session = None
+        self._session_lock = Lock()
+        self._stats_lock = Lock()
+        self._request_count = 0
+        self._request_time = 0.0
+
+    def _get_session(self):
+        """Erstellt die gemeinsame Session beim ersten Zugriff."""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=self.hosts,
+                        pool_maxsize=self.pool_size,
+                        pool_block=True,
+                        max_retries=0
+                    )
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+        return self._session
+
+    def post(self, payload, api_key, endpoint=None):
+        """Sendet einen Chat-Completion-Request über die gemeinsame Session."""
+        session = self._get_session()
+        start = time.time()
+        try:
+            return session.post(endpoint or self.endpoint, headers=request_headers(api_key),
+                                json=payload, timeout=self.timeout)
+        finally:
+            self._count_request(start)
+
+    def post_stream(self, payload, api_key, endpoint=None, early_close=True):
+        """
+        Wie post(), aber mit ``stream: true``: die Events werden beim Empfang
+        gelesen (siehe vlm_stream). Liefert eine StreamedResponse mit
+        ``timing``; Fehlerantworten und Endpoints, die nicht streamen, kommen
+        als gewöhnliche Response zurück.
+
+        Mit ``early_close`` endet der Request, sobald das JSON-Objekt
+        vollständig ist. Die Verbindung wird dann geschlossen statt
+        wiederverwendet, und der usage-Block am Ende des Streams fehlt.
+        """
+        session = self._get_session()
+        start = time.time()
+        try:
+            response = session.post(endpoint or self.endpoint, headers=request_headers(api_key),
+                                    json=vlm_stream.stream_payload(payload),
+                                    timeout=self.timeout, stream=True)
+            if response.status_code != 200 or not vlm_stream.is_event_stream(response.headers):
+                response.content  # ganzen Body lesen, gibt die Verbindung frei
+                return response
+
+            accumulator = vlm_stream.StreamAccumulator(start, early_close)
+            with response:  # vorzeitig beendet: Verbindung schließen
+                for chunk in response.iter_content(chunk_size=None):
+                    if accumulator.feed(chunk) and accumulator.early_closed:
+                        break
+            accumulator.finish()
+            return vlm_stream.StreamedResponse(accumulator.status_code(), response.headers,
+                                               accumulator.result(), accumulator.timing())
+        finally:
+            self._count_request(start)
+
+    def _count_request(self, start):
+        with self._stats_lock:
+            self._request_count += 1
+            self._request_time += time.time() - start
+
+    def connection_stats(self):
+        """
+        Liefert Zähler zur Verbindungswiederverwendung.
+
+        ``new_connections`` zählt die geöffneten TCP/TLS-Verbindungen,
+        ``reused_connections`` die Requests, die eine bestehende Verbindung
+        nutzen konnten.
+        """
+        new_connections = 0
+        pool_requests = 0
+
+        if self._session is not None:
+            for adapter in set(self._session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is None:
+                        continue
+                    new_connections += pool.num_connections
+                    pool_requests += pool.num_requests
+
+        with self._stats_lock:
+            requests_sent = self._request_count
+            avg_request_time = (self._request_time / requests_sent) if requests_sent else 0.0
+
+        return {
+            "requests": requests_sent,
+            "new_connections": new_connections,
+            "reused_connections": max(pool_requests - new_connections, 0),
+            "avg_request_time": avg_request_time
+        }
+
+    def close(self):
+        """Schließt alle offenen Verbindungen."""
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+def format_connection_stats(stats):
+    """Formatiert die Verbindungszähler für die Konsolenausgabe."""
+    total = stats["requests"]
+    reuse_rate = (stats["reused_connections"] / total * 100) if total else 0.0
+    return (f"{total} Requests | {stats['new_connections']} neue Verbindungen | "
+            f"{stats['reused_connections']} wiederverwendet ({reuse_rate:.1f}%) | "
+            f"Ø {stats['avg_request_time']:.2f}s pro Request")
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Gestreamte Chat-Completions (``stream: true``, Server-Sent Events)
+Statt auf den ganzen Body zu warten, werden die Events gelesen, sobald sie
+ankommen. Das trennt die Zeit bis zum ersten Token (Warteschlange und
+Prefill beim Anbieter) von der eigentlichen Generierung, und der Stream
+kann geschlossen werden, sobald das JSON-Objekt der Antwort vollständig
+ist – Nachsätze des Modells ("Ich hoffe, das hilft!") oder der schließende
+Markdown-Zaun werden nicht mehr abgewartet.
+
+Das Ergebnis wird zu einer gewöhnlichen Chat-Completion zusammengesetzt,
+sodass die Auswertung der Antwort unverändert bleibt.
+"""
+
+import json
+import time
+from collections import deque
+from threading import Lock
+
+from adaptive_concurrency import percentile
+
+DONE_MARKER = "[DONE]"
+
+
+def stream_payload(payload):
+    """Payload mit ``stream: true``; ``include_usage`` liefert den usage-Block am Ende."""
+    return dict(payload, stream=True, stream_options={"include_usage": True})
+
+
+def is_event_stream(headers):
+    """True, wenn die Antwort ein Event-Stream ist (``headers``: beliebige Schreibweise)."""
+    return any(key.lower() == "content-type" and "text/event-stream" in value.lower()
+               for key, value in headers.items())
+
+
+class SSEDecoder:
+    """Zerlegt den Byte-Strom in die ``data``-Felder der Events (Zeilen bis zur Leerzeile)."""
+
+    def __init__(self):
+        self._buffer = b""
+        self._data = []
+
+    def feed(self, chunk):
+        """Liefert die Daten aller Events, die mit ``chunk`` vollständig wurden."""
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split(b"\n")
+        events = []
+        for raw in lines:
+            line = raw.rstrip(b"\r").decode("utf-8", errors="replace")
+            if not line:
+                if self._data:
+                    events.append("\n".join(self._data))
+                    self._data = []
+            elif line.startswith("data:"):
+                value = line[5:]
+                self._data.append(value[1:] if value.startswith(" ") else value)
+            # Kommentare (": ...") sowie event:/id:/retry: werden nicht gebraucht
+        return events
+
+
+class JSONCompletionScanner:
+    """
+    Erkennt, wann das erste JSON-Objekt (bzw. -Array) im Text vollständig
+    ist: Klammern werden außerhalb von Strings gezählt, Text davor (Prosa,
+    Markdown-Zaun) wird übersprungen. ``end`` ist dann die Position nach
+    der schließenden Klammer im zuletzt übergebenen Text.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.complete = False
+        self.end = None
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text):
+        """True, sobald die äußerste Klammer geschlossen wurde."""
+        for index, char in enumerate(text):
+            if self.complete:
+                break
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char in "{[":
+                self.started = True
+                self.depth += 1
+            elif not self.started:
+                continue
+            elif char == '"':
+                self._in_string = True
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.complete = True
+                    self.end = index + 1
+        return self.complete
+
+
+class StreamAccumulator:
+    """
+    Setzt die Deltas eines Streams zur Chat-Completion zusammen und misst
+    die Zeit bis zum ersten Token. ``early_close``: fertig, sobald das
+    JSON-Objekt vollständig ist (sonst erst bei ``[DONE]``).
+    """
+
+    def __init__(self, start=None, early_close=True):
+        self.start = start if start is not None else time.time()
+        self.early_close = early_close
+        self.first_token_at = None
+        self.finished_at = None
+        self.early_closed = False
+        self.error = None
+
+        self._decoder = SSEDecoder()
+        self._scanner = JSONCompletionScanner()
+        self._parts = []
+        self._finish_reason = None
+        self._usage = None
+        self._meta = {}
+        self._done = False
+
+    def feed(self, chunk):
+        """Verarbeitet empfangene Bytes; True = Stream kann geschlossen werden."""
+        for data in self._decoder.feed(chunk):
+            self._handle(data)
+            if self._done:
+                break
+        if self._done and self.finished_at is None:
+            self.finished_at = time.time()
+        return self._done
+
+    def _handle(self, data):
+        if data.strip() == DONE_MARKER:
+            self._done = True
+            return
+        try:
+            event = json.loads(data)
+        except ValueError:
+            return
+        if not isinstance(event, dict):
+            return
+        if event.get("error"):
+            # Fehler mitten im Stream (z.B. OpenRouter bei Abbruch des Anbieters)
+            self.error = event["error"]
+            self._done = True
+            return
+        for key in ("id", "model", "created"):
+            if key in event:
+                self._meta.setdefault(key, event[key])
+        if event.get("usage"):
+            self._usage = event["usage"]
+        for choice in event.get("choices") or []:
+            if choice.get("index", 0) != 0:
+                continue
+            if choice.get("finish_reason"):
+                self._finish_reason = choice["finish_reason"]
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                if self.first_token_at is None:
+                    self.first_token_at = time.time()
+                if self._scanner.feed(content) and self.early_close:
+                    # Rest des Deltas (Zaun, Nachsatz) gehört nicht mehr zur Antwort
+                    content = content[:self._scanner.end]
+                    self.early_closed = True
+                    self._done = True
+                self._parts.append(content)
+
+    def finish(self):
+        """Ende des Streams (Verbindung geschlossen oder ``[DONE]``)."""
+        if self.finished_at is None:
+            self.finished_at = time.time()
+
+    @property
+    def content(self):
+        return "".join(self._parts)
+
+    def status_code(self):
+        """HTTP-Status der zusammengesetzten Antwort (Fehler im Stream → dessen Code bzw. 502)."""
+        if self.error is None:
+            return 200
+        code = self.error.get("code") if isinstance(self.error, dict) else None
+        return code if isinstance(code, int) and code >= 400 else 502
+
+    def result(self):
+        """Die Antwort im Format einer gewöhnlichen (nicht gestreamten) Chat-Completion."""
+        if self.error is not None:
+            return {"error": self.error}
+        result = dict(self._meta, object="chat.completion", choices=[{
+            "index": 0,
+            "message": {"role": "assistant", "content": self.content},
+            "finish_reason": self._finish_reason or ("stop" if self.early_closed else None)
+        }])
+        if self._usage is not None:
+            result["usage"] = self._usage
+        return result
+
+    def timing(self):
+        """Zeit bis zum ersten Token, Generierungsdauer und Gesamtdauer (Sekunden)."""
+        finished = self.finished_at if self.finished_at is not None else time.time()
+        first = self.first_token_at
+        return {
+            "first_token": first - self.start if first is not None else None,
+            "generation": finished - first if first is not None else None,
+            "total": finished - self.start,
+            "early_closed": self.early_closed
+        }
+
+
+class StreamedResponse:
+    """Zusammengesetzte Streaming-Antwort mit der Schnittstelle einer requests.Response."""
+
+    def __init__(self, status_code, headers, result, timing=None):
+        self.status_code = status_code
+        self.headers = headers
+        self._result = result
+        self.timing = timing
+
+    @property
+    def text(self):
+        return json.dumps(self._result, ensure_ascii=False)
+
+    def json(self):
+        return self._result
+
+
+class StreamStats:
+    """Zeiten aller gestreamten Antworten eines Laufs, thread-sicher."""
+
+    def __init__(self, window=1000):
+        self._lock = Lock()
+        self._first_token = deque(maxlen=window)
+        self._generation = deque(maxlen=window)
+        self.streams = 0
+        self.early_closed = 0
+        self.first_token_total = 0.0
+        self.generation_total = 0.0
+
+    def observe(self, timing):
+        if timing["first_token"] is None:
+            return
+        with self._lock:
+            self.streams += 1
+            self.early_closed += timing["early_closed"]
+            self.first_token_total += timing["first_token"]
+            self.generation_total += timing["generation"]
+            self._first_token.append(timing["first_token"])
+            self._generation.append(timing["generation"])
+
+    def stats(self):
+        with self._lock:
+            streams = self.streams
+            return {
+                "streams": streams,
+                "early_closed": self.early_closed,
+                "first_token_avg": self.first_token_total / streams if streams else None,
+                "first_token_p95": percentile(self._first_token, 95),
+                "generation_avg": self.generation_total / streams if streams else None,
+                "generation_p95": percentile(self._generation, 95)
+            }
+
+
+def format_stream_stats(stats):
+    """Zeile für die Statistik."""
+    def seconds(value):
+        return "–" if value is None else f"{value:.2f}s"
+
+    return (f"{stats['streams']} Streams | erstes Token Ø {seconds(stats['first_token_avg'])} "
+            f"(p95 {seconds(stats['first_token_p95'])}) | Generierung Ø "
+            f"{seconds(stats['generation_avg'])} (p95 {seconds(stats['generation_p95'])}) | "
+            f"{stats['early_closed']} nach vollständigem JSON vorzeitig geschlossen")